@@ -0,0 +1,317 @@
+"""
+Import the gamedata without starting the API server.
+
+    python -m app.cli db redis svt-extra exports
+
+Run it before starting the API with WRITE_POSTGRES_DATA and WRITE_REDIS_DATA
+set to False so the API workers don't load the data at start.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from aioredis import Redis
+from fastapi.concurrency import run_in_threadpool
+from pydantic import DirectoryPath
+
+from export.niceexport import get_constant_export_jobs
+
+from .config import SecretSettings, Settings, logger
+from .data.diff import RegionChangedFiles
+from .db.engine import engines, get_async_engines
+from .db.generation import PublishRun, rollback_db_generation
+from .db.load import get_db_jobs, load_rayshift_data
+from .redis.load import get_redis_jobs
+from .schemas.common import Region
+from .tasks import (
+    REGION_PATHS,
+    export_data_version,
+    export_path,
+    finish_data_import,
+    get_data_version,
+    get_master_changed_files,
+    import_lock,
+    run_import_jobs,
+    wait_background_tasks,
+)
+
+
+settings = Settings()
+secrets = SecretSettings()
+
+
+EXIT_SUCCESS = 0
+EXIT_STAGE_FAILED = 1
+EXIT_USAGE_ERROR = 2
+
+DATA_STAGES = ["db", "redis", "svt-extra"]
+STAGES = [*DATA_STAGES, "constants", "exports", "rayshift"]
+DEFAULT_STAGES = [*DATA_STAGES, "exports"]
+
+
+@dataclass
+class StageResult:
+    name: str
+    run_time: float
+    error: Optional[BaseException] = None
+
+
+class ImportCommand:
+    def __init__(
+        self,
+        redis: Redis,
+        region_path: dict[Region, DirectoryPath],
+        changed_files: Optional[RegionChangedFiles],
+        workers: int,
+    ):
+        self.redis = redis
+        self.region_path = region_path
+        self.changed_files = changed_files
+        self.workers = workers
+        # The db and svt-extra stages are published as one generation
+        self.publish_run = PublishRun()
+
+    async def load_db(self) -> None:
+        await run_import_jobs(
+            get_db_jobs(
+                self.region_path,
+                self.changed_files,
+                load_svt_extra=False,
+                publish_run=self.publish_run,
+            ),
+            self.workers,
+        )
+
+    async def load_redis(self) -> None:
+        await run_import_jobs(
+            get_redis_jobs(
+                self.redis, self.region_path, self.changed_files, load_svt_extra=False
+            ),
+            self.workers,
+        )
+
+    async def load_svt_extra(self) -> None:
+        await run_import_jobs(
+            get_db_jobs(
+                self.region_path,
+                self.changed_files,
+                load_master=False,
+                publish_run=self.publish_run,
+            )
+            + get_redis_jobs(
+                self.redis, self.region_path, self.changed_files, load_master=False
+            ),
+            self.workers,
+        )
+
+    async def export_constants(self) -> None:
+        await run_import_jobs(
+            [
+                job
+                for region, gamedata in self.region_path.items()
+                for job in get_constant_export_jobs(region, gamedata, export_path)
+            ],
+            self.workers,
+        )
+
+    async def load_rayshift(self) -> None:
+        for region in self.region_path:
+            await run_in_threadpool(load_rayshift_data, region)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.cli",
+        description="Import the gamedata into PostgreSQL and Redis "
+        "and generate the export files.",
+    )
+    parser.add_argument(
+        "stages",
+        nargs="*",
+        metavar="stage",
+        help=f"Stages to run in order, from {', '.join(STAGES)}. "
+        f"Defaults to {' '.join(DEFAULT_STAGES)}.",
+    )
+    parser.add_argument(
+        "--region",
+        type=Region,
+        action="append",
+        metavar="{" + ",".join(region.value for region in Region) + "}",
+        help="Region to import. Can be repeated. Defaults to all regions.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only reload the data whose source files changed "
+        "since the last imported gamedata commit.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.import_workers,
+        help="Number of tables and redis hashes loaded at the same time. "
+        "Defaults to IMPORT_WORKERS.",
+    )
+    parser.add_argument(
+        "--rollback-db",
+        action="store_true",
+        help="Swap the PostgreSQL tables replaced by the last import's db and "
+        "svt-extra stages back in "
+        "instead of running stages. Running it again undoes the rollback. "
+        "The Redis data isn't rolled back.",
+    )
+    parser.add_argument("--verbose", "-v", action="store_true")
+    return parser
+
+
+def get_stages(stages: list[str]) -> list[str]:
+    """Deduplicate the stages and run them in the pipeline order."""
+    if not stages:
+        return DEFAULT_STAGES
+    return [stage for stage in STAGES if stage in stages]
+
+
+async def run_stage(
+    name: str, func: Callable[[], Awaitable[None]], stage_no: int, stage_count: int
+) -> StageResult:
+    logger.info(f"[{stage_no}/{stage_count}] Running {name} …")
+    start_time = time.perf_counter()
+    try:
+        await func()
+    except Exception as e:  # pylint: disable=broad-except
+        run_time = time.perf_counter() - start_time
+        logger.exception(
+            f"[{stage_no}/{stage_count}] {name} failed in {run_time:.2f}s."
+        )
+        return StageResult(name, run_time, e)
+
+    run_time = time.perf_counter() - start_time
+    logger.info(f"[{stage_no}/{stage_count}] Finished {name} in {run_time:.2f}s.")
+    return StageResult(name, run_time)
+
+
+def log_summary(results: list[StageResult], stages: list[str]) -> None:
+    summary = ["Stage summary:"]
+    for stage in stages:
+        result = next((result for result in results if result.name == stage), None)
+        if result is None:
+            summary.append(f"  {stage:<10} {'-':>10} skipped")
+        else:
+            status = "failed" if result.error else "ok"
+            summary.append(f"  {stage:<10} {result.run_time:>9.2f}s {status}")
+    logger.info("\n".join(summary))
+
+
+async def run_import(
+    stages: list[str],
+    region_path: dict[Region, DirectoryPath],
+    incremental: bool,
+    workers: int,
+) -> int:  # pragma: no cover
+    """Run the stages in order and stop at the first failed stage."""
+    redis = await Redis.from_url(secrets.redisdsn)
+    async_engines = get_async_engines()
+    data_version = get_data_version(region_path)
+    # The data version covers all regions so only a full import is recorded
+    all_regions = region_path.keys() == REGION_PATHS.keys()
+    results: list[StageResult] = []
+
+    try:
+        async with import_lock(redis):
+            changed_files = (
+                await get_master_changed_files(redis, region_path)
+                if incremental
+                else None
+            )
+            command = ImportCommand(redis, region_path, changed_files, workers)
+            stage_funcs: dict[str, Callable[[], Awaitable[None]]] = {
+                "db": command.load_db,
+                "redis": command.load_redis,
+                "svt-extra": command.load_svt_extra,
+                "constants": command.export_constants,
+                "exports": lambda: export_data_version(
+                    redis,
+                    region_path,
+                    async_engines,
+                    data_version if all_regions else None,
+                ),
+                "rayshift": command.load_rayshift,
+            }
+
+            data_stages = [stage for stage in stages if stage in DATA_STAGES]
+            all_data_loaded = all_regions and data_stages == DATA_STAGES
+            for stage_no, stage in enumerate(stages, 1):
+                result = await run_stage(
+                    stage, stage_funcs[stage], stage_no, len(stages)
+                )
+                results.append(result)
+                if result.error:
+                    break
+                if data_stages and stage == data_stages[-1]:
+                    await finish_data_import(
+                        redis, region_path, data_version if all_data_loaded else None
+                    )
+    finally:
+        await wait_background_tasks()
+        for engine in async_engines.values():
+            await engine.dispose()
+        await redis.close()
+
+    log_summary(results, stages)
+    if any(result.error for result in results):
+        return EXIT_STAGE_FAILED
+    return EXIT_SUCCESS
+
+
+async def run_rollback_db(
+    region_path: dict[Region, DirectoryPath]
+) -> int:  # pragma: no cover
+    """Roll back the PostgreSQL tables of the regions to the previous generation."""
+    redis = await Redis.from_url(secrets.redisdsn)
+    try:
+        async with import_lock(redis):
+            for region in region_path:
+                logger.info(f"Rolling back {region} db …")
+                await run_in_threadpool(rollback_db_generation, engines[region])
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Failed to roll back the db.")
+        return EXIT_STAGE_FAILED
+    finally:
+        await redis.close()
+    return EXIT_SUCCESS
+
+
+def main(argv: Optional[list[str]] = None) -> int:  # pragma: no cover
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    # argparse exits with EXIT_USAGE_ERROR
+    unknown_stages = [stage for stage in args.stages if stage not in STAGES]
+    if unknown_stages:
+        parser.error(f"unknown stages: {', '.join(unknown_stages)}")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.rollback_db and args.stages:
+        parser.error("--rollback-db can't be used with stages")
+    logger.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+
+    regions = args.region or list(REGION_PATHS)
+    region_path = {region: REGION_PATHS[region] for region in regions}
+    stages = get_stages(args.stages)
+
+    start_time = time.perf_counter()
+    if args.rollback_db:
+        exit_code = asyncio.run(run_rollback_db(region_path))
+    else:
+        exit_code = asyncio.run(
+            run_import(stages, region_path, args.incremental, args.workers)
+        )
+    logger.info(f"Finished in {time.perf_counter() - start_time:.2f}s.")
+    return exit_code
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
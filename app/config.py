@@ -2,6 +2,7 @@ import logging
 from pathlib import Path
 from typing import Optional
 
+import toml
 from pydantic import (
     BaseSettings,
     DirectoryPath,
@@ -16,6 +17,7 @@ from uvicorn.logging import DefaultFormatter  # type: ignore
 
 
 project_root = Path(__file__).resolve().parents[1]
+app_version = toml.load(project_root / "pyproject.toml")["tool"]["poetry"]["version"]
 
 
 uvicorn_logger = logging.getLogger("uvicorn.access")
@@ -42,7 +44,16 @@ class Settings(BaseSettings):
     documentation_all_nice: bool = False
     github_webhook_git_pull: bool = False
     github_webhook_sleep: int = 0
+    incremental_update: bool = True
+    import_workers: int = 4
+    master_stream_file_size: int = 16 * 1024 * 1024
+    export_workers: int = 4
+    export_precompress: bool = True
+    export_ndjson: bool = False
+    export_msgpack: bool = False
     clear_redis_cache: bool = True
+    local_cache_size: int = 64 * 1024 * 1024
+    local_cache_check_interval: float = 5
     redis_prefix: str = "fgoapi"
     rate_limit_per_5_sec: int = 100
 
@@ -1,7 +1,10 @@
+from typing import Optional
+
 from aioredis import Redis
 
-from ..redis.helpers.repo_version import get_repo_version
-from ..schemas.common import Region, RepoInfo
+from ..data.changes import merge_change_sets
+from ..redis.helpers.repo_version import get_change_sets, get_repo_version
+from ..schemas.common import DataChanges, Region, RepoInfo
 from ..tasks import REGION_PATHS
 
 
@@ -12,3 +15,23 @@ async def get_all_repo_info(redis: Redis) -> dict[Region, RepoInfo]:
         if repo_info is not None:
             all_repo_info[region] = repo_info
     return all_repo_info
+
+
+async def get_data_changes(
+    redis: Redis, region: Region, since: str
+) -> Optional[DataChanges]:
+    """
+    Return the entities that changed after the data version since.
+    Return None if the changes since that version aren't recorded.
+    """
+    repo_info = await get_repo_version(redis, region)
+    if repo_info is not None and repo_info.hash == since:
+        return DataChanges(since=since, version=repo_info, changes={})
+    changes = merge_change_sets(
+        await get_change_sets(redis, region),
+        since,
+        repo_info.hash if repo_info is not None else None,
+    )
+    if changes is None:
+        return None
+    return DataChanges(since=since, version=repo_info, changes=changes)
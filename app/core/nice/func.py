@@ -2,6 +2,7 @@ import re
 from typing import Any, Optional, Union
 
 from fastapi import HTTPException
+from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncConnection
 
 from ...config import Settings, logger
@@ -22,6 +23,29 @@ def remove_brackets(val_string: str) -> str:
     return val_string.removeprefix("[").removesuffix("]")
 
 
+DEPEND_FUNC_ID = re.compile(r"DependFuncId1:\[?(\d+)")
+
+
+def get_depend_func_ids(raw_entity: BaseModel) -> set[int]:
+    """IDs of the functions the datavals in the raw entity depend on"""
+    return {int(func_id) for func_id in DEPEND_FUNC_ID.findall(raw_entity.json())}
+
+
+async def get_depend_funcs(
+    conn: AsyncConnection, raw_entity: BaseModel
+) -> list[MstFunc]:
+    """
+    Rows of the functions the datavals in the raw entity depend on.
+    parse_dataVals fetches them so they are inputs of the nice entity too.
+    """
+    depend_funcs: list[MstFunc] = []
+    for func_id in sorted(get_depend_func_ids(raw_entity)):
+        mstFunc = await fetch.get_one(conn, MstFunc, func_id)
+        if mstFunc:
+            depend_funcs.append(mstFunc)
+    return depend_funcs
+
+
 EVENT_DROP_FUNCTIONS = {
     FuncType.EVENT_POINT_UP,
     FuncType.EVENT_POINT_RATE_UP,
@@ -1,12 +1,14 @@
 import re
 import string
-from typing import Iterable, Literal, Optional, TypeVar, Union
+from contextvars import ContextVar
+from typing import Any, Iterable, Literal, Optional, TypeVar, Union
 
 from ..data.custom_mappings import TRANSLATION_OVERRIDE, TRANSLATIONS, Translation
 from ..schemas.basic import BasicCommandCode, BasicEquip, BasicServant
 from ..schemas.common import Language, NiceTrait
 from ..schemas.enums import TRAIT_NAME, Trait
 from ..schemas.nice import NiceCommandCode, NiceEquip, NiceServant
+from ..schemas.raw import MstSvt
 
 
 TValue = TypeVar("TValue")
@@ -17,6 +19,43 @@ full_width_uppercase_lookup = {chr(0xFF21 + i): chr(65 + i) for i in range(26)}
 half_width_uppercase_lookup = set(string.ascii_uppercase)
 
 
+# If set, the Language.jp texts returned by the translation functions also carry
+# their translation in this language. See OverlayStr.
+overlay_language: ContextVar[Optional[Language]] = ContextVar(
+    "overlay_language", default=None
+)
+
+
+class OverlayStr(str):
+    """
+    Japanese text that also carries its translation in the overlay language.
+    It's a str so it passes through the nice models and serializes as the JP text.
+    apply_overlay swaps in the translations so a nice object built once
+    can be exported in both languages.
+    """
+
+    overlay: str
+
+    def __new__(cls, text: str, overlay: str) -> "OverlayStr":
+        overlay_str = super().__new__(cls, text)
+        overlay_str.overlay = overlay
+        return overlay_str
+
+    def __getnewargs__(self) -> tuple[str, str]:  # type: ignore
+        return str(self), self.overlay
+
+
+def apply_overlay(data: Any) -> Any:
+    """Return a copy of data with the OverlayStr replaced by their translation"""
+    if isinstance(data, OverlayStr):
+        return data.overlay
+    if isinstance(data, dict):
+        return {key: apply_overlay(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [apply_overlay(value) for value in data]
+    return data
+
+
 def get_translation(
     language: Language,
     text: str,
@@ -27,6 +66,10 @@ def get_translation(
         return ""
 
     if language == Language.jp:
+        if overlay := overlay_language.get():
+            return OverlayStr(
+                text, get_translation(overlay, text, override_file, override_id)
+            )
         return text
 
     if (
@@ -49,6 +92,8 @@ def get_translation(
 
 def get_np_name(td_name: str, td_ruby: str, language: Language) -> str:
     if language == Language.jp:
+        if overlay := overlay_language.get():
+            return OverlayStr(td_name, get_np_name(td_name, td_ruby, overlay))
         return td_name
 
     to_translate = td_ruby if td_ruby not in ("", "-") else td_name
@@ -78,6 +123,11 @@ def get_voice_name(
         else:
             return get_translation(language, voice_name, override_file)
 
+    if language == Language.jp and (overlay := overlay_language.get()):
+        return OverlayStr(
+            voice_name, get_voice_name(voice_name, overlay, override_file)
+        )
+
     return voice_name
 
 
@@ -110,6 +160,7 @@ THasColNo = TypeVar(
     NiceServant,
     NiceEquip,
     NiceCommandCode,
+    MstSvt,
 )
 
 
@@ -10,6 +10,7 @@ def get_buff_with_classrelation(gamedata_path: DirectoryPath) -> list[MstBuff]:
         gamedata_path, MstClassRelationOverwrite
     )
 
+    buffs: list[MstBuff] = []
     for buff in mstBuffs:
         if "relationId" in buff.script:
             overwrite_relation_id = int(buff.script["relationId"])
@@ -18,6 +19,8 @@ def get_buff_with_classrelation(gamedata_path: DirectoryPath) -> list[MstBuff]:
                 for overwrite in mstClassRelationOverwrites
                 if overwrite.id == overwrite_relation_id
             ]
-            buff.script["relationOverwrite"] = overwrites
+            script = buff.script | {"relationOverwrite": overwrites}
+            buff = buff.copy(update={"script": script})
+        buffs.append(buff)
 
-    return mstBuffs
+    return buffs
@@ -0,0 +1,323 @@
+from collections import defaultdict
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+import orjson
+from git import Repo  # type: ignore
+from git.exc import BadName  # type: ignore
+from pydantic import DirectoryPath
+
+from ..config import logger
+from ..schemas.common import DataChangeSet, RepoInfo
+from ..schemas.gameenums import SvtType
+from .diff import get_changed_files
+
+
+# Entity type: {master file: field with the ID of the entity the row belongs to}
+# "svt" rows are split into "servant" and "equip" by the svt type.
+ENTITY_MASTER_FILES: dict[str, dict[str, str]] = {
+    "svt": {
+        "mstSvt": "id",
+        "mstSvtLimit": "svtId",
+        "mstSvtLimitAdd": "svtId",
+        "mstSvtSkill": "svtId",
+        "mstSvtPassiveSkill": "svtId",
+        "mstSvtAppendPassiveSkill": "svtId",
+        "mstSvtAppendPassiveSkillUnlock": "svtId",
+        "mstSvtTreasureDevice": "svtId",
+        "mstSvtCard": "svtId",
+        "mstSvtIndividuality": "svtId",
+        "mstSvtComment": "svtId",
+        "mstSvtVoice": "id",
+        "mstSvtVoiceRelation": "svtId",
+        "mstSvtCostume": "svtId",
+        "mstSvtChange": "svtId",
+        "mstSvtGroup": "svtId",
+        "mstSvtAdd": "svtId",
+        "mstSvtCoin": "svtId",
+        "mstCombineLimit": "id",
+        "mstCombineSkill": "id",
+        "mstCombineCostume": "svtId",
+        "mstCombineAppendPassiveSkill": "svtId",
+        "mstVoicePlayCond": "svtId",
+    },
+    "skill": {
+        "mstSkill": "id",
+        "mstSkillDetail": "id",
+        "mstSkillLv": "skillId",
+        "mstSkillAdd": "skillId",
+    },
+    "NP": {
+        "mstTreasureDevice": "id",
+        "mstTreasureDeviceDetail": "id",
+        "mstTreasureDeviceLv": "treaureDeviceId",
+    },
+    "function": {"mstFunc": "id", "mstFuncGroup": "funcId"},
+    "buff": {"mstBuff": "id"},
+    "item": {"mstItem": "id"},
+    "event": {
+        "mstEvent": "id",
+        "mstEventReward": "eventId",
+        "mstEventRewardSet": "eventId",
+        "mstEventPointGroup": "eventId",
+        "mstEventPointBuff": "eventId",
+        "mstEventTower": "eventId",
+        "mstEventTowerReward": "eventId",
+        "mstTreasureBox": "eventId",
+        "mstShop": "eventId",
+    },
+    "war": {
+        "mstWar": "id",
+        "mstWarAdd": "warId",
+        "mstMap": "warId",
+        "mstSpot": "warId",
+    },
+    "quest": {
+        "mstQuest": "id",
+        "mstQuestPhase": "questId",
+        "mstQuestPhaseDetail": "questId",
+        "mstQuestRelease": "questId",
+        "mstQuestConsumeItem": "questId",
+        "mstQuestMessage": "questId",
+        "mstStage": "questId",
+        "mstStageRemap": "questId",
+        "npcFollower": "questId",
+    },
+}
+
+
+# The nice entities embed the entities they use, so a change is also a change of
+# the entities using it: (used entity type, entity type, master file,
+# field with the used entity IDs, field with the entity ID). Applied in order.
+ENTITY_DEPENDENCIES = [
+    ("buff", "function", "mstFunc", "vals", "id"),
+    ("function", "skill", "mstSkillLv", "funcId", "skillId"),
+    ("function", "NP", "mstTreasureDeviceLv", "funcId", "treaureDeviceId"),
+    ("skill", "svt", "mstSvtSkill", "skillId", "svtId"),
+    ("skill", "svt", "mstSvtPassiveSkill", "skillId", "svtId"),
+    ("skill", "svt", "mstSvtAppendPassiveSkill", "skillId", "svtId"),
+    ("NP", "svt", "mstSvtTreasureDevice", "treasureDeviceId", "svtId"),
+]
+
+
+def load_master_rows(data: Optional[bytes]) -> list[dict[str, Any]]:
+    if data is None:
+        return []
+    rows: list[dict[str, Any]] = orjson.loads(data)
+    return rows
+
+
+def get_changed_rows(
+    previous_rows: Sequence[dict[str, Any]], rows: Sequence[dict[str, Any]]
+) -> list[dict[str, Any]]:
+    """
+    Return the rows that were added, changed or removed.
+    The rows at the start and end that are the same in both lists, usually most
+    of them, are skipped without serializing them.
+    """
+    start = 0
+    while (
+        start < len(previous_rows)
+        and start < len(rows)
+        and previous_rows[start] == rows[start]
+    ):
+        start += 1
+    previous_end, end = len(previous_rows), len(rows)
+    while (
+        previous_end > start
+        and end > start
+        and previous_rows[previous_end - 1] == rows[end - 1]
+    ):
+        previous_end -= 1
+        end -= 1
+
+    previous = {
+        orjson.dumps(row, option=orjson.OPT_SORT_KEYS): row
+        for row in previous_rows[start:previous_end]
+    }
+    current = {
+        orjson.dumps(row, option=orjson.OPT_SORT_KEYS): row for row in rows[start:end]
+    }
+    return [row for key, row in previous.items() if key not in current] + [
+        row for key, row in current.items() if key not in previous
+    ]
+
+
+def get_row_ids(rows: Iterable[dict[str, Any]], field: str) -> set[int]:
+    ids: set[int] = set()
+    for row in rows:
+        value = row.get(field)
+        if isinstance(value, int):
+            ids.add(value)
+        elif isinstance(value, list):
+            ids.update(item for item in value if isinstance(item, int))
+    return ids
+
+
+def read_commit_file(repo: Repo, commit_hash: str, path: str) -> Optional[bytes]:
+    try:
+        blob = repo.commit(commit_hash).tree / path
+    except KeyError:
+        return None
+    data: bytes = blob.data_stream.read()
+    return data
+
+
+def read_gamedata_file(gamedata_path: DirectoryPath, path: str) -> Optional[bytes]:
+    file_path = gamedata_path / path
+    return file_path.read_bytes() if file_path.exists() else None
+
+
+class MasterFiles:
+    """
+    Master files of the gamedata folder and of the previous commit.
+    Each file is loaded once and shared between the passes of get_entity_changes.
+    """
+
+    def __init__(
+        self,
+        gamedata_path: DirectoryPath,
+        repo: Repo,
+        previous_commit: str,
+        changed_files: set[str],
+    ) -> None:
+        self.gamedata_path = gamedata_path
+        self.repo = repo
+        self.previous_commit = previous_commit
+        self.changed_files = changed_files
+        self.current: dict[str, list[dict[str, Any]]] = {}
+        self.previous: dict[str, list[dict[str, Any]]] = {}
+
+    @staticmethod
+    def get_path(master_file: str) -> str:
+        return f"master/{master_file}.json"
+
+    def is_changed(self, master_file: str) -> bool:
+        return self.get_path(master_file) in self.changed_files
+
+    def get_rows(self, master_file: str) -> list[dict[str, Any]]:
+        if master_file not in self.current:
+            self.current[master_file] = load_master_rows(
+                read_gamedata_file(self.gamedata_path, self.get_path(master_file))
+            )
+        return self.current[master_file]
+
+    def get_previous_rows(self, master_file: str) -> list[dict[str, Any]]:
+        if not self.is_changed(master_file):
+            return self.get_rows(master_file)
+        if master_file not in self.previous:
+            self.previous[master_file] = load_master_rows(
+                read_commit_file(
+                    self.repo, self.previous_commit, self.get_path(master_file)
+                )
+            )
+        return self.previous[master_file]
+
+    def get_all_rows(self, master_file: str) -> Iterator[dict[str, Any]]:
+        """Rows of both versions of the file, the unchanged ones only once"""
+        yield from self.get_rows(master_file)
+        if self.is_changed(master_file):
+            yield from self.get_previous_rows(master_file)
+
+
+def get_entity_changes(
+    gamedata_path: DirectoryPath, previous_hash: str
+) -> Optional[dict[str, list[int]]]:
+    """
+    Return the IDs of the entities of each type in ENTITY_MASTER_FILES whose master
+    rows changed between the previous commit and the gamedata folder, including the
+    entities using them in either version, see ENTITY_DEPENDENCIES.
+    Return None if the changed files can't be determined.
+    """
+    changed_files = get_changed_files(gamedata_path, previous_hash)
+    if changed_files is None:
+        return None
+    repo = Repo(gamedata_path)
+    try:
+        previous_commit = repo.commit(previous_hash).hexsha
+    except (BadName, ValueError):  # pragma: no cover
+        return None
+
+    master_files = MasterFiles(gamedata_path, repo, previous_commit, changed_files)
+    changes: dict[str, set[int]] = defaultdict(set)
+    for entity_type, entity_master_files in ENTITY_MASTER_FILES.items():
+        for master_file, id_field in entity_master_files.items():
+            if not master_files.is_changed(master_file):
+                continue
+            changed_rows = get_changed_rows(
+                master_files.get_previous_rows(master_file),
+                master_files.get_rows(master_file),
+            )
+            changes[entity_type] |= get_row_ids(changed_rows, id_field)
+
+    for dependency in ENTITY_DEPENDENCIES:
+        used_type, entity_type, master_file, used_field, id_field = dependency
+        used_ids = changes[used_type]
+        if not used_ids:
+            continue
+        changes[entity_type] |= {
+            row[id_field]
+            for row in master_files.get_all_rows(master_file)
+            if not used_ids.isdisjoint(get_row_ids([row], used_field))
+        }
+
+    svt_ids = changes.pop("svt", set())
+    if svt_ids:
+        equip_ids = {
+            svt["id"]
+            for svt in master_files.get_all_rows("mstSvt")
+            if svt["type"] == SvtType.SERVANT_EQUIP
+        }
+        changes["servant"] = svt_ids - equip_ids
+        changes["equip"] = svt_ids & equip_ids
+
+    return {
+        entity_type: sorted(entity_ids)
+        for entity_type, entity_ids in changes.items()
+        if entity_ids
+    }
+
+
+def get_change_set(
+    gamedata_path: DirectoryPath, previous_version: RepoInfo, version: RepoInfo
+) -> Optional[DataChangeSet]:
+    """Return the entity changes from previous_version to version of the gamedata"""
+    if previous_version.hash == version.hash:
+        return None
+    changes = get_entity_changes(gamedata_path, previous_version.hash)
+    if changes is None:
+        logger.info(f"Can't find the entity changes of {gamedata_path}.")
+        return None
+    return DataChangeSet(
+        previousVersion=previous_version, version=version, changes=changes
+    )
+
+
+def merge_change_sets(
+    change_sets: Iterable[DataChangeSet],
+    since_hash: str,
+    version_hash: Optional[str] = None,
+) -> Optional[dict[str, list[int]]]:
+    """
+    Merge the changes of change_sets, ordered from the newest,
+    made after the data version since_hash up to the data version version_hash.
+    Return None if since_hash isn't the previous version of any of the change sets
+    or if the changes up to it aren't all recorded: the version of each change set
+    must be the previous version of the newer one, the newest ending at version_hash
+    if given, and none of them can be a marker set with unknown changes.
+    """
+    changes: dict[str, set[int]] = defaultdict(set)
+    expected_hash = version_hash
+    for change_set in change_sets:
+        if expected_hash is not None and change_set.version.hash != expected_hash:
+            return None
+        if change_set.changes is None:
+            return None
+        for entity_type, entity_ids in change_set.changes.items():
+            changes[entity_type].update(entity_ids)
+        if change_set.previousVersion.hash == since_hash:
+            return {
+                entity_type: sorted(entity_ids)
+                for entity_type, entity_ids in changes.items()
+            }
+        expected_hash = change_set.previousVersion.hash
+    return None
@@ -0,0 +1,68 @@
+from typing import Iterable, Optional
+
+from git import Repo  # type: ignore
+from git.exc import BadName  # type: ignore
+from pydantic import DirectoryPath
+
+from ..config import logger
+from ..schemas.common import Region
+
+
+SCRIPT_FOLDER = "ScriptActionEncrypt"
+
+
+# Changed files of each region. None means the changes are unknown.
+RegionChangedFiles = dict[Region, Optional[set[str]]]
+
+
+def get_changed_files(
+    gamedata_path: DirectoryPath, previous_hash: str
+) -> Optional[set[str]]:
+    """
+    Return the paths, relative to the gamedata folder, of the files changed
+    between the previous imported commit and the current HEAD.
+    Return None if the changes can't be determined and everything should be reloaded.
+    """
+    if not (gamedata_path / ".git").exists():
+        return None
+
+    repo = Repo(gamedata_path)
+    try:
+        previous_commit = repo.commit(previous_hash)
+    except (BadName, ValueError):
+        logger.warning(f"Can't find commit {previous_hash} in {gamedata_path}.")
+        return None
+
+    changed_files: set[str] = set()
+    for diff in previous_commit.diff(repo.commit()):
+        for path in (diff.a_path, diff.b_path):
+            if path:
+                changed_files.add(path)
+
+    return changed_files
+
+
+def is_master_changed(
+    changed_files: Optional[set[str]], master_files: Iterable[str]
+) -> bool:
+    """
+    Check if any of the given master files (e.g. "mstSvt") changed.
+    None changed_files means the changes are unknown and everything is considered changed.
+    """
+    if changed_files is None:
+        return True
+    return any(f"master/{master}.json" in changed_files for master in master_files)
+
+
+def is_script_changed(changed_files: Optional[set[str]]) -> bool:
+    if changed_files is None:
+        return True
+    return any(path.startswith(f"{SCRIPT_FOLDER}/") for path in changed_files)
+
+
+def get_region_changed_files(
+    changed_files: Optional[RegionChangedFiles], region: Region
+) -> Optional[set[str]]:
+    if changed_files is None:
+        return None
+    return changed_files.get(region)
@@ -15,7 +15,7 @@ def get_event_with_warIds(gamedata_path: DirectoryPath) -> list[MstEvent]:
     for war in mstWars:
         event_warIds[war.eventId].append(war.id)
 
-    for event in mstEvents:
-        event.warIds = event_warIds.get(event.id, [])
-
-    return mstEvents
+    return [
+        event.copy(update={"warIds": event_warIds.get(event.id, [])})
+        for event in mstEvents
+    ]
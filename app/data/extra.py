@@ -24,6 +24,18 @@ from .utils import load_master_data
 VALENTINE_NAME = {Region.NA: "Valentine", Region.JP: "バレンタイン"}
 MASHU_SVT_ID1 = 800100
 MASH_NAME = {Region.NA: "Mash", Region.JP: "マシュ"}
+EXTRA_SVT_MASTER_FILES = [
+    "mstSvt",
+    "mstSvtLimitAdd",
+    "mstSkill",
+    "mstSvtSkill",
+    "mstEvent",
+    "mstShop",
+    "mstShopScript",
+    "mstShopRelease",
+    "mstSvtComment",
+    "mstSvtCostume",
+]
 
 
 def is_Mash_Valentine_equip(region: Region, comment: str) -> bool:
@@ -29,9 +29,13 @@ def get_item_with_use(gamedata_path: DirectoryPath) -> list[MstItem]:
         item_id for combine in mstCombineCostume for item_id in combine.itemIds
     }
 
-    for item in mstItem:
-        item.useSkill = item.id in skill_items
-        item.useAscension = item.id in limit_items
-        item.useCostume = item.id in costume_items
-
-    return mstItem
+    return [
+        item.copy(
+            update={
+                "useSkill": item.id in skill_items,
+                "useAscension": item.id in limit_items,
+                "useCostume": item.id in costume_items,
+            }
+        )
+        for item in mstItem
+    ]
@@ -1,8 +1,15 @@
-from typing import Type, TypeVar
+import json
+import re
+import threading
+from collections import Counter
+from itertools import islice
+from pathlib import Path
+from typing import IO, Any, Iterable, Iterator, Optional, Type, TypeVar
 
 import orjson
 from pydantic import DirectoryPath
 
+from ..config import Settings
 from ..schemas.base import BaseModelORJson
 from ..schemas.raw import (
     MstAi,
@@ -39,6 +46,9 @@ from ..schemas.raw import (
 )
 
 
+settings = Settings()
+
+
 PydanticModel = TypeVar("PydanticModel", bound=BaseModelORJson)
 
 
@@ -79,10 +89,196 @@ MODEL_FILE_NAME: dict[Type[BaseModelORJson], str] = {
 }
 
 
+MASTER_BATCH_SIZE = 1000
+JSON_READ_SIZE = 1024 * 1024
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Characters that can follow an array item
+JSON_ITEM_ENDS = frozenset(" \t\n\r,]")
+
+
+def iter_json_array(fp: IO[str], read_size: int = JSON_READ_SIZE) -> Iterator[Any]:
+    """
+    Iterate the items of the JSON array in the file without reading the whole file.
+    Only the current chunk and the item being decoded are held in memory.
+    An item is only yielded once the character after it is read, so a number cut
+    off at the end of the chunk isn't decoded partially.
+    """
+    decoder = json.JSONDecoder()
+    buffer = fp.read(read_size).lstrip()
+    while not buffer and (chunk := fp.read(read_size)):
+        buffer = chunk.lstrip()
+    position = 0
+    if buffer[:1] != "[":
+        raise ValueError("Expected a JSON array")
+    position += 1
+    end_of_file = False
+    expect_item = True
+
+    while True:
+        position = JSON_WHITESPACE.match(buffer, position).end()  # type: ignore
+        next_char = buffer[position : position + 1]
+        if next_char == "]":
+            return
+        if next_char == "," and not expect_item:
+            position += 1
+            expect_item = True
+            continue
+
+        if next_char:
+            try:
+                item, item_end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if end_of_file:
+                    raise
+            else:
+                if end_of_file or (
+                    item_end < len(buffer) and buffer[item_end] in JSON_ITEM_ENDS
+                ):
+                    yield item
+                    position = item_end
+                    expect_item = False
+                    continue
+        elif end_of_file:
+            raise ValueError("Unexpected end of JSON array")
+
+        # Read at least as much as the incomplete item so far so a big item is
+        # decoded a logarithmic number of times instead of once per read_size
+        chunk = fp.read(max(read_size, len(buffer) - position))
+        end_of_file = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_master_json(
+    table_json: Path, batch_size: int = MASTER_BATCH_SIZE
+) -> Iterator[list[dict[str, Any]]]:
+    with open(table_json, encoding="utf-8") as fp:
+        items = iter_json_array(fp)
+        while batch := list(islice(items, batch_size)):
+            yield batch
+
+
+def read_master_json(table_json: Path) -> list[dict[str, Any]]:
+    with open(table_json, "rb") as fp:
+        data: list[dict[str, Any]] = orjson.loads(fp.read())
+    return data
+
+
+class MasterDataRegistry:
+    """
+    Share the parsed master files between the loaders of an import.
+    A file that is used by more than one loader is parsed once and its raw and
+    model views are kept until the last loader using it released it.
+    Files that aren't registered are parsed on every call and not kept.
+    The shared data must not be mutated.
+
+    Shared files bigger than stream_file_size bytes are an exception for iter_raw:
+    each loader streams them in batches instead, trading parsing them once per
+    loader for not holding the whole file in memory while its loaders run,
+    e.g. mstSvtLimit is parsed by both the DB and redis loaders. A size of 0
+    keeps every shared file parsed once. See MASTER_STREAM_FILE_SIZE.
+    """
+
+    def __init__(self, stream_file_size: int = 0) -> None:
+        self.stream_file_size = stream_file_size
+        self.users: Counter[Path] = Counter()
+        self.raw: dict[Path, list[dict[str, Any]]] = {}
+        self.models: dict[tuple[Path, type], list[Any]] = {}
+        self.lock = threading.Lock()
+        self.file_locks: dict[Path, threading.RLock] = {}
+
+    def add_users(self, master_files: Iterable[Path]) -> None:
+        with self.lock:
+            self.users.update(master_files)
+
+    def release(self, master_files: Iterable[Path]) -> None:
+        with self.lock:
+            for master_file in master_files:
+                self.users[master_file] -= 1
+                if self.users[master_file] <= 0:
+                    del self.users[master_file]
+                    self.file_locks.pop(master_file, None)
+                    self.raw.pop(master_file, None)
+                    for key in [key for key in self.models if key[0] == master_file]:
+                        del self.models[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.users.clear()
+            self.file_locks.clear()
+            self.raw.clear()
+            self.models.clear()
+
+    def get_file_lock(self, master_file: Path) -> Optional[threading.RLock]:
+        with self.lock:
+            if self.users[master_file] <= 1 and master_file not in self.file_locks:
+                return None
+            return self.file_locks.setdefault(master_file, threading.RLock())
+
+    def get_raw(self, master_file: Path) -> list[dict[str, Any]]:
+        file_lock = self.get_file_lock(master_file)
+        if file_lock is None:
+            return read_master_json(master_file)
+
+        with file_lock:
+            if master_file not in self.raw:
+                self.raw[master_file] = read_master_json(master_file)
+            return self.raw[master_file]
+
+    def iter_raw(
+        self, master_file: Path, batch_size: int = MASTER_BATCH_SIZE
+    ) -> Iterator[list[dict[str, Any]]]:
+        """
+        Iterate the raw items in batches of batch_size.
+        Files that are not shared or not yet parsed and bigger than
+        stream_file_size are streamed from disk instead of being parsed in one go
+        so the memory used is bounded by the batch size.
+        """
+        if self.get_file_lock(master_file) is None or (
+            master_file not in self.raw
+            and 0 < self.stream_file_size < master_file.stat().st_size
+        ):
+            yield from iter_master_json(master_file, batch_size)
+        else:
+            data = self.get_raw(master_file)
+            for start in range(0, len(data), batch_size):
+                yield data[start : start + batch_size]
+
+    def get_models(
+        self, master_file: Path, model: Type[PydanticModel]
+    ) -> list[PydanticModel]:
+        file_lock = self.get_file_lock(master_file)
+        if file_lock is None:
+            return [model.parse_obj(item) for item in read_master_json(master_file)]
+
+        with file_lock:
+            if (master_file, model) not in self.models:
+                self.models[(master_file, model)] = [
+                    model.parse_obj(item) for item in self.get_raw(master_file)
+                ]
+            models: list[PydanticModel] = self.models[(master_file, model)]
+            return models
+
+
+master_data = MasterDataRegistry(settings.master_stream_file_size)
+
+
+def get_master_file_paths(
+    gamedata_path: DirectoryPath, master_files: Iterable[str]
+) -> list[Path]:
+    return [
+        gamedata_path / "master" / f"{file_name}.json" for file_name in master_files
+    ]
+
+
+def load_master_json(
+    gamedata_path: DirectoryPath, file_name: str
+) -> list[dict[str, Any]]:
+    return master_data.get_raw(gamedata_path / "master" / f"{file_name}.json")
+
+
 def load_master_data(
     gamedata_path: DirectoryPath, model: Type[PydanticModel]
 ) -> list[PydanticModel]:
     file_name = MODEL_FILE_NAME[model]
-    with open(gamedata_path / "master" / f"{file_name}.json", "rb") as fp:
-        data = orjson.loads(fp.read())
-    return [model.parse_obj(item) for item in data]
+    return master_data.get_models(gamedata_path / "master" / f"{file_name}.json", model)
@@ -0,0 +1,141 @@
+from itertools import chain, islice
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import orjson
+from sqlalchemy import Boolean, Column, Integer, Numeric, Table
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.engine import Connection
+
+
+COPY_BATCH_SIZE = 1000
+COPY_NULL = "\\N"
+COPY_ESCAPE = str.maketrans(
+    {"\\": "\\\\", "\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+)
+
+
+def encode_array_item(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, list):
+        return "{" + ",".join(map(encode_array_item, value)) + "}"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, str):
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{escaped}"'
+    return str(value)
+
+
+def encode_array(value: Any) -> str:
+    if all(
+        type(item) is int for item in value
+    ):  # pylint: disable=unidiomatic-typecheck
+        return "{" + ",".join(map(str, value)) + "}"
+    return encode_array_item(list(value)).translate(COPY_ESCAPE)
+
+
+def encode_json(value: Any) -> str:
+    return (
+        orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        .decode("utf-8")
+        .translate(COPY_ESCAPE)
+    )
+
+
+def encode_text(value: Any) -> str:
+    return str(value).translate(COPY_ESCAPE)
+
+
+def encode_bool(value: Any) -> str:
+    return "t" if value else "f"
+
+
+def get_column_encoder(column: Column) -> Callable[[Any], str]:  # type: ignore
+    if isinstance(column.type, ARRAY):
+        return encode_array
+    if isinstance(column.type, JSONB):
+        return encode_json
+    if isinstance(column.type, Boolean):
+        return encode_bool
+    if isinstance(column.type, (Integer, Numeric)):
+        return str
+    return encode_text
+
+
+def get_copy_rows(
+    columns: list[Column], data: Iterable[dict[str, Any]]  # type: ignore
+) -> Iterator[str]:
+    """
+    Encode the rows to the text format used by Postgres' COPY FROM.
+    https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.2
+    """
+    encoders = [(column.name, get_column_encoder(column)) for column in columns]
+    for row in data:
+        values = [
+            COPY_NULL if (value := row.get(name)) is None else encoder(value)
+            for name, encoder in encoders
+        ]
+        yield "\t".join(values) + "\n"
+
+
+class CopyDataFile:
+    """Read only file-like object that streams the encoded rows to COPY FROM"""
+
+    def __init__(self, rows: Iterable[str], batch_size: int = COPY_BATCH_SIZE):
+        self.rows = iter(rows)
+        self.batch_size = batch_size
+        self.buffer = b""
+        self.position = 0
+
+    def read_batch(self) -> bytes:
+        return "".join(islice(self.rows, self.batch_size)).encode("utf-8")
+
+    def read(self, size: int = -1) -> bytes:
+        if self.position >= len(self.buffer):
+            self.buffer = self.read_batch()
+            self.position = 0
+
+        if size < 0:
+            end = len(self.buffer)
+        else:
+            end = self.position + size
+        data = self.buffer[self.position : end]
+        self.position = end
+        return data
+
+
+def get_table_name(conn: Connection, table: Table) -> str:
+    preparer = conn.dialect.identifier_preparer
+    schema: Optional[str] = conn.schema_for_object(table)
+    if schema:
+        return f"{preparer.quote_schema(schema)}.{preparer.quote(table.name)}"
+    return preparer.quote(table.name)
+
+
+def copy_to_db(
+    conn: Connection, table: Table, data: Iterable[dict[str, Any]]
+) -> None:  # pragma: no cover
+    """
+    Bulk insert the data into the table with COPY FROM STDIN.
+    Only the table columns found in the first row are copied.
+    """
+    data_iter = iter(data)
+    first_row = next(data_iter, None)
+    if first_row is None:
+        return
+
+    columns = [column for column in table.columns if column.name in first_row]
+    preparer = conn.dialect.identifier_preparer
+    column_names = ", ".join(preparer.quote(column.name) for column in columns)
+    copy_statement = (
+        f"COPY {get_table_name(conn, table)} ({column_names}) FROM STDIN"
+        " WITH (FORMAT text)"
+    )
+
+    copy_rows = get_copy_rows(columns, chain([first_row], data_iter))
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(copy_statement, CopyDataFile(copy_rows))  # type: ignore
+    finally:
+        cursor.close()
@@ -1,17 +1,40 @@
+import logging
+
 import sqlalchemy
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
-from ..config import SecretSettings
+from ..config import SecretSettings, Settings, logger
 from ..schemas.common import Region
 
 
+settings = Settings()
 secrets = SecretSettings()
 
 
+# Each import worker can hold a connection while loading a table
+max_overflow = max(10, settings.import_workers)
+
+
 engines = {
     Region.NA: sqlalchemy.create_engine(
-        secrets.na_postgresdsn, pool_size=3, max_overflow=10, future=True
+        secrets.na_postgresdsn, pool_size=3, max_overflow=max_overflow, future=True
     ),
     Region.JP: sqlalchemy.create_engine(
-        secrets.jp_postgresdsn, pool_size=3, max_overflow=10, future=True
+        secrets.jp_postgresdsn, pool_size=3, max_overflow=max_overflow, future=True
     ),
 }
+
+
+def get_async_engines() -> dict[Region, AsyncEngine]:
+    return {
+        region: create_async_engine(
+            postgresdsn.replace("postgresql", "postgresql+asyncpg"),
+            echo=logger.isEnabledFor(logging.DEBUG),
+            pool_size=3,
+            max_overflow=max(10, settings.export_workers),
+        )
+        for region, postgresdsn in (
+            (Region.NA, secrets.na_postgresdsn),
+            (Region.JP, secrets.jp_postgresdsn),
+        )
+    }
@@ -0,0 +1,111 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from ..config import logger
+
+
+LIVE_SCHEMA = "public"
+STAGING_SCHEMA = "staging"
+PREVIOUS_SCHEMA = "previous"
+
+
+def quote_table(conn: Connection, schema: str, table_name: str) -> str:
+    preparer = conn.dialect.identifier_preparer
+    return f"{preparer.quote_schema(schema)}.{preparer.quote(table_name)}"
+
+
+def recreate_schema(conn: Connection, schema: str) -> None:
+    quoted_schema = conn.dialect.identifier_preparer.quote_schema(schema)
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {quoted_schema} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {quoted_schema}"))
+
+
+def move_table(
+    conn: Connection, table_name: str, from_schema: str, to_schema: str
+) -> None:
+    quoted_to_schema = conn.dialect.identifier_preparer.quote_schema(to_schema)
+    conn.execute(
+        text(
+            f"ALTER TABLE IF EXISTS {quote_table(conn, from_schema, table_name)} "
+            f"SET SCHEMA {quoted_to_schema}"
+        )
+    )
+
+
+def publish_staging_tables(
+    engine: Engine, new_generation: bool = True
+) -> list[str]:  # pragma: no cover
+    """
+    Swap the tables in the staging schema into the live schema in one transaction.
+    The replaced live tables are moved to the previous schema. A new generation
+    empties it first so it only holds the tables of the generation before this
+    one, otherwise the tables are added to the ones the same import already
+    replaced, keeping the oldest version of a table replaced twice.
+    The tables that weren't reloaded are the same in both generations.
+    """
+    with engine.begin() as conn:
+        table_names: list[str] = inspect(conn).get_table_names(schema=STAGING_SCHEMA)
+        if new_generation:
+            recreate_schema(conn, PREVIOUS_SCHEMA)
+        previous_table_names = set(
+            inspect(conn).get_table_names(schema=PREVIOUS_SCHEMA)
+        )
+        for table_name in table_names:
+            if table_name in previous_table_names:
+                conn.execute(
+                    text(
+                        "DROP TABLE IF EXISTS "
+                        f"{quote_table(conn, LIVE_SCHEMA, table_name)} CASCADE"
+                    )
+                )
+            else:
+                move_table(conn, table_name, LIVE_SCHEMA, PREVIOUS_SCHEMA)
+            move_table(conn, table_name, STAGING_SCHEMA, LIVE_SCHEMA)
+
+    logger.info(f"Swapped in {len(table_names)} tables.")
+    return table_names
+
+
+class PublishRun:
+    """
+    Publish the staging tables of the staging cycles of one import run, e.g. the
+    db and svt-extra stages of the CLI. The first publish of an engine in the run
+    starts a new generation and the later ones add to it, so rolling back restores
+    all the tables the run replaced.
+    """
+
+    def __init__(self) -> None:
+        self.published_engines: set[Engine] = set()
+
+    def publish(self, engine: Engine) -> list[str]:  # pragma: no cover
+        new_generation = engine not in self.published_engines
+        table_names = publish_staging_tables(engine, new_generation)
+        self.published_engines.add(engine)
+        return table_names
+
+
+def get_staging_engine(engine: Engine) -> Engine:
+    return engine.execution_options(schema_translate_map={None: STAGING_SCHEMA})
+
+
+def prepare_staging_schema(engine: Engine) -> None:  # pragma: no cover
+    with engine.begin() as conn:
+        recreate_schema(conn, STAGING_SCHEMA)
+
+
+def rollback_db_generation(engine: Engine) -> list[str]:  # pragma: no cover
+    """
+    Swap the tables in the previous schema back into the live schema.
+    The swapped out live tables are kept in the previous schema so rolling back
+    again restores them.
+    """
+    with engine.begin() as conn:
+        table_names: list[str] = inspect(conn).get_table_names(schema=PREVIOUS_SCHEMA)
+        recreate_schema(conn, STAGING_SCHEMA)
+        for table_name in table_names:
+            move_table(conn, table_name, LIVE_SCHEMA, STAGING_SCHEMA)
+            move_table(conn, table_name, PREVIOUS_SCHEMA, LIVE_SCHEMA)
+            move_table(conn, table_name, STAGING_SCHEMA, PREVIOUS_SCHEMA)
+
+    logger.info(f"Rolled back {len(table_names)} tables.")
+    return table_names
@@ -1,18 +1,26 @@
 import hashlib
 import time
 from collections import defaultdict
-from typing import Any, Optional, Sequence, Union
+from functools import partial
+from typing import Any, Callable, Iterable, Iterator, Optional, Sequence, Union
 
-import orjson
 from pydantic import DirectoryPath
 from sqlalchemy import Table
 from sqlalchemy.engine import Connection, Engine
 
 from ..config import logger
 from ..data.buff import get_buff_with_classrelation
+from ..data.diff import (
+    RegionChangedFiles,
+    get_region_changed_files,
+    is_master_changed,
+    is_script_changed,
+)
 from ..data.event import get_event_with_warIds
+from ..data.extra import EXTRA_SVT_MASTER_FILES, get_extra_svt_data
 from ..data.item import get_item_with_use
 from ..data.script import get_script_path, get_script_text_only
+from ..data.utils import get_master_file_paths, load_master_json, master_data
 from ..models.raw import (
     TABLES_TO_BE_LOADED,
     ScriptFileList,
@@ -23,15 +31,20 @@ from ..models.raw import (
     mstItem,
     mstSkillLv,
     mstSubtitle,
+    mstSvtExtra,
     mstTreasureDeviceLv,
 )
 from ..models.rayshift import rayshiftQuest
+from ..rayshift.quest import get_all_quest_lists, get_multiple_quests
+from ..scheduler import ImportJob
 from ..schemas.base import BaseModelORJson
 from ..schemas.common import Region
 from ..schemas.enums import FUNC_VALS_NOT_BUFF
 from ..schemas.raw import get_subtitle_svtId
 from ..schemas.rayshift import QuestDetail, QuestList
+from .bulk import copy_to_db
 from .engine import engines
+from .generation import PublishRun, get_staging_engine, prepare_staging_schema
 from .helpers.rayshift import (
     fetch_missing_quest_ids,
     insert_rayshift_quest_db_sync,
@@ -46,7 +59,7 @@ def recreate_table(conn: Connection, table: Table) -> None:  # pragma: no cover
 
 def insert_db(conn: Connection, table: Table, db_data: Any) -> None:  # pragma: no cover
     recreate_table(conn, table)
-    conn.execute(table.insert(), db_data)
+    copy_to_db(conn, table, db_data)
 
 
 def check_known_columns(
@@ -57,38 +70,51 @@ def check_known_columns(
 
 
 def remove_unknown_columns(
-    data: list[dict[str, Any]], table: Table
-) -> list[dict[str, Any]]:  # pragma: no cover
+    data: Iterable[dict[str, Any]], table: Table
+) -> Iterator[dict[str, Any]]:  # pragma: no cover
     table_columns = {column.name for column in table.columns}
-    return [{k: v for k, v in item.items() if k in table_columns} for item in data]
+    return ({k: v for k, v in item.items() if k in table_columns} for item in data)
+
+
+def iter_known_columns(
+    batches: Iterable[list[dict[str, Any]]], table: Table, table_json: DirectoryPath
+) -> Iterator[dict[str, Any]]:  # pragma: no cover
+    """Flatten the batches and remove the columns that are not in the table"""
+    warned = False
+    for batch in batches:
+        if check_known_columns(batch, table):
+            yield from batch
+        else:
+            if not warned:
+                logger.warning(f"Found unknown columns in {table_json}")
+                warned = True
+            yield from remove_unknown_columns(batch, table)
 
 
 def load_skill_td_lv(
     engine: Engine, gamedata_path: DirectoryPath
 ) -> None:  # pragma: no cover
-    master_folder = gamedata_path / "master"
-
     mstBuff_data = get_buff_with_classrelation(gamedata_path)
     mstBuffId = {buff.id: buff for buff in mstBuff_data}
 
-    with open(master_folder / "mstFunc.json", "rb") as fp:
-        mstFunc_data = orjson.loads(fp.read())
-        mstFuncId = {func["id"]: func for func in mstFunc_data}
+    # The parsed master data is shared so the dicts are copied before adding fields
+    mstFunc_data = [dict(func) for func in load_master_json(gamedata_path, "mstFunc")]
+    mstFuncId = {func["id"]: func for func in mstFunc_data}
 
     mstFuncGroupId = defaultdict(list)
-    with open(master_folder / "mstFuncGroup.json", "rb") as fp:
-        mstFuncGroup_data = orjson.loads(fp.read())
-        for funcGroup in mstFuncGroup_data:
-            mstFuncGroupId[funcGroup["funcId"]].append(funcGroup)
+    mstFuncGroup_data = load_master_json(gamedata_path, "mstFuncGroup")
+    for funcGroup in mstFuncGroup_data:
+        mstFuncGroupId[funcGroup["funcId"]].append(funcGroup)
 
-    with open(master_folder / "mstSkillLv.json", "rb") as fp:
-        mstSkillLv_data = orjson.loads(fp.read())
-
-    with open(master_folder / "mstTreasureDeviceLv.json", "rb") as fp:
-        mstTreasureDeviceLv_data = orjson.loads(fp.read())
+    mstSkillLv_data = [
+        dict(skillLv) for skillLv in load_master_json(gamedata_path, "mstSkillLv")
+    ]
+    mstTreasureDeviceLv_data = [
+        dict(tdLv) for tdLv in load_master_json(gamedata_path, "mstTreasureDeviceLv")
+    ]
 
     def get_func_entity(func_id: int) -> dict[Any, Any]:
-        func_entity = {
+        func_entity: dict[str, Any] = {
             "mstFunc": mstFuncId[func_id],
             "mstFuncGroup": mstFuncGroupId.get(func_id, []),
         }
@@ -160,8 +186,7 @@ def load_script_list(
         with open(script_list_file, encoding="utf-8") as fp:
             script_list = [line.strip() for line in fp.readlines()]
 
-        with open(repo_folder / "master" / "mstQuest.json", "rb") as bfp:
-            mstQuest = orjson.loads(bfp.read())
+        mstQuest = load_master_json(repo_folder, "mstQuest")
 
         questId = {quest["id"] for quest in mstQuest}
 
@@ -229,11 +254,10 @@ def load_subtitle(
 ) -> None:  # pragma: no cover
     subtitle_json = master_folder / "globalNewMstSubtitle.json"
     if subtitle_json.exists():
-        with open(subtitle_json, "rb") as fp:
-            globalNewMstSubtitle = orjson.loads(fp.read())
-
-        for subtitle in globalNewMstSubtitle:
-            subtitle["svtId"] = get_subtitle_svtId(subtitle["id"])
+        globalNewMstSubtitle = [
+            subtitle | {"svtId": get_subtitle_svtId(subtitle["id"])}
+            for subtitle in master_data.get_raw(subtitle_json)
+        ]
     else:
         if region == Region.NA:
             logger.warning(f"Can't find file {subtitle_json}.")
@@ -251,67 +275,189 @@ def load_pydantic_to_db(
         insert_db(conn, db_table, db_data)
 
 
-def update_db(region_path: dict[Region, DirectoryPath]) -> None:  # pragma: no cover
-    logger.info("Loading db …")
-    start_loading_time = time.perf_counter()
-
-    for region, repo_folder in region_path.items():
-        logger.info(f"Updating {region} tables …")
-        master_folder = repo_folder / "master"
-        engine = engines[region]
+SKILL_TD_LV_MASTER_FILES = [
+    "mstBuff",
+    "mstClassRelationOverwrite",
+    "mstFunc",
+    "mstFuncGroup",
+    "mstSkillLv",
+    "mstTreasureDeviceLv",
+]
+EVENT_MASTER_FILES = ["mstEvent", "mstWar"]
+ITEM_MASTER_FILES = [
+    "mstItem",
+    "mstCombineSkill",
+    "mstCombineLimit",
+    "mstCombineCostume",
+]
+
+
+NA_OPTIONAL_MASTER_FILES = {
+    "mstStageRemap",
+    "mstSvtAdd",
+    "mstSvtAppendPassiveSkill",
+    "mstSvtAppendPassiveSkillUnlock",
+    "mstCombineAppendPassiveSkill",
+    "mstSvtCoin",
+    "mstSkillAdd",
+    "mstTreasureBox",
+    "mstTreasureBoxGift",
+}
+
+
+def load_master_table(
+    engine: Engine, region: Region, master_folder: DirectoryPath, table: Table
+) -> None:  # pragma: no cover
+    table_json = master_folder / f"{table.name}.json"
+    data: Iterable[dict[str, Any]]
+    if table_json.exists():
+        data = iter_known_columns(master_data.iter_raw(table_json), table, table_json)
+    else:
+        if not (region == Region.NA and table.name in NA_OPTIONAL_MASTER_FILES):
+            logger.warning(f"Can't find file {table_json}.")
+        data = []
 
-        for table in TABLES_TO_BE_LOADED:
-            table_json = master_folder / f"{table.name}.json"
-            if table_json.exists():
-                with open(table_json, "rb") as fp:
-                    data: list[dict[str, Any]] = orjson.loads(fp.read())
+    with engine.begin() as conn:
+        logger.info(f"Updating {table.name} …")
+        insert_db(conn, table, data)
 
-                if len(data) > 0 and not check_known_columns(data, table):
-                    logger.warning(f"Found unknown columns in {table_json}")
-                    data = remove_unknown_columns(data, table)
-            else:
-                if not (
-                    region == Region.NA
-                    and table.name
-                    in {
-                        "mstStageRemap",
-                        "mstSvtAdd",
-                        "mstSvtAppendPassiveSkill",
-                        "mstSvtAppendPassiveSkillUnlock",
-                        "mstCombineAppendPassiveSkill",
-                        "mstSvtCoin",
-                        "mstSkillAdd",
-                        "mstTreasureBox",
-                        "mstTreasureBoxGift",
-                    }
-                ):
-                    logger.warning(f"Can't find file {table_json}.")
-                data = []
 
-            with engine.begin() as conn:
-                logger.info(f"Updating {table.name} …")
-                insert_db(conn, table, data)
+def load_svt_extra_db(
+    engine: Engine, region: Region, gamedata_path: DirectoryPath
+) -> None:  # pragma: no cover
+    svtExtras = get_extra_svt_data(region, gamedata_path)
+    load_pydantic_to_db(engine, svtExtras, mstSvtExtra)
 
-        logger.info("Updating subtitle …")
-        load_subtitle(engine, region, master_folder)
 
-        logger.info("Updating parsed skill and td …")
-        load_skill_td_lv(engine, repo_folder)
+def create_rayshift_table(engine: Engine) -> None:  # pragma: no cover
+    with engine.begin() as conn:
+        rayshiftQuest.create(conn, checkfirst=True)
 
-        logger.info("Updating event …")
-        load_event(engine, repo_folder)
 
-        logger.info("Updating item …")
-        load_item(engine, repo_folder)
+def get_region_db_jobs(
+    region: Region,
+    repo_folder: DirectoryPath,
+    changed_files: Optional[set[str]] = None,
+    load_master: bool = True,
+    load_svt_extra: bool = True,
+    publish_run: Optional[PublishRun] = None,
+) -> list[ImportJob]:
+    """
+    Return the jobs that load the region's master data into the staging schema
+    and swap the loaded tables in once all of them finished.
+    Every job writes different tables so they can run concurrently.
+    load_master and load_svt_extra select the master tables and the svt extra table.
+    Pass the same publish_run to the jobs of the staging cycles of one import so
+    they are published as one generation.
+    """
+    engine = engines[region]
+    staged_engine = get_staging_engine(engine)
+    master_folder = repo_folder / "master"
+    job_prefix = f"{region.name}:db"
+
+    load_jobs = [
+        ImportJob(
+            f"{job_prefix}:{table.name}",
+            partial(load_master_table, staged_engine, region, master_folder, table),
+            master_files=get_master_file_paths(repo_folder, [table.name]),
+        )
+        for table in TABLES_TO_BE_LOADED
+        if load_master and is_master_changed(changed_files, [table.name])
+    ]
+
+    derived_jobs: list[tuple[str, list[str], Callable[[], None]]] = [
+        (
+            "subtitle",
+            ["globalNewMstSubtitle"],
+            partial(load_subtitle, staged_engine, region, master_folder),
+        ),
+        (
+            "skill_td_lv",
+            SKILL_TD_LV_MASTER_FILES,
+            partial(load_skill_td_lv, staged_engine, repo_folder),
+        ),
+        (
+            "event",
+            EVENT_MASTER_FILES,
+            partial(load_event, staged_engine, repo_folder),
+        ),
+        (
+            "item",
+            ITEM_MASTER_FILES,
+            partial(load_item, staged_engine, repo_folder),
+        ),
+    ]
+    if not load_master:
+        derived_jobs = []
+    if load_svt_extra:
+        derived_jobs.append(
+            (
+                "svt_extra",
+                EXTRA_SVT_MASTER_FILES,
+                partial(load_svt_extra_db, staged_engine, region, repo_folder),
+            )
+        )
+    load_jobs += [
+        ImportJob(
+            f"{job_prefix}:{name}",
+            func,
+            master_files=get_master_file_paths(repo_folder, master_files),
+        )
+        for name, master_files, func in derived_jobs
+        if is_master_changed(changed_files, master_files)
+    ]
+
+    if load_master and (
+        is_master_changed(changed_files, ["mstQuest"])
+        or is_script_changed(changed_files)
+    ):
+        load_jobs.append(
+            ImportJob(
+                f"{job_prefix}:script_list",
+                partial(load_script_list, staged_engine, repo_folder),
+                master_files=get_master_file_paths(repo_folder, ["mstQuest"]),
+            )
+        )
 
-        logger.info("Updating script list …")
-        load_script_list(engine, repo_folder)
+    rayshift_job = ImportJob(
+        f"{job_prefix}:rayshift", partial(create_rayshift_table, engine)
+    )
+    if not load_jobs:
+        return [rayshift_job]
 
-        with engine.begin() as conn:
-            rayshiftQuest.create(conn, checkfirst=True)
+    staging_job = ImportJob(
+        f"{job_prefix}:staging", partial(prepare_staging_schema, engine)
+    )
+    for job in load_jobs:
+        job.depends.append(staging_job.name)
+    publish_job = ImportJob(
+        f"{job_prefix}:publish",
+        partial((publish_run or PublishRun()).publish, engine),
+        [job.name for job in load_jobs],
+    )
 
-    db_loading_time = time.perf_counter() - start_loading_time
-    logger.info(f"Loaded db in {db_loading_time:.2f}s.")
+    return [staging_job, *load_jobs, publish_job, rayshift_job]
+
+
+def get_db_jobs(
+    region_path: dict[Region, DirectoryPath],
+    changed_files: Optional[RegionChangedFiles] = None,
+    load_master: bool = True,
+    load_svt_extra: bool = True,
+    publish_run: Optional[PublishRun] = None,
+) -> list[ImportJob]:
+    return [
+        job
+        for region, repo_folder in region_path.items()
+        for job in get_region_db_jobs(
+            region,
+            repo_folder,
+            get_region_changed_files(changed_files, region),
+            load_master,
+            load_svt_extra,
+            publish_run,
+        )
+    ]
 
 
 def load_rayshift_quest_list(region: Region, quest_list: list[QuestList]) -> None:
@@ -331,3 +477,27 @@ def load_rayshift_quest_details(
 ) -> None:
     with engines[region].begin() as conn:
         insert_rayshift_quest_db_sync(conn, quest_details)
+
+
+RAYSHIFT_QUERY_IDS_PER_REQUEST = 25
+
+
+def load_rayshift_data(region: Region) -> None:  # pragma: no cover
+    """Cache the rayshift quest list and the missing quest details in the DB"""
+    logger.info(f"Loading {region} rayshift data cache …")
+    start_loading_time = time.perf_counter()
+
+    quest_list = get_all_quest_lists(region)
+    load_rayshift_quest_list(region, quest_list)
+
+    query_ids = get_missing_query_ids(region)
+    logger.info(f"Loading {len(query_ids)} {region} rayshift query IDs …")
+    for i in range(0, len(query_ids), RAYSHIFT_QUERY_IDS_PER_REQUEST):
+        request_query_ids = query_ids[i : i + RAYSHIFT_QUERY_IDS_PER_REQUEST]
+        quest_details = get_multiple_quests(region, request_query_ids)
+        load_rayshift_quest_details(region, quest_details)
+        loaded_count = min(i + RAYSHIFT_QUERY_IDS_PER_REQUEST, len(query_ids))
+        logger.debug(f"Loaded {loaded_count} {region} rayshift query IDs.")
+
+    rayshift_load_time = time.perf_counter() - start_loading_time
+    logger.info(f"Loaded {region} rayshift in {rayshift_load_time:.2f}s.")
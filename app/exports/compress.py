@@ -0,0 +1,152 @@
+import asyncio
+import os
+import zlib
+from pathlib import Path
+from typing import Callable, Optional, Protocol, cast
+
+from fastapi.concurrency import run_in_threadpool
+
+from .writer import DeferredReplaces, get_temp_path
+
+
+try:
+    import brotli
+
+    HAS_BROTLI = True
+except ImportError:  # pragma: no cover
+    HAS_BROTLI = False
+
+try:
+    import zstandard
+
+    HAS_ZSTANDARD = True
+except ImportError:  # pragma: no cover
+    HAS_ZSTANDARD = False
+
+
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+# Higher levels are several times slower for a few percent smaller files
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+ZSTD_LEVEL = 10
+
+# Content-Encoding: file suffix, in the order they are preferred
+ENCODING_SUFFIXES = {"br": ".br", "zstd": ".zst", "gzip": ".gz"}
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes:
+        ...
+
+    def flush(self) -> bytes:
+        ...
+
+
+class BrotliCompressor:
+    def __init__(self) -> None:
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)  # type: ignore
+
+    def flush(self) -> bytes:
+        return self.compressor.finish()  # type: ignore
+
+
+def get_gzip_compressor() -> Compressor:
+    # wbits 31 writes the gzip header without a timestamp
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+def get_zstd_compressor() -> Compressor:
+    return cast(Compressor, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj())
+
+
+def get_compressors() -> dict[str, Callable[[], Compressor]]:
+    """Return the available compressors. brotli and zstandard are optional."""
+    compressors: dict[str, Callable[[], Compressor]] = {}
+    if HAS_BROTLI:
+        compressors["br"] = BrotliCompressor
+    if HAS_ZSTANDARD:
+        compressors["zstd"] = get_zstd_compressor
+    compressors["gzip"] = get_gzip_compressor
+    return compressors
+
+
+def get_compressed_path(path: Path, encoding: str) -> Path:
+    return path.with_name(path.name + ENCODING_SUFFIXES[encoding])
+
+
+def compress_file(
+    path: Path,
+    encoding: str,
+    compressor: Compressor,
+    source_path: Optional[Path] = None,
+    deferred: Optional[DeferredReplaces] = None,
+) -> None:
+    """
+    Atomically write the compressed sibling of path.
+    The content is read from source_path if given.
+    With deferred, the sibling is replaced when deferred is committed.
+    """
+    compressed_path = get_compressed_path(path, encoding)
+    temp_path = get_temp_path(compressed_path)
+    try:
+        with open(source_path or path, "rb") as in_fp, open(temp_path, "wb") as out_fp:
+            while chunk := in_fp.read(COMPRESS_CHUNK_SIZE):
+                out_fp.write(compressor.compress(chunk))
+            out_fp.write(compressor.flush())
+        if deferred is None:
+            os.replace(temp_path, compressed_path)
+    except BaseException:
+        if temp_path.exists():
+            temp_path.unlink()
+        raise
+    else:
+        if deferred is not None:
+            deferred.add(temp_path, compressed_path)
+
+
+def is_compressed_file_current(path: Path, encoding: str) -> bool:
+    """Whether the compressed sibling exists and was written after path"""
+    try:
+        compressed_mtime = get_compressed_path(path, encoding).stat().st_mtime_ns
+    except OSError:
+        return False
+    return compressed_mtime >= path.stat().st_mtime_ns
+
+
+async def write_compressed_files(
+    path: Path,
+    compressors: Optional[dict[str, Callable[[], Compressor]]] = None,
+    source_path: Optional[Path] = None,
+    deferred: Optional[DeferredReplaces] = None,
+) -> list[str]:
+    """
+    Write the precompressed siblings of path that are missing or older than path
+    in threads. Siblings that are up to date are left untouched.
+    If source_path has the new content of path, all the siblings are written
+    from it. See compress_file for deferred.
+    Return the encodings that were written.
+    """
+    if compressors is None:
+        compressors = get_compressors()
+    encodings = [
+        encoding
+        for encoding in compressors
+        if source_path is not None or not is_compressed_file_current(path, encoding)
+    ]
+    await asyncio.gather(
+        *(
+            run_in_threadpool(
+                compress_file,
+                path,
+                encoding,
+                compressors[encoding](),
+                source_path,
+                deferred,
+            )
+            for encoding in encodings
+        )
+    )
+    return encodings
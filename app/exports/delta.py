@@ -0,0 +1,118 @@
+import shutil
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import orjson
+
+from ..schemas.common import RepoInfo
+from .writer import WRITE_BUFFER_SIZE, ArrayWriter, HashingFile
+
+
+DELTA_FOLDER = "delta"
+# Number of delta folders, one per pair of consecutive data versions, to keep
+DELTA_KEEP_COUNT = 30
+
+
+def get_delta_path(
+    base_export_path: Path,
+    previous_version: Optional[RepoInfo],
+    data_version: Optional[RepoInfo],
+) -> Optional[Path]:
+    """
+    Return the folder of the delta files from previous_version to data_version.
+    Return None if either version is unknown or they are the same.
+    """
+    if (
+        previous_version is None
+        or data_version is None
+        or previous_version.hash == data_version.hash
+    ):
+        return None
+    return (
+        base_export_path / DELTA_FOLDER / f"{previous_version.hash}-{data_version.hash}"
+    )
+
+
+class DeltaWriter(ArrayWriter):
+    """
+    Write the entities of an export array that were added or changed since the
+    previous export with their new JSON, and the IDs of the removed entities:
+    {"from": RepoInfo, "to": RepoInfo, "items": [JSON of the added and changed
+    entities], "added": [IDs], "changed": [IDs], "removed": [IDs]}
+    Items written without an entity are left out.
+    """
+
+    def __init__(
+        self,
+        fp: HashingFile,
+        path: Path,
+        previous_version: RepoInfo,
+        data_version: RepoInfo,
+        previous_ids: Iterable[int],
+        get_previous_json: Callable[[int], Optional[bytes]],
+        buffer_size: int = WRITE_BUFFER_SIZE,
+    ):
+        super().__init__(fp, buffer_size)
+        self.path = path
+        self.get_previous_json = get_previous_json
+        self.removed_ids = set(previous_ids)
+        self.added_ids: list[int] = []
+        self.changed_ids: list[int] = []
+        self.buffer += b'{"from":%b,"to":%b,"items":[' % (
+            previous_version.json().encode("utf-8"),
+            data_version.json().encode("utf-8"),
+        )
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added_ids or self.changed_ids or self.removed_ids)
+
+    def add_item(self, item: bytes) -> None:
+        if self.item_count:
+            self.buffer += b","
+        self.buffer += item
+
+    async def write(
+        self, item: bytes, entity: Optional[tuple[int, str]] = None
+    ) -> None:
+        if entity is None:
+            return
+        entity_id = entity[0]
+        if entity_id in self.removed_ids:
+            self.removed_ids.remove(entity_id)
+            if self.get_previous_json(entity_id) == item:
+                return
+            self.changed_ids.append(entity_id)
+        else:
+            self.added_ids.append(entity_id)
+        await super().write(item)
+
+    async def close(self) -> None:
+        self.buffer += b'],"added":%b,"changed":%b,"removed":%b}' % (
+            orjson.dumps(self.added_ids),
+            orjson.dumps(self.changed_ids),
+            orjson.dumps(sorted(self.removed_ids)),
+        )
+        await self.flush()
+
+
+def prune_delta_folders(base_export_path: Path, keep_count: int) -> int:
+    """
+    Delete the empty delta folders and all but the keep_count newest ones.
+    Return the number of deleted folders.
+    """
+    delta_folder = base_export_path / DELTA_FOLDER
+    if not delta_folder.exists():
+        return 0
+    folders = sorted(
+        (path for path in delta_folder.iterdir() if path.is_dir()),
+        key=lambda path: path.stat().st_mtime_ns,
+        reverse=True,
+    )
+    non_empty_folders = [folder for folder in folders if any(folder.iterdir())]
+    deleted_folders = [
+        folder for folder in folders if folder not in non_empty_folders[:keep_count]
+    ]
+    for folder in deleted_folders:
+        shutil.rmtree(folder)
+    return len(deleted_folders)
@@ -0,0 +1,334 @@
+import hashlib
+import mmap
+from contextlib import AsyncExitStack, asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Optional, Sequence
+
+from pydantic import BaseModel
+
+from ..config import project_root
+from ..schemas.base import BaseModelORJson
+from ..schemas.common import RepoInfo
+from .compress import write_compressed_files
+from .delta import DeltaWriter, get_delta_path
+from .render import dumps_model_data, get_model_data
+from .writer import (
+    EXPORT_FORMATS,
+    ArrayWriter,
+    DeferredReplaces,
+    HashingFile,
+    atomic_write,
+)
+
+
+EXPORT_INDEX_FILE = ".export_index.json"
+
+
+class ExportFileInfo(BaseModelORJson):
+    sha256: str
+    size: int
+    mtimeNs: int
+    # Data version of the export that last changed the file
+    dataVersion: Optional[RepoInfo] = None
+    # entity ID: (entity hash, offset, length) of the entity's JSON in the file
+    entities: dict[int, tuple[str, int, int]] = {}
+
+
+class ExportIndex(BaseModelORJson):
+    # Fragments rendered with a different salt can't be reused
+    salt: str = ""
+    dataVersion: Optional[RepoInfo] = None
+    files: dict[str, ExportFileInfo] = {}
+
+
+def get_export_salt(*values: str) -> str:
+    """
+    Hash of the values and the app's code and mapping files.
+    Changing any of them can change how the same raw entity is rendered.
+    """
+    salt_hash = hashlib.sha256()
+    for value in values:
+        salt_hash.update(value.encode("utf-8"))
+    app_path = project_root / "app"
+    for path in sorted(app_path.rglob("*")):
+        if path.suffix in (".py", ".json") and "__pycache__" not in path.parts:
+            salt_hash.update(path.relative_to(app_path).as_posix().encode("utf-8"))
+            salt_hash.update(path.read_bytes())
+    return salt_hash.hexdigest()
+
+
+def get_content_hash(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def get_entity_hash(raw_entity: BaseModel, *dependencies: BaseModel) -> str:
+    """
+    Content hash of all the raw inputs of an entity.
+    dependencies are the rows fetched while rendering it that aren't in the entity.
+    """
+    return get_content_hash(
+        b"".join(
+            dumps_model_data(model, get_model_data(model))
+            for model in (raw_entity, *dependencies)
+        )
+    )
+
+
+def load_export_index(base_export_path: Path) -> ExportIndex:
+    """
+    Load the index of the previous export.
+    Files that were changed since they were exported are left out.
+    """
+    try:
+        export_index = ExportIndex.parse_raw(
+            (base_export_path / EXPORT_INDEX_FILE).read_bytes()
+        )
+    except (OSError, ValueError):
+        return ExportIndex()
+
+    valid_files: dict[str, ExportFileInfo] = {}
+    for file_name, file_info in export_index.files.items():
+        try:
+            file_stat = (base_export_path / file_name).stat()
+        except OSError:
+            continue
+        if file_stat.st_size == file_info.size and (
+            file_stat.st_mtime_ns == file_info.mtimeNs
+        ):
+            valid_files[file_name] = file_info
+    export_index.files = valid_files
+    return export_index
+
+
+class ExportArrayWriter:
+    """Write the items of an array to the writers of each file format"""
+
+    def __init__(self, writers: Sequence[ArrayWriter]):
+        self.writers = writers
+
+    async def write(
+        self, item: bytes, entity: Optional[tuple[int, str]] = None
+    ) -> None:
+        for writer in self.writers:
+            await writer.write(item, entity)
+
+
+class RegionExport:
+    """
+    Write the export files of a region and keep an index of their hashes.
+    Files whose content didn't change since the previous export are left untouched
+    and entities whose raw inputs didn't change can reuse their previous JSON.
+    Each export is written in all the file formats, see EXPORT_FORMATS.
+    With precompress, the .gz, .br and .zst siblings of the files are written too.
+    If the data version changed since the previous export, the entities of the JSON
+    arrays that were added, changed or removed are written to delta files.
+    The new files replace the previous ones together when swap is called,
+    so the previous export stays in place while the new one is generated.
+    """
+
+    def __init__(
+        self,
+        base_export_path: Path,
+        salt: str,
+        precompress: bool = False,
+        data_version: Optional[RepoInfo] = None,
+        file_formats: Sequence[str] = ("json",),
+    ):
+        self.base_export_path = base_export_path
+        self.precompress = precompress
+        self.file_formats = file_formats
+        self.data_version = data_version
+        self.previous_index = load_export_index(base_export_path)
+        self.index = ExportIndex(salt=salt, dataVersion=data_version)
+        self.reuse_entities = self.previous_index.salt == salt
+        self.unchanged_files: set[str] = set()
+        self.previous_files: dict[str, mmap.mmap] = {}
+        self.delta_path = get_delta_path(
+            base_export_path, self.previous_index.dataVersion, data_version
+        )
+        # JSON file name: delta file name relative to base_export_path
+        self.delta_files: dict[str, str] = {}
+        self.deferred = DeferredReplaces()
+
+    def get_path(self, file_name: str) -> Path:
+        return self.base_export_path / file_name
+
+    async def add_file(
+        self,
+        file_name: str,
+        fp: HashingFile,
+        entities: Optional[dict[int, tuple[str, int, int]]] = None,
+    ) -> None:
+        data_version = self.data_version
+        if not fp.changed:
+            self.unchanged_files.add(file_name)
+            previous_data_version = self.previous_index.files[file_name].dataVersion
+            if previous_data_version is not None:
+                data_version = previous_data_version
+        self.index.files[file_name] = ExportFileInfo(
+            sha256=fp.sha256,
+            size=fp.size,
+            mtimeNs=fp.path.stat().st_mtime_ns,
+            dataVersion=data_version,
+            entities=entities or {},
+        )
+        if self.precompress:
+            if fp.changed:
+                await write_compressed_files(
+                    self.get_path(file_name),
+                    source_path=fp.path,
+                    deferred=self.deferred,
+                )
+            else:
+                await write_compressed_files(self.get_path(file_name))
+
+    def get_previous_sha256(self, file_name: str) -> Optional[str]:
+        file_info = self.previous_index.files.get(file_name)
+        return file_info.sha256 if file_info else None
+
+    @asynccontextmanager
+    async def open(self, file_name: str) -> AsyncIterator[HashingFile]:
+        async with atomic_write(
+            self.get_path(file_name),
+            self.get_previous_sha256(file_name),
+            self.deferred,
+        ) as fp:
+            yield fp
+        await self.add_file(file_name, fp)
+
+    async def write_object(self, export_name: str, json_content: bytes) -> None:
+        """Write the serialized JSON object in all the file formats"""
+        for file_format in self.file_formats:
+            extension, _, convert = EXPORT_FORMATS[file_format]
+            async with self.open(f"{export_name}{extension}") as fp:
+                await fp.write(convert(json_content))
+
+    @asynccontextmanager
+    async def open_array(self, export_name: str) -> AsyncIterator[ExportArrayWriter]:
+        """Write an array of serialized JSON items in all the file formats"""
+        writers: dict[str, ArrayWriter] = {}
+        async with AsyncExitStack() as stack:
+            for file_format in self.file_formats:
+                extension, writer_class, _ = EXPORT_FORMATS[file_format]
+                file_name = f"{export_name}{extension}"
+                fp = await stack.enter_async_context(
+                    atomic_write(
+                        self.get_path(file_name),
+                        self.get_previous_sha256(file_name),
+                        self.deferred,
+                    )
+                )
+                writers[file_name] = writer_class(fp)
+            delta_writer = await self.open_delta(stack, f"{export_name}.json")
+            yield ExportArrayWriter(
+                [*writers.values(), *([delta_writer] if delta_writer else [])]
+            )
+            for writer in writers.values():
+                await writer.close()
+            if delta_writer is not None:
+                await delta_writer.close()
+                if not delta_writer.has_changes:
+                    delta_writer.fp.discard()
+        for file_name, writer in writers.items():
+            await self.add_file(file_name, writer.fp, writer.entities)
+        if delta_writer is not None and delta_writer.fp.changed:
+            self.delta_files[f"{export_name}.json"] = delta_writer.path.relative_to(
+                self.base_export_path
+            ).as_posix()
+
+    async def open_delta(
+        self, stack: AsyncExitStack, file_name: str
+    ) -> Optional[DeltaWriter]:
+        file_info = self.previous_index.files.get(file_name)
+        if (
+            self.delta_path is None
+            or self.data_version is None
+            or self.previous_index.dataVersion is None
+            or file_info is None
+            or not file_info.entities
+        ):
+            return None
+        self.delta_path.mkdir(parents=True, exist_ok=True)
+        delta_file_path = self.delta_path / file_name
+        fp = await stack.enter_async_context(
+            atomic_write(delta_file_path, deferred=self.deferred)
+        )
+        return DeltaWriter(
+            fp,
+            delta_file_path,
+            self.previous_index.dataVersion,
+            self.data_version,
+            file_info.entities.keys(),
+            lambda entity_id: self.read_previous_entity(file_name, entity_id),
+        )
+
+    def read_previous_entity(self, file_name: str, entity_id: int) -> Optional[bytes]:
+        """
+        Return the entity's JSON in the previous export of file_name.
+        The previous file must be read before the new file replaces it.
+        """
+        file_info = self.previous_index.files.get(file_name)
+        if file_info is None:
+            return None
+        entity = file_info.entities.get(entity_id)
+        if entity is None:
+            return None
+
+        if file_name not in self.previous_files:
+            with open(self.get_path(file_name), "rb") as fp:
+                self.previous_files[file_name] = mmap.mmap(
+                    fp.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        _, offset, length = entity
+        return self.previous_files[file_name][offset : offset + length]
+
+    def get_previous_entity(
+        self, export_name: str, entity_id: int, entity_hash: str
+    ) -> Optional[bytes]:
+        """
+        Return the entity's JSON in the previous export
+        if the entity's raw inputs have the same hash.
+        """
+        file_name = f"{export_name}.json"
+        file_info = self.previous_index.files.get(file_name)
+        if not self.reuse_entities or file_info is None:
+            return None
+        entity = file_info.entities.get(entity_id)
+        if entity is None or entity[0] != entity_hash:
+            return None
+        return self.read_previous_entity(file_name, entity_id)
+
+    def get_previous_entities(
+        self, export_names: list[str], entity_id: int, entity_hash: str
+    ) -> Optional[dict[str, bytes]]:
+        """Return the entity's previous JSON in each export if it's in all of them"""
+        previous_json: dict[str, bytes] = {}
+        for export_name in export_names:
+            entity_json = self.get_previous_entity(export_name, entity_id, entity_hash)
+            if entity_json is None:
+                return None
+            previous_json[export_name] = entity_json
+        return previous_json
+
+    def close_previous_files(self) -> None:
+        for previous_file in self.previous_files.values():
+            previous_file.close()
+        self.previous_files.clear()
+
+    def swap(self) -> int:
+        """
+        Replace the previous files with the new ones.
+        Return the number of replaced files, including the compressed siblings.
+        """
+        self.close_previous_files()
+        return self.deferred.commit()
+
+    def discard(self) -> None:
+        """Delete the new files and keep the previous export"""
+        self.close_previous_files()
+        self.deferred.rollback()
+
+    async def save_index(self) -> None:
+        """Save the index of the new files. Call it after swap."""
+        async with atomic_write(self.base_export_path / EXPORT_INDEX_FILE) as fp:
+            await fp.write(self.index.json().encode("utf-8"))
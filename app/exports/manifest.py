@@ -0,0 +1,141 @@
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+from ..config import logger
+from ..schemas.base import BaseModelORJson
+from ..schemas.common import Region, RepoInfo
+from .compress import ENCODING_SUFFIXES, get_compressed_path, is_compressed_file_current
+from .index import RegionExport
+from .writer import atomic_write, get_temp_path
+
+
+MANIFEST_FILE = "manifest.json"
+# Content-addressed copies of the export files that never change
+HASHED_FOLDER = "hashed"
+HASHED_NAME_LENGTH = 16
+
+
+class ExportManifestFile(BaseModelORJson):
+    name: str
+    size: int
+    sha256: str
+    # Data version of the export that last changed the file
+    dataVersion: Optional[RepoInfo] = None
+    url: str
+    # Changes since the previous data version, see DeltaWriter
+    deltaUrl: Optional[str] = None
+
+
+class ExportManifest(BaseModelORJson):
+    region: Region
+    dataVersion: Optional[RepoInfo] = None
+    files: list[ExportManifestFile] = []
+
+
+def get_hashed_file_name(file_name: str, sha256: str) -> str:
+    path = Path(file_name)
+    return f"{path.stem}.{sha256[:HASHED_NAME_LENGTH]}{path.suffix}"
+
+
+def link_file(path: Path, link_path: Path) -> None:
+    """
+    Hard link path to link_path or copy it if hard links aren't supported.
+    The copy is written to a temporary file first so link_path is never partial.
+    """
+    if link_path.exists():
+        return
+    try:
+        os.link(path, link_path)
+    except OSError:
+        temp_path = get_temp_path(link_path)
+        try:
+            shutil.copy2(path, temp_path)
+            os.replace(temp_path, link_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+
+def link_hashed_file(path: Path, hashed_path: Path) -> None:
+    """Link the file and its up to date precompressed siblings to hashed_path"""
+    link_file(path, hashed_path)
+    for encoding in ENCODING_SUFFIXES:
+        if is_compressed_file_current(path, encoding):
+            link_file(
+                get_compressed_path(path, encoding),
+                get_compressed_path(hashed_path, encoding),
+            )
+
+
+def prune_hashed_files(hashed_folder: Path, keep_file_names: set[str]) -> int:
+    """Delete the hashed files and their siblings not in keep_file_names"""
+    compressed_suffixes = set(ENCODING_SUFFIXES.values())
+    deleted_count = 0
+    for path in hashed_folder.iterdir():
+        file_name = path.stem if path.suffix in compressed_suffixes else path.name
+        if file_name not in keep_file_names:
+            path.unlink()
+            deleted_count += 1
+    return deleted_count
+
+
+def load_manifest(manifest_path: Path) -> Optional[ExportManifest]:
+    try:
+        return ExportManifest.parse_raw(manifest_path.read_bytes())
+    except (OSError, ValueError):
+        return None
+
+
+async def write_manifest(
+    region_export: RegionExport, region: Region, data_version: Optional[RepoInfo]
+) -> ExportManifest:
+    """
+    Write the content-addressed copies of the export files and manifest.json.
+    The copies listed in the previous manifest are kept for clients that
+    haven't fetched the new manifest yet.
+    """
+    base_export_path = region_export.base_export_path
+    hashed_folder = base_export_path / HASHED_FOLDER
+    hashed_folder.mkdir(exist_ok=True)
+
+    manifest = ExportManifest(region=region, dataVersion=data_version)
+    for file_name, file_info in sorted(region_export.index.files.items()):
+        hashed_file_name = get_hashed_file_name(file_name, file_info.sha256)
+        link_hashed_file(
+            region_export.get_path(file_name), hashed_folder / hashed_file_name
+        )
+        manifest.files.append(
+            ExportManifestFile(
+                name=file_name,
+                size=file_info.size,
+                sha256=file_info.sha256,
+                dataVersion=file_info.dataVersion,
+                url=f"/export/{region.value}/{HASHED_FOLDER}/{hashed_file_name}",
+                deltaUrl=(
+                    f"/export/{region.value}/{region_export.delta_files[file_name]}"
+                    if file_name in region_export.delta_files
+                    else None
+                ),
+            )
+        )
+
+    manifest_path = base_export_path / MANIFEST_FILE
+    keep_file_names = {Path(file.url).name for file in manifest.files}
+    previous_manifest = load_manifest(manifest_path)
+    if previous_manifest is not None:
+        keep_file_names |= {Path(file.url).name for file in previous_manifest.files}
+    deleted_count = prune_hashed_files(hashed_folder, keep_file_names)
+    if deleted_count:
+        logger.info(f"Deleted {deleted_count} outdated {region} hashed export files.")
+
+    previous_sha256 = (
+        hashlib.sha256(manifest_path.read_bytes()).hexdigest()
+        if manifest_path.exists()
+        else None
+    )
+    async with atomic_write(manifest_path, previous_sha256) as fp:
+        await fp.write(manifest.json(exclude_none=True).encode("utf-8"))
+    return manifest
@@ -0,0 +1,276 @@
+import hashlib
+import os
+import stat
+from mimetypes import guess_type
+from pathlib import Path
+from typing import Optional, Union
+
+import aiofiles
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, PlainTextResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Receive, Scope, Send
+
+from .compress import ENCODING_SUFFIXES
+from .manifest import HASHED_FOLDER, MANIFEST_FILE
+
+
+PathLike = Union[str, "os.PathLike[str]"]
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MEDIA_TYPES = {".ndjson": "application/x-ndjson", ".msgpack": "application/msgpack"}
+
+
+def get_cache_control(full_path: PathLike) -> Optional[str]:
+    """
+    Content-addressed files never change and can be cached forever.
+    The manifest must be revalidated every time.
+    """
+    path = Path(full_path)
+    if path.parent.name == HASHED_FOLDER:
+        return IMMUTABLE_CACHE_CONTROL
+    if path.name == MANIFEST_FILE:
+        return "no-cache"
+    return None
+
+
+def parse_accept_encoding(accept_encoding: str) -> dict[str, float]:
+    """Return the q-value of each coding in the Accept-Encoding header"""
+    codings: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, *params = item.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def select_encoding(accept_encoding: str, encodings: list[str]) -> Optional[str]:
+    """
+    Return the encoding from encodings that the client prefers.
+    Ties are broken by the order of encodings. Return None for identity.
+    """
+    codings = parse_accept_encoding(accept_encoding)
+    default_quality = codings.get("*", 0.0)
+    best_encoding: Optional[str] = None
+    best_quality = 0.0
+    for encoding in encodings:
+        quality = codings.get(encoding, default_quality)
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+    if best_quality < codings.get("identity", 0.0):
+        return None
+    return best_encoding
+
+
+def parse_range(range_header: str, file_size: int) -> Optional[tuple[int, int]]:
+    """
+    Return the (first, last) byte positions of a single byte range.
+    Return None if the header isn't a single byte range and
+    raise ValueError if the range can't be satisfied.
+    """
+    unit, _, byte_range = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in byte_range:
+        return None
+    first_str, sep, last_str = byte_range.strip().partition("-")
+    if not sep or not (first_str.isdigit() or last_str.isdigit()):
+        return None
+    if not first_str:
+        suffix_length = int(last_str)
+        if suffix_length == 0:
+            raise ValueError("Empty suffix range")
+        return max(file_size - suffix_length, 0), file_size - 1
+    first = int(first_str)
+    last = int(last_str) if last_str else file_size - 1
+    if first >= file_size:
+        raise ValueError("Range starts after the end of the file")
+    if last < first:
+        return None
+    return first, min(last, file_size - 1)
+
+
+class ExportFileResponse(FileResponse):
+    """FileResponse that can send a byte range of the file"""
+
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path: PathLike,
+        stat_result: os.stat_result,
+        headers: dict[str, str],
+        media_type: str,
+        method: str,
+        byte_range: Optional[tuple[int, int]] = None,
+        status_code: int = 200,
+    ) -> None:
+        super().__init__(
+            path,
+            status_code=status_code,
+            headers=headers,
+            media_type=media_type,
+            stat_result=stat_result,
+            method=method,
+        )
+        self.byte_range = byte_range
+        if byte_range is not None:
+            first, last = byte_range
+            self.status_code = 206
+            self.headers[
+                "content-range"
+            ] = f"bytes {first}-{last}/{stat_result.st_size}"
+            self.headers["content-length"] = str(last - first + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        async with aiofiles.open(self.path, mode="rb") as fp:
+            if self.byte_range is None:
+                remaining = None
+            else:
+                first, last = self.byte_range
+                await fp.seek(first)
+                remaining = last - first + 1
+            more_body = True
+            while more_body:
+                read_size = self.chunk_size
+                if remaining is not None:
+                    read_size = min(read_size, remaining)
+                    remaining -= read_size
+                chunk = await fp.read(read_size)
+                more_body = len(chunk) == self.chunk_size and remaining != 0
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": more_body,
+                    }
+                )
+        if self.background is not None:
+            await self.background()
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves the .br, .zst or .gz sibling of a file
+    when the client accepts the encoding and the sibling isn't older than the file.
+    Responses have a strong ETag per encoding and support single byte ranges.
+    Content-addressed files from the manifest are marked as immutable.
+    """
+
+    def get_precompressed_file(
+        self, full_path: PathLike, stat_result: os.stat_result, accept_encoding: str
+    ) -> tuple[Optional[str], PathLike, os.stat_result]:
+        encodings: dict[str, tuple[str, os.stat_result]] = {}
+        for encoding, suffix in ENCODING_SUFFIXES.items():
+            compressed_path = f"{full_path}{suffix}"
+            try:
+                compressed_stat = os.stat(compressed_path)
+            except OSError:
+                continue
+            if (
+                stat.S_ISREG(compressed_stat.st_mode)
+                and compressed_stat.st_mtime_ns >= stat_result.st_mtime_ns
+            ):
+                encodings[encoding] = (compressed_path, compressed_stat)
+
+        selected_encoding = select_encoding(accept_encoding, list(encodings))
+        if selected_encoding is None:
+            return None, full_path, stat_result
+        return (selected_encoding, *encodings[selected_encoding])
+
+    def file_response(
+        self,
+        full_path: PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        encoding, file_path, file_stat = self.get_precompressed_file(
+            full_path, stat_result, request_headers.get("accept-encoding", "")
+        )
+        etag_base = f"{file_stat.st_mtime_ns}-{file_stat.st_size}-{encoding}"
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": f'"{hashlib.md5(etag_base.encode()).hexdigest()}"',
+            "vary": "Accept-Encoding",
+        }
+        if encoding is not None:
+            headers["content-encoding"] = encoding
+        cache_control = get_cache_control(full_path)
+        if cache_control is not None:
+            headers["cache-control"] = cache_control
+        media_type = (
+            MEDIA_TYPES.get(Path(full_path).suffix)
+            or guess_type(str(full_path))[0]
+            or "text/plain"
+        )
+
+        response = ExportFileResponse(
+            file_path,
+            file_stat,
+            headers,
+            media_type,
+            scope["method"],
+            status_code=status_code,
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        if (
+            status_code != 200
+            or range_header is None
+            or (if_range is not None and if_range != headers["etag"])
+        ):
+            return response
+        try:
+            byte_range = parse_range(range_header, file_stat.st_size)
+        except ValueError:
+            return PlainTextResponse(
+                "Range Not Satisfiable",
+                status_code=416,
+                headers={"content-range": f"bytes */{file_stat.st_size}"},
+            )
+        if byte_range is None:
+            return response
+        return ExportFileResponse(
+            file_path,
+            file_stat,
+            headers,
+            media_type,
+            scope["method"],
+            byte_range,
+        )
+
+    def is_not_modified(
+        self, response_headers: Headers, request_headers: Headers
+    ) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            etag = response_headers["etag"]
+            return any(
+                tag.strip() in (etag, f"W/{etag}", "*")
+                for tag in if_none_match.split(",")
+            )
+        return super().is_not_modified(response_headers, request_headers)
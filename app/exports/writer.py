@@ -0,0 +1,219 @@
+import hashlib
+import os
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional
+
+import aiofiles
+import orjson
+from aiofiles.threadpool.binary import AsyncBufferedIOBase
+
+
+try:
+    import msgpack
+
+    HAS_MSGPACK = True
+except ImportError:  # pragma: no cover
+    HAS_MSGPACK = False
+
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def get_temp_path(path: Path) -> Path:
+    return path.with_name(f".{path.name}.{os.getpid()}.tmp")
+
+
+class HashingFile:
+    """Binary file writer that keeps track of the size and sha256 of the content"""
+
+    def __init__(self, fp: AsyncBufferedIOBase, path: Path):
+        self.fp = fp
+        self.hash = hashlib.sha256()
+        self.size = 0
+        # Whether the file at the destination was replaced. Set when the file is closed.
+        self.changed = True
+        self.discarded = False
+        # Where the content is after the file is closed. The temporary file
+        # if replacing the destination was deferred.
+        self.path = path
+
+    async def write(self, data: bytes) -> None:
+        self.hash.update(data)
+        self.size += len(data)
+        await self.fp.write(data)
+
+    def discard(self) -> None:
+        """Delete the written content instead of moving it to the destination"""
+        self.discarded = True
+
+    @property
+    def sha256(self) -> str:
+        return self.hash.hexdigest()
+
+
+class DeferredReplaces:
+    """
+    Temporary files that replace their destination together once all of them
+    are written, so the previous files stay in place until then.
+    """
+
+    def __init__(self) -> None:
+        self.replaces: list[tuple[Path, Path]] = []
+
+    def add(self, temp_path: Path, path: Path) -> None:
+        self.replaces.append((temp_path, path))
+
+    def commit(self) -> int:
+        """Move the temporary files to their destination in the order they were added"""
+        replace_count = len(self.replaces)
+        for temp_path, path in self.replaces:
+            os.replace(temp_path, path)
+        self.replaces.clear()
+        return replace_count
+
+    def rollback(self) -> None:
+        for temp_path, _ in self.replaces:
+            if temp_path.exists():
+                temp_path.unlink()
+        self.replaces.clear()
+
+
+@asynccontextmanager
+async def atomic_write(
+    path: Path,
+    previous_sha256: Optional[str] = None,
+    deferred: Optional[DeferredReplaces] = None,
+) -> AsyncIterator[HashingFile]:
+    """
+    Open a temporary file next to path for writing and rename it to path
+    when the context exits without error, or when deferred is committed.
+    Readers only ever see the previous file or the complete new file.
+    If the written content has the previous_sha256 hash, the file at path
+    is left untouched so its mtime doesn't change. The same happens if the file
+    was discarded.
+    """
+    temp_path = get_temp_path(path)
+    keep_temp_file = False
+    try:
+        async with aiofiles.open(temp_path, "wb") as fp:
+            hashing_file = HashingFile(fp, path)
+            yield hashing_file
+        if hashing_file.discarded or (
+            hashing_file.sha256 == previous_sha256 and path.exists()
+        ):
+            hashing_file.changed = False
+        elif deferred is not None:
+            deferred.add(temp_path, path)
+            hashing_file.path = temp_path
+            keep_temp_file = True
+        else:
+            os.replace(temp_path, path)
+    finally:
+        if not keep_temp_file and temp_path.exists():
+            temp_path.unlink()
+
+
+class ArrayWriter(ABC):
+    """
+    Write an array one serialized JSON item at a time.
+    Items are buffered up to buffer_size bytes before being written to the file.
+    """
+
+    def __init__(self, fp: HashingFile, buffer_size: int = WRITE_BUFFER_SIZE):
+        self.fp = fp
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.item_count = 0
+        # entity ID: (entity hash, offset, length) of the items written with an entity
+        self.entities: dict[int, tuple[str, int, int]] = {}
+
+    @abstractmethod
+    def add_item(self, item: bytes) -> None:
+        """Add the serialized item to the buffer"""
+
+    async def write(
+        self, item: bytes, entity: Optional[tuple[int, str]] = None
+    ) -> None:
+        """Write the item. entity is the (ID, content hash) of the item's entity."""
+        self.add_item(item)
+        self.item_count += 1
+        if len(self.buffer) >= self.buffer_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if self.buffer:
+            await self.fp.write(bytes(self.buffer))
+            self.buffer.clear()
+
+    async def close(self) -> None:
+        await self.flush()
+
+
+class JsonArrayWriter(ArrayWriter):
+    """Write a JSON array and record the position of the entities' JSON"""
+
+    def __init__(self, fp: HashingFile, buffer_size: int = WRITE_BUFFER_SIZE):
+        super().__init__(fp, buffer_size)
+        self.buffer += b"["
+
+    def add_item(self, item: bytes) -> None:
+        if self.item_count:
+            self.buffer += b","
+        self.buffer += item
+
+    async def write(
+        self, item: bytes, entity: Optional[tuple[int, str]] = None
+    ) -> None:
+        if entity is not None:
+            entity_id, entity_hash = entity
+            offset = self.fp.size + len(self.buffer) + (1 if self.item_count else 0)
+            self.entities[entity_id] = (entity_hash, offset, len(item))
+        await super().write(item)
+
+    async def close(self) -> None:
+        self.buffer += b"]"
+        await self.flush()
+
+
+class NdjsonWriter(ArrayWriter):
+    """Write newline-delimited JSON, one item per line"""
+
+    def add_item(self, item: bytes) -> None:
+        self.buffer += item
+        self.buffer += b"\n"
+
+
+class MsgpackWriter(ArrayWriter):
+    """Write a stream of MessagePack objects, one per item"""
+
+    def add_item(self, item: bytes) -> None:
+        self.buffer += dumps_msgpack(item)
+
+
+def dumps_msgpack(json_content: bytes) -> bytes:
+    """Convert serialized JSON to MessagePack"""
+    packed: bytes = msgpack.packb(orjson.loads(json_content))
+    return packed
+
+
+# File format: (file extension, array writer, function that converts serialized JSON)
+EXPORT_FORMATS: dict[str, tuple[str, type[ArrayWriter], Callable[[bytes], bytes]]] = {
+    "json": (".json", JsonArrayWriter, lambda content: content),
+    "ndjson": (".ndjson", NdjsonWriter, lambda content: content + b"\n"),
+    "msgpack": (".msgpack", MsgpackWriter, dumps_msgpack),
+}
+
+
+@asynccontextmanager
+async def open_json_array(
+    path: Path,
+    previous_sha256: Optional[str] = None,
+    buffer_size: int = WRITE_BUFFER_SIZE,
+) -> AsyncIterator[JsonArrayWriter]:
+    """Atomically write a JSON array to path. See atomic_write and JsonArrayWriter."""
+    async with atomic_write(path, previous_sha256) as fp:
+        writer = JsonArrayWriter(fp, buffer_size)
+        yield writer
+        await writer.close()
@@ -1,5 +1,4 @@
 import hashlib
-import logging
 import time
 from math import ceil
 from typing import Any, Awaitable, Callable, Optional
@@ -10,19 +9,20 @@ from aioredis import Redis
 from fastapi import Depends, FastAPI, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
-from fastapi_cache.coder import PickleCoder
 from fastapi_limiter import FastAPILimiter  # type: ignore
-from sqlalchemy.ext.asyncio import create_async_engine
 
 from .config import SecretSettings, Settings, logger, project_root
-from .core.info import get_all_repo_info
+from .core.info import get_all_repo_info, get_data_changes
+from .db.engine import get_async_engines
+from .exports.static import PrecompressedStaticFiles
+from .redis.helpers.repo_version import get_export_status
 from .routers import basic, nice, raw, secret
+from .routers.cache import CACHE_PREFIX, ResponseCoder, TwoTierBackend
 from .routers.deps import get_redis
-from .schemas.common import Region, RepoInfo
-from .tasks import REGION_PATHS, load_and_export
+from .routers.utils import get_error_code
+from .schemas.common import CacheStats, DataChanges, ExportStatus, Region, RepoInfo
+from .tasks import REGION_PATHS, cancel_background_tasks, load_and_export
 
 
 settings = Settings()
@@ -76,6 +76,11 @@ export_links = """
 
 ### Static export files
 
+Each region's manifest ([NA](/export/NA/manifest.json), [JP](/export/JP/manifest.json))
+lists the export files with their size, SHA-256 hash, the data version that last changed them
+and a content-addressed URL that can be cached forever.
+Poll the manifest and only download the files whose hash changed.
+
 #### Full data export files
 
 Pre-generated full nice data that can be served instantly:
@@ -217,13 +222,18 @@ def custom_key_builder(
     response: Optional[Response] = None,  # pylint: disable=unused-argument
 ) -> str:
     prefix = FastAPICache.get_prefix()
+    # The namespace defaults to the router module: nice, basic or raw
+    namespace = namespace or func.__module__.rsplit(".", 1)[-1]
+    # The cache decorator passes the region of the routes using a pooled connection
     static_kwargs = {k: v for k, v in kwargs.items() if k not in {"conn", "redis"}}
-    if "region" not in kwargs and "conn" in kwargs and "region" in kwargs["conn"].info:
-        static_kwargs["region"] = kwargs["conn"].info["region"]
     raw_key = f"{func.__module__}:{func.__name__}:{args}:{orjson.dumps(static_kwargs).decode('utf-8')}"
     cache_key = hashlib.sha1(raw_key.encode("utf-8")).hexdigest()
+    # A new data version of the region switches to new keys so the outdated
+    # responses aren't served and expire or are unlinked in the background
+    backend: TwoTierBackend = FastAPICache.get_backend()
+    cache_version = backend.get_cache_version(static_kwargs.get("region"))
 
-    return f"{prefix}:{namespace}:{cache_key}"
+    return f"{prefix}:{cache_version}:{namespace}:{cache_key}"
 
 
 @app.on_event("startup")
@@ -232,36 +242,30 @@ async def startup() -> None:
     await FastAPILimiter.init(
         redis, prefix=f"{settings.redis_prefix}:limiter", callback=limiter_callback
     )
+    cache_backend = TwoTierBackend(
+        redis, settings.local_cache_size, settings.local_cache_check_interval
+    )
     FastAPICache.init(
-        RedisBackend(redis),
-        prefix=f"{settings.redis_prefix}:cache",
+        cache_backend,
+        prefix=CACHE_PREFIX,
         expire=60 * 60 * 24 * 7,
         key_builder=custom_key_builder,
-        coder=PickleCoder,  # pyright: reportGeneralTypeIssues=false
+        coder=ResponseCoder,
     )
     app.state.redis = redis
 
-    async_engines = {
-        Region.NA: create_async_engine(
-            secrets.na_postgresdsn.replace("postgresql", "postgresql+asyncpg"),
-            echo=logger.isEnabledFor(logging.DEBUG),
-            pool_size=3,
-            max_overflow=10,
-        ),
-        Region.JP: create_async_engine(
-            secrets.jp_postgresdsn.replace("postgresql", "postgresql+asyncpg"),
-            echo=logger.isEnabledFor(logging.DEBUG),
-            pool_size=3,
-            max_overflow=10,
-        ),
-    }
+    async_engines = get_async_engines()
     app.state.async_engines = async_engines
 
-    await load_and_export(redis, REGION_PATHS, async_engines)
+    # The export files are generated after startup so the API serves requests
+    # as soon as the data is loaded
+    await load_and_export(redis, REGION_PATHS, async_engines, background_exports=True)
+    await cache_backend.update_data_versions()
 
 
 @app.on_event("shutdown")
 async def shutdown() -> None:
+    await cancel_background_tasks()
     for engine in app.state.async_engines.values():
         await engine.dispose()
 
@@ -283,11 +287,63 @@ async def main_info(redis: Redis = Depends(get_redis)) -> dict[Region, RepoInfo]
     return await get_all_repo_info(redis)
 
 
+@app.get(
+    "/info/export",
+    summary="Export files generation status",
+    response_model=ExportStatus,
+    responses=get_error_code([404]),
+)
+async def export_status(redis: Redis = Depends(get_redis)) -> ExportStatus:
+    """
+    Get the state of the last generation of the export files.
+    The previous export files are served until a running generation finishes.
+    """
+    export_status = await get_export_status(redis)
+    if export_status is None:
+        raise HTTPException(status_code=404, detail="Export status not found")
+    return export_status
+
+
+@app.get("/info/cache", summary="Response cache stats", response_model=CacheStats)
+async def cache_stats() -> CacheStats:
+    """
+    Get the size of the in-memory response cache and the number of hits in memory,
+    hits in Redis and misses of each router since the worker started.
+    The stats are of the worker that handles the request.
+    """
+    backend: TwoTierBackend = FastAPICache.get_backend()
+    return backend.get_stats()
+
+
+@app.get(
+    "/changes/{region}",
+    summary="Entities changed since a data version",
+    response_model=DataChanges,
+    responses=get_error_code([404]),
+)
+async def data_changes(
+    region: Region, since: str, redis: Redis = Depends(get_redis)
+) -> DataChanges:
+    """
+    Get the IDs of the servant, equip, skill, NP, function, buff, item, event,
+    war and quest entities that were added, changed or removed
+    after the data version `since`, the gamedata hash from `/info`.
+    A change to a buff, function, skill or NP also lists the entities that embed it.
+
+    Returns 404 if the changes since that version aren't recorded anymore.
+    Fetch the entities again in that case.
+    """
+    changes = await get_data_changes(redis, region, since)
+    if changes is None:
+        raise HTTPException(status_code=404, detail=f"Changes since {since} not found")
+    return changes
+
+
 if secrets.github_webhook_secret.get_secret_value() != "":  # pragma: no cover
     app.include_router(secret.router)
 
 
-app.mount("/export", StaticFiles(directory="export"), name="export")
+app.mount("/export", PrecompressedStaticFiles(directory="export"), name="export")
 
 
 def get_swagger_ui_html(
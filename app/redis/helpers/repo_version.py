@@ -3,7 +3,7 @@ from typing import Optional
 from aioredis import Redis
 
 from ...config import Settings
-from ...schemas.common import Region, RepoInfo
+from ...schemas.common import DataChangeSet, ExportStatus, Region, RepoInfo
 
 
 settings = Settings()
@@ -23,3 +23,54 @@ async def set_repo_version(redis: Redis, region: Region, repo_info: RepoInfo) ->
     redis_key = f"{settings.redis_prefix}:repo_version:{region.name}"
     redis_data = repo_info.json()
     await redis.set(redis_key, redis_data)
+
+
+async def get_repo_hashes(redis: Redis) -> dict[Region, str]:
+    """Return the hash of the gamedata commit of each loaded region"""
+    repo_hashes: dict[Region, str] = {}
+    for region in Region:
+        repo_info = await get_repo_version(redis, region)
+        if repo_info is not None:
+            repo_hashes[region] = repo_info.hash
+    return repo_hashes
+
+
+async def get_imported_version(redis: Redis) -> Optional[str]:
+    redis_key = f"{settings.redis_prefix}:imported_version"
+    imported_version: Optional[bytes] = await redis.get(redis_key)
+    return imported_version.decode("utf-8") if imported_version else None
+
+
+async def set_imported_version(redis: Redis, data_version: str) -> None:
+    redis_key = f"{settings.redis_prefix}:imported_version"
+    await redis.set(redis_key, data_version)
+
+
+# Number of change sets kept per region. Older versions can't be used with /changes.
+CHANGE_SET_KEEP_COUNT = 200
+
+
+async def add_change_set(
+    redis: Redis, region: Region, change_set: DataChangeSet
+) -> None:
+    redis_key = f"{settings.redis_prefix}:changes:{region.name}"
+    await redis.lpush(redis_key, change_set.json())
+    await redis.ltrim(redis_key, 0, CHANGE_SET_KEEP_COUNT - 1)
+
+
+async def get_change_sets(redis: Redis, region: Region) -> list[DataChangeSet]:
+    """Return the change sets of the region from the newest"""
+    redis_key = f"{settings.redis_prefix}:changes:{region.name}"
+    change_sets: list[bytes] = await redis.lrange(redis_key, 0, -1)
+    return [DataChangeSet.parse_raw(change_set) for change_set in change_sets]
+
+
+async def get_export_status(redis: Redis) -> Optional[ExportStatus]:
+    redis_key = f"{settings.redis_prefix}:export_status"
+    export_status = await redis.get(redis_key)
+    return ExportStatus.parse_raw(export_status) if export_status else None
+
+
+async def set_export_status(redis: Redis, export_status: ExportStatus) -> None:
+    redis_key = f"{settings.redis_prefix}:export_status"
+    await redis.set(redis_key, export_status.json())
@@ -1,13 +1,17 @@
 import time
 from dataclasses import dataclass
-from typing import Any, Callable
+from functools import partial
+from typing import Any, Awaitable, Callable, Iterator, Optional
 
 import orjson
 from aioredis import Redis
+from fastapi.concurrency import run_in_threadpool
 from pydantic import DirectoryPath
 
 from ..config import Settings, logger
 from ..data.buff import get_buff_with_classrelation
+from ..data.diff import RegionChangedFiles, get_region_changed_files, is_master_changed
+from ..data.extra import EXTRA_SVT_MASTER_FILES, get_extra_svt_data
 from ..data.reverse import (
     get_active_skill_to_svt,
     get_buff_to_func,
@@ -18,6 +22,8 @@ from ..data.reverse import (
     get_skill_to_MC,
     get_td_to_svt,
 )
+from ..data.utils import get_master_file_paths, master_data
+from ..scheduler import ImportJob, run_jobs
 from ..schemas.common import Region
 from ..schemas.raw import MstSvtExtra
 from .helpers.pydantic_object import pydantic_obj_redis_table
@@ -28,21 +34,113 @@ settings = Settings()
 REDIS_DATA_PREFIX = f"{settings.redis_prefix}:data"
 
 
+REDIS_HSET_SIZE = 500
+REDIS_PIPELINE_SIZE = 20
+
+
+@dataclass
+class RedisLoadStats:
+    fields: int = 0
+    bytes: int = 0
+    max_hset_fields: int = 0
+    max_hset_bytes: int = 0
+
+    def add_hset(self, mapping: dict[Any, Any]) -> None:
+        hset_bytes = sum(
+            len(str(field)) + len(value) for field, value in mapping.items()
+        )
+        self.fields += len(mapping)
+        self.bytes += hset_bytes
+        self.max_hset_fields = max(self.max_hset_fields, len(mapping))
+        self.max_hset_bytes = max(self.max_hset_bytes, hset_bytes)
+
+
+async def swap_redis_key(redis: Redis, loading_key: str, redis_key: str) -> None:
+    """
+    Rename loading_key to redis_key in one transaction so readers either see
+    the old or the new hash. The old hash is freed in the background with UNLINK.
+    """
+    old_key = f"{redis_key}:old"
+    async with redis.pipeline(transaction=True) as pipe:
+        # The first RENAME fails if redis_key doesn't exist yet, which is fine
+        pipe.rename(redis_key, old_key)
+        pipe.rename(loading_key, redis_key)
+        _, loading_renamed = await pipe.execute(raise_on_error=False)
+    if isinstance(loading_renamed, Exception):
+        raise loading_renamed
+    await redis.unlink(old_key)
+
+
+async def load_redis_hash_batches(
+    redis: Redis, redis_key: str, batches: Iterator[dict[Any, Any]]
+) -> RedisLoadStats:
+    """
+    Write the batches into a temporary hash and swap it in place of redis_key.
+    The batches are built in the threadpool and written with pipelined HSET commands
+    of at most REDIS_HSET_SIZE fields so no single command blocks redis for long.
+    """
+    start_loading_time = time.perf_counter()
+    loading_key = f"{redis_key}:loading"
+    stats = RedisLoadStats()
+
+    await redis.unlink(loading_key)
+    async with redis.pipeline(transaction=False) as pipe:
+        while True:
+            redis_data: dict[Any, Any] = await run_in_threadpool(next, batches, {})
+            if not redis_data:
+                break
+            items = list(redis_data.items())
+            for start in range(0, len(items), REDIS_HSET_SIZE):
+                mapping = dict(items[start : start + REDIS_HSET_SIZE])
+                pipe.hset(loading_key, mapping=mapping)
+                stats.add_hset(mapping)
+                if len(pipe) >= REDIS_PIPELINE_SIZE:
+                    await pipe.execute()
+        await pipe.execute()
+
+    if stats.fields > 0:
+        await swap_redis_key(redis, loading_key, redis_key)
+    else:
+        await redis.unlink(redis_key)
+
+    loading_time = time.perf_counter() - start_loading_time
+    megabytes = stats.bytes / 1024 / 1024
+    logger.info(
+        f"Loaded {stats.fields} fields ({megabytes:.1f} MB) into {redis_key} "
+        f"in {loading_time:.2f}s ({stats.fields / loading_time:.0f} fields/s, "
+        f"{megabytes / loading_time:.1f} MB/s). Largest HSET: "
+        f"{stats.max_hset_fields} fields, {stats.max_hset_bytes} bytes."
+    )
+    return stats
+
+
+async def load_redis_hash(
+    redis: Redis, redis_key: str, redis_data: dict[Any, Any]
+) -> RedisLoadStats:
+    return await load_redis_hash_batches(redis, redis_key, iter([redis_data]))
+
+
+def get_master_redis_batches(
+    table_json: DirectoryPath, id_field: str
+) -> Iterator[dict[Any, bytes]]:
+    for batch in master_data.iter_raw(table_json):
+        yield {item[id_field]: orjson.dumps(item) for item in batch}
+
+
 async def load_pydantic_object(
-    redis: Redis, region_path: dict[Region, DirectoryPath], redis_prefix: str
+    redis: Redis,
+    region: Region,
+    gamedata_path: DirectoryPath,
+    redis_prefix: str,
+    master_file: str,
+    id_field: str,
 ) -> None:
-    for region, master_folder in region_path.items():
-        for master_file, id_field in pydantic_obj_redis_table.values():
-            table_json = master_folder / "master" / f"{master_file}.json"
-            if master_file != "mstBuff" and table_json.exists():
-                with open(table_json, "rb") as fp:
-                    master_data: list[dict[str, Any]] = orjson.loads(fp.read())
-                redis_data = {
-                    item[id_field]: orjson.dumps(item) for item in master_data
-                }
-                redis_key = f"{redis_prefix}:{region.name}:{master_file}"
-                await redis.delete(redis_key)
-                await redis.hset(redis_key, mapping=redis_data)
+    table_json = gamedata_path / "master" / f"{master_file}.json"
+    if table_json.exists():
+        redis_key = f"{redis_prefix}:{region.name}:{master_file}"
+        await load_redis_hash_batches(
+            redis, redis_key, get_master_redis_batches(table_json, id_field)
+        )
 
 
 async def load_svt_extra_redis(
@@ -52,78 +150,211 @@ async def load_svt_extra_redis(
     svtExtra_redis_data = {
         str(svtExtra.svtId): svtExtra.json() for svtExtra in svtExtras
     }
-    await redis.delete(redis_key)
-    await redis.hset(redis_key, mapping=svtExtra_redis_data)
+    await load_redis_hash(redis, redis_key, svtExtra_redis_data)
+
+
+async def load_mstSvtExtra(
+    redis: Redis, region: Region, gamedata_path: DirectoryPath
+) -> None:
+    svtExtras = await run_in_threadpool(get_extra_svt_data, region, gamedata_path)
+    await load_svt_extra_redis(redis, region, svtExtras)
+
+
+def get_mstBuff_redis_data(gamedata_path: DirectoryPath) -> dict[str, str]:
+    mstBuff_data = get_buff_with_classrelation(gamedata_path)
+    return {str(mstBuff.id): mstBuff.json() for mstBuff in mstBuff_data}
 
 
 async def load_mstBuff(
-    redis: Redis, region_path: dict[Region, DirectoryPath], redis_prefix: str
+    redis: Redis, region: Region, gamedata_path: DirectoryPath, redis_prefix: str
 ) -> None:
-    for region, repo_folder in region_path.items():
-        redis_key = f"{redis_prefix}:{region.name}:mstBuff"
-        mstBuff_data = get_buff_with_classrelation(repo_folder)
-        mstBuff_redis = {str(mstBuff.id): mstBuff.json() for mstBuff in mstBuff_data}
-        await redis.delete(redis_key)
-        await redis.hset(redis_key, mapping=mstBuff_redis)
+    redis_key = f"{redis_prefix}:{region.name}:mstBuff"
+    mstBuff_redis = await run_in_threadpool(get_mstBuff_redis_data, gamedata_path)
+    await load_redis_hash(redis, redis_key, mstBuff_redis)
+
+
+def get_mstSvtLimit_redis_batches(
+    mstSvtLimit_json: DirectoryPath,
+) -> Iterator[dict[str, bytes]]:
+    for batch in master_data.iter_raw(mstSvtLimit_json):
+        yield {
+            f'{item["svtId"]}:{item["limitCount"]}': orjson.dumps(item)
+            for item in batch
+        }
 
 
 async def load_mstSvtLimit(
-    redis: Redis, region_path: dict[Region, DirectoryPath], redis_prefix: str
+    redis: Redis, region: Region, gamedata_path: DirectoryPath, redis_prefix: str
 ) -> None:
-    for region, master_folder in region_path.items():
-        mstSvtLimit_json = master_folder / "master" / "mstSvtLimit.json"
-        if mstSvtLimit_json.exists():
-            with open(mstSvtLimit_json, "rb") as fp:
-                mstSvtLimit_data: list[dict[str, Any]] = orjson.loads(fp.read())
-            redis_data = {
-                f'{item["svtId"]}:{item["limitCount"]}': orjson.dumps(item)
-                for item in mstSvtLimit_data
-            }
-            redis_key = f"{redis_prefix}:{region.name}:mstSvtlimit"
-            await redis.delete(redis_key)
-            await redis.hset(redis_key, mapping=redis_data)
+    mstSvtLimit_json = gamedata_path / "master" / "mstSvtLimit.json"
+    if mstSvtLimit_json.exists():
+        redis_key = f"{redis_prefix}:{region.name}:mstSvtlimit"
+        await load_redis_hash_batches(
+            redis, redis_key, get_mstSvtLimit_redis_batches(mstSvtLimit_json)
+        )
 
 
 @dataclass
 class ReverseDataFunc:
     key: RedisReverse
     dataFunc: Callable[[DirectoryPath], dict[int, Any]]
+    masterFiles: list[str]
 
 
 reverse_data_detail = [
-    ReverseDataFunc(RedisReverse.BUFF_TO_FUNC, get_buff_to_func),
-    ReverseDataFunc(RedisReverse.FUNC_TO_SKILL, get_func_to_skill),
-    ReverseDataFunc(RedisReverse.FUNC_TO_TD, get_func_to_td),
-    ReverseDataFunc(RedisReverse.TD_TO_SVT, get_td_to_svt),
-    ReverseDataFunc(RedisReverse.ACTIVE_SKILL_TO_SVT, get_active_skill_to_svt),
-    ReverseDataFunc(RedisReverse.PASSIVE_SKILL_TO_SVT, get_passive_skill_to_svt),
-    ReverseDataFunc(RedisReverse.SKILL_TO_MC, get_skill_to_MC),
-    ReverseDataFunc(RedisReverse.SKILL_TO_CC, get_skill_to_CC),
+    ReverseDataFunc(RedisReverse.BUFF_TO_FUNC, get_buff_to_func, ["mstFunc"]),
+    ReverseDataFunc(
+        RedisReverse.FUNC_TO_SKILL, get_func_to_skill, ["mstSkillLv", "mstSkill"]
+    ),
+    ReverseDataFunc(
+        RedisReverse.FUNC_TO_TD,
+        get_func_to_td,
+        ["mstTreasureDeviceLv", "mstTreasureDevice"],
+    ),
+    ReverseDataFunc(RedisReverse.TD_TO_SVT, get_td_to_svt, ["mstSvtTreasureDevice"]),
+    ReverseDataFunc(
+        RedisReverse.ACTIVE_SKILL_TO_SVT, get_active_skill_to_svt, ["mstSvtSkill"]
+    ),
+    ReverseDataFunc(
+        RedisReverse.PASSIVE_SKILL_TO_SVT,
+        get_passive_skill_to_svt,
+        ["mstSvt", "mstSvtPassiveSkill", "mstSvtAppendPassiveSkill"],
+    ),
+    ReverseDataFunc(RedisReverse.SKILL_TO_MC, get_skill_to_MC, ["mstEquipSkill"]),
+    ReverseDataFunc(RedisReverse.SKILL_TO_CC, get_skill_to_CC, ["mstCommandCodeSkill"]),
 ]
 
 
+def get_reverse_redis_data(
+    data: ReverseDataFunc, gamedata_path: DirectoryPath
+) -> dict[str, bytes]:
+    reverse_data = data.dataFunc(gamedata_path)
+    return {str(k): orjson.dumps(v) for k, v in reverse_data.items()}
+
+
 async def load_reverse_data(
-    redis: Redis, region_path: dict[Region, DirectoryPath], redis_prefix: str
+    redis: Redis,
+    region: Region,
+    gamedata_path: DirectoryPath,
+    redis_prefix: str,
+    data: ReverseDataFunc,
 ) -> None:
-    for region, gamedata_path in region_path.items():
-        for data in reverse_data_detail:
-            reverse_data = data.dataFunc(gamedata_path)
-            redis_data = {str(k): orjson.dumps(v) for k, v in reverse_data.items()}
-            redis_key = f"{redis_prefix}:{region.name}:{data.key.name}"
-            await redis.delete(redis_key)
-            await redis.hset(redis_key, mapping=redis_data)
+    redis_data = await run_in_threadpool(get_reverse_redis_data, data, gamedata_path)
+    redis_key = f"{redis_prefix}:{region.name}:{data.key.name}"
+    await load_redis_hash(redis, redis_key, redis_data)
+
+
+def get_region_redis_jobs(
+    redis: Redis,
+    region: Region,
+    gamedata_path: DirectoryPath,
+    changed_files: Optional[set[str]] = None,
+    load_master: bool = True,
+    load_svt_extra: bool = True,
+) -> list[ImportJob]:
+    """
+    Return the jobs that load the region's redis hashes.
+    Each job writes a different hash so they can run concurrently.
+    load_master and load_svt_extra select the master hashes and the svt extra hash.
+    """
+    job_prefix = f"{region.name}:redis"
+    jobs = [
+        ImportJob(
+            f"{job_prefix}:{master_file}",
+            partial(
+                load_pydantic_object,
+                redis,
+                region,
+                gamedata_path,
+                REDIS_DATA_PREFIX,
+                master_file,
+                id_field,
+            ),
+            master_files=get_master_file_paths(gamedata_path, [master_file]),
+        )
+        for master_file, id_field in pydantic_obj_redis_table.values()
+        if load_master
+        and master_file not in ("mstBuff", "mstSvtExtra")
+        and is_master_changed(changed_files, [master_file])
+    ]
+
+    loaders: list[tuple[str, list[str], Callable[[], Awaitable[None]]]] = [
+        (
+            "mstSvtLimit",
+            ["mstSvtLimit"],
+            partial(load_mstSvtLimit, redis, region, gamedata_path, REDIS_DATA_PREFIX),
+        ),
+        (
+            "mstBuff",
+            ["mstBuff", "mstClassRelationOverwrite"],
+            partial(load_mstBuff, redis, region, gamedata_path, REDIS_DATA_PREFIX),
+        ),
+    ]
+    loaders += [
+        (
+            data.key.name,
+            data.masterFiles,
+            partial(
+                load_reverse_data, redis, region, gamedata_path, REDIS_DATA_PREFIX, data
+            ),
+        )
+        for data in reverse_data_detail
+    ]
+    if not load_master:
+        loaders = []
+    if load_svt_extra:
+        loaders.append(
+            (
+                "mstSvtExtra",
+                EXTRA_SVT_MASTER_FILES,
+                partial(load_mstSvtExtra, redis, region, gamedata_path),
+            )
+        )
+    jobs += [
+        ImportJob(
+            f"{job_prefix}:{name}",
+            func,
+            master_files=get_master_file_paths(gamedata_path, master_files),
+        )
+        for name, master_files, func in loaders
+        if is_master_changed(changed_files, master_files)
+    ]
+
+    return jobs
+
+
+def get_redis_jobs(
+    redis: Redis,
+    region_path: dict[Region, DirectoryPath],
+    changed_files: Optional[RegionChangedFiles] = None,
+    load_master: bool = True,
+    load_svt_extra: bool = True,
+) -> list[ImportJob]:
+    return [
+        job
+        for region, gamedata_path in region_path.items()
+        for job in get_region_redis_jobs(
+            redis,
+            region,
+            gamedata_path,
+            get_region_changed_files(changed_files, region),
+            load_master,
+            load_svt_extra,
+        )
+    ]
 
 
 async def load_redis_data(
-    redis: Redis, region_path: dict[Region, DirectoryPath]
+    redis: Redis,
+    region_path: dict[Region, DirectoryPath],
+    changed_files: Optional[RegionChangedFiles] = None,
 ) -> None:
     logger.info("Loading redis …")
     start_loading_time = time.perf_counter()
 
-    await load_pydantic_object(redis, region_path, REDIS_DATA_PREFIX)
-    await load_mstSvtLimit(redis, region_path, REDIS_DATA_PREFIX)
-    await load_mstBuff(redis, region_path, REDIS_DATA_PREFIX)
-    await load_reverse_data(redis, region_path, REDIS_DATA_PREFIX)
+    await run_jobs(
+        get_redis_jobs(redis, region_path, changed_files), settings.import_workers
+    )
 
     redis_loading_time = time.perf_counter() - start_loading_time
     logger.info(f"Loaded redis in {redis_loading_time:.2f}s.")
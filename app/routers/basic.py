@@ -2,7 +2,6 @@ from typing import Optional
 
 from aioredis import Redis
 from fastapi import APIRouter, Depends, Response
-from fastapi_cache.decorator import cache
 from sqlalchemy.ext.asyncio import AsyncConnection
 
 from ..config import Settings
@@ -34,6 +33,7 @@ from ..schemas.search import (
     SvtSearchQueryParams,
     TdSearchParams,
 )
+from .cache import cache
 from .deps import get_db, get_redis, language_parameter
 from .utils import get_error_code, item_response, list_response
 
@@ -56,7 +56,7 @@ basic_find_servant_extra = """
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_servant(
     search_param: ServantSearchQueryParams = Depends(ServantSearchQueryParams),
     lang: Optional[Language] = None,
@@ -101,7 +101,7 @@ if settings.documentation_all_nice:
     description=get_servant_description,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_servant(
     region: Region,
     servant_id: int,
@@ -124,7 +124,7 @@ async def get_servant(
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_equip(
     search_param: EquipSearchQueryParams = Depends(EquipSearchQueryParams),
     lang: Optional[Language] = None,
@@ -168,7 +168,7 @@ if settings.documentation_all_nice:
     description=get_equip_description,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_equip(
     region: Region,
     equip_id: int,
@@ -189,7 +189,7 @@ async def get_equip(
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_svt(
     search_param: SvtSearchQueryParams = Depends(SvtSearchQueryParams),
     lang: Optional[Language] = None,
@@ -215,7 +215,7 @@ async def find_svt(
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_svt(
     region: Region,
     svt_id: int,
@@ -254,7 +254,7 @@ if settings.documentation_all_nice:
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_mystic_code(
     region: Region,
     mc_id: int,
@@ -286,7 +286,7 @@ if settings.documentation_all_nice:
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_command_code(
     region: Region,
     cc_id: int,
@@ -314,7 +314,7 @@ and return the reverse skill objects.
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_skill(
     search_param: SkillSearchParams = Depends(SkillSearchParams),
     reverse: bool = False,
@@ -347,7 +347,7 @@ async def find_skill(
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_skill(
     region: Region,
     skill_id: int,
@@ -376,7 +376,7 @@ and return the reversed servant objects.
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_td(
     search_param: TdSearchParams = Depends(TdSearchParams),
     reverse: bool = False,
@@ -404,7 +404,7 @@ async def find_td(
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_td(
     region: Region,
     np_id: int,
@@ -432,7 +432,7 @@ and return the reversed skill objects.
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_function(
     search_param: FuncSearchQueryParams = Depends(FuncSearchQueryParams),
     reverse: bool = False,
@@ -462,7 +462,7 @@ async def find_function(
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_function(
     region: Region,
     func_id: int,
@@ -495,7 +495,7 @@ and return the reversed function objects.
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_buff(
     search_param: BuffSearchQueryParams = Depends(BuffSearchQueryParams),
     reverse: bool = False,
@@ -524,7 +524,7 @@ async def find_buff(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_buff(
     region: Region,
     buff_id: int,
@@ -546,7 +546,7 @@ async def get_buff(
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_event(
     event_id: int,
     lang: Language = Depends(language_parameter),
@@ -566,7 +566,7 @@ async def get_event(
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_war(
     war_id: int,
     lang: Language = Depends(language_parameter),
@@ -585,7 +585,7 @@ async def get_war(
     response_model=list[BasicQuestPhase],
     response_model_exclude_unset=True,
 )
-@cache(expire=settings.quest_cache_length)  # type: ignore
+@cache(expire=settings.quest_cache_length)
 async def get_latest_quest_phase_with_enemies(
     conn: AsyncConnection = Depends(get_db),
     lang: Language = Depends(language_parameter),
@@ -605,7 +605,7 @@ async def get_latest_quest_phase_with_enemies(
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache(expire=settings.quest_cache_length)  # type: ignore
+@cache(expire=settings.quest_cache_length)
 async def find_quest_phase(
     search_param: QuestSearchQueryParams = Depends(QuestSearchQueryParams),
     conn: AsyncConnection = Depends(get_db),
@@ -625,7 +625,7 @@ async def find_quest_phase(
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_quest_phase(
     quest_id: int,
     phase: int,
@@ -649,7 +649,7 @@ async def get_quest_phase(
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_quest(
     quest_id: int,
     conn: AsyncConnection = Depends(get_db),
@@ -0,0 +1,545 @@
+import asyncio
+import inspect
+import struct
+import time
+import zlib
+from collections import Counter, OrderedDict
+from contextlib import suppress
+from dataclasses import dataclass
+from enum import IntEnum
+from functools import wraps
+from typing import Any, Awaitable, Callable, Mapping, Optional, TypeVar, cast
+
+from aioredis import Redis
+from aioredis.exceptions import LockError
+from fastapi import Request, params, status
+from fastapi.responses import Response
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends import Backend
+from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.coder import Coder
+
+from ..config import Settings, app_version
+from ..exports.index import get_content_hash
+from ..redis.helpers.repo_version import get_repo_hashes
+from ..schemas.common import CacheNamespaceStats, CacheStats, Region
+from .deps import DB_DEPENDENCIES, open_db
+
+
+try:
+    import zstandard
+
+    HAS_ZSTANDARD = True
+except ImportError:  # pragma: no cover
+    HAS_ZSTANDARD = False
+
+
+settings = Settings()
+
+
+CACHE_PREFIX = f"{settings.redis_prefix}:cache"
+
+
+# Envelope of a cached response: version, status code, header count, then the
+# name length, value length, name and value of each header and then the body.
+# content-length isn't stored as it's the length of the body.
+ENVELOPE_VERSION = 1
+ENVELOPE_HEADER = struct.Struct("!BHH")
+ENVELOPE_FIELD = struct.Struct("!HH")
+
+
+class CachedResponse(Response):
+    """Response with the body and headers of a cached response"""
+
+    def __init__(
+        self, body: bytes, status_code: int, raw_headers: list[tuple[bytes, bytes]]
+    ) -> None:
+        super().__init__(status_code=status_code)
+        self.body = body
+        self.raw_headers = raw_headers
+
+
+class ResponseCoder(Coder):  # type: ignore
+    """
+    Cache the body, status code and headers of a Response in an envelope.
+    The body is sent as is on a cache hit.
+    """
+
+    @classmethod
+    def encode(cls, value: Any) -> bytes:
+        if not isinstance(value, Response):
+            raise TypeError(f"Only responses can be cached, got {type(value)}")
+        headers = [
+            (name, header_value)
+            for name, header_value in value.raw_headers
+            if name != b"content-length"
+        ]
+        envelope = bytearray(
+            ENVELOPE_HEADER.pack(ENVELOPE_VERSION, value.status_code, len(headers))
+        )
+        for name, header_value in headers:
+            envelope += ENVELOPE_FIELD.pack(len(name), len(header_value))
+            envelope += name
+            envelope += header_value
+        envelope += value.body
+        return bytes(envelope)
+
+    @classmethod
+    def decode(cls, value: bytes) -> CachedResponse:
+        version, status_code, header_count = ENVELOPE_HEADER.unpack_from(value)
+        if version != ENVELOPE_VERSION:
+            raise ValueError(f"Unknown cached response version {version}")
+        offset = ENVELOPE_HEADER.size
+        raw_headers: list[tuple[bytes, bytes]] = []
+        for _ in range(header_count):
+            name_length, value_length = ENVELOPE_FIELD.unpack_from(value, offset)
+            offset += ENVELOPE_FIELD.size
+            name = value[offset : offset + name_length]
+            offset += name_length
+            raw_headers.append((name, value[offset : offset + value_length]))
+            offset += value_length
+        body = value[offset:]
+        raw_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+        return CachedResponse(body, status_code, raw_headers)
+
+
+class RedisCodec(IntEnum):
+    """Compression of the values stored in Redis, the first byte of the value"""
+
+    RAW = 0
+    ZLIB = 1
+    ZSTD = 2
+
+
+# Smaller values are stored uncompressed
+COMPRESS_MIN_SIZE = 1024
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def pack_redis_value(value: bytes) -> bytes:
+    if len(value) < COMPRESS_MIN_SIZE:
+        return bytes([RedisCodec.RAW]) + value
+    if HAS_ZSTANDARD:
+        compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(value)
+        return bytes([RedisCodec.ZSTD]) + compressed
+    return bytes([RedisCodec.ZLIB]) + zlib.compress(value, ZLIB_LEVEL)
+
+
+def unpack_redis_value(value: bytes) -> Optional[bytes]:
+    """Return None if the value wasn't written by pack_redis_value"""
+    codec, data = value[0], value[1:]
+    if codec == RedisCodec.RAW:
+        return data
+    elif codec == RedisCodec.ZLIB:
+        return zlib.decompress(data)
+    elif codec == RedisCodec.ZSTD and HAS_ZSTANDARD:
+        decompressed: bytes = zstandard.ZstdDecompressor().decompress(data)
+        return decompressed
+    return None
+
+
+@dataclass
+class LocalCacheEntry:
+    value: bytes
+    expire_at: Optional[float]
+
+
+class LocalCache:
+    """
+    Least recently used cache bounded by the total size of the values in bytes.
+    Values bigger than max_item_size aren't stored.
+    """
+
+    def __init__(self, max_size: int, max_item_size: int) -> None:
+        self.max_size = max_size
+        self.max_item_size = max_item_size
+        self.size = 0
+        self.entries: OrderedDict[str, LocalCacheEntry] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[LocalCacheEntry]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expire_at is not None and entry.expire_at <= time.monotonic():
+            self.delete(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        self.delete(key)
+        if len(value) > self.max_item_size:
+            return
+        expire_at = time.monotonic() + expire if expire else None
+        self.entries[key] = LocalCacheEntry(value, expire_at)
+        self.size += len(value)
+        while self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted.value)
+
+    def delete(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.value)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+
+def get_cache_version(
+    data_versions: Mapping[Region, str],
+    region: Optional[Region] = None,
+    version: str = app_version,
+) -> str:
+    """
+    Return the part of the cache keys that changes with the app version and
+    the data version of region, or of all regions if region is None,
+    so an upgrade or a new data version uses new keys.
+    """
+    regions = [region] if region is not None else sorted(data_versions)
+    return ".".join(
+        [
+            f"app-{version}",
+            *(
+                f"{key_region.value}-{data_versions.get(key_region, '')}"
+                for key_region in regions
+            ),
+        ]
+    )
+
+
+def get_key_namespace(key: str) -> str:
+    """
+    Return the namespace of a key made by custom_key_builder:
+    {CACHE_PREFIX}:{cache version}:{namespace}:{hash}
+    """
+    return key.rsplit(":", 2)[-2]
+
+
+class SingleFlight:
+    """Share the result of a call with the concurrent calls with the same key"""
+
+    def __init__(self) -> None:
+        self.calls: dict[str, "asyncio.Future[bytes]"] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[bytes]]) -> bytes:
+        call = self.calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(func())
+            self.calls[key] = call
+            call.add_done_callback(lambda _: self.calls.pop(key, None))
+        # A cancelled caller doesn't cancel the call of the other callers
+        return await asyncio.shield(call)
+
+
+class TwoTierBackend(Backend):  # type: ignore
+    """
+    fastapi_cache backend that keeps the recently used values of the worker in a
+    LocalCache in front of Redis.
+    The local values are dropped when the data version of any region changes,
+    which is checked at most every check_interval seconds.
+    The values are compressed in Redis, see pack_redis_value.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        local_max_size: int,
+        check_interval: float,
+    ) -> None:
+        self.redis = redis
+        self.redis_backend = RedisBackend(redis)
+        self.local = LocalCache(local_max_size, local_max_size // 8)
+        self.check_interval = check_interval
+        self.next_check = 0.0
+        self.data_versions: dict[Region, str] = {}
+        self.local_hits: Counter[str] = Counter()
+        self.redis_hits: Counter[str] = Counter()
+        self.misses: Counter[str] = Counter()
+        self.single_flight = SingleFlight()
+
+    async def update_data_versions(self) -> None:
+        data_versions = await get_repo_hashes(self.redis)
+        if data_versions != self.data_versions:
+            self.local.clear()
+            self.data_versions = data_versions
+
+    async def check_data_versions(self) -> None:
+        now = time.monotonic()
+        if now >= self.next_check:
+            self.next_check = now + self.check_interval
+            await self.update_data_versions()
+
+    async def get_with_ttl(self, key: str) -> tuple[int, Optional[bytes]]:
+        await self.check_data_versions()
+        namespace = get_key_namespace(key)
+        entry = self.local.get(key)
+        if entry is not None:
+            self.local_hits[namespace] += 1
+            if entry.expire_at is None:
+                return -1, entry.value
+            return max(int(entry.expire_at - time.monotonic()), 0), entry.value
+
+        ttl, redis_value = await self.redis_backend.get_with_ttl(key)
+        value = unpack_redis_value(redis_value) if redis_value else None
+        if value is None:
+            self.misses[namespace] += 1
+        else:
+            self.redis_hits[namespace] += 1
+            self.local.set(key, value, ttl if ttl > 0 else None)
+        return ttl, value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        _, value = await self.get_with_ttl(key)
+        return value
+
+    async def set(self, key: str, value: bytes, expire: Optional[int] = None) -> None:
+        self.local.set(key, value, expire)
+        await self.redis_backend.set(key, pack_redis_value(value), expire)
+
+    async def clear(
+        self, namespace: Optional[str] = None, key: Optional[str] = None
+    ) -> int:
+        self.local.clear()
+        cleared: int = await self.redis_backend.clear(namespace, key)
+        return cleared
+
+    def get_cache_version(self, region: Optional[str] = None) -> str:
+        return get_cache_version(
+            self.data_versions, Region(region) if region is not None else None
+        )
+
+    def get_stats(self) -> CacheStats:
+        namespaces = set(self.local_hits) | set(self.redis_hits) | set(self.misses)
+        return CacheStats(
+            localSize=self.local.size,
+            localMaxSize=self.local.max_size,
+            localEntries=len(self.local),
+            namespaces={
+                namespace: CacheNamespaceStats(
+                    localHits=self.local_hits[namespace],
+                    redisHits=self.redis_hits[namespace],
+                    misses=self.misses[namespace],
+                )
+                for namespace in sorted(namespaces)
+            },
+        )
+
+
+# Lock held by the worker that builds a response missing in the cache so the other
+# workers wait for it to be cached instead of building it too
+CACHE_LOCK_TIMEOUT = 10
+CACHE_LOCK_SLEEP = 0.05
+
+
+def get_key_etag(cache_key: str) -> str:
+    """
+    Return the strong ETag of the responses of a key made by custom_key_builder.
+    The key changes with the app and data versions so the ETag changes with them.
+    """
+    _, cache_version, _, key_hash = cache_key.rsplit(":", 3)
+    return f'"{cache_version}-{key_hash}"'
+
+
+def get_body_etag(body: bytes) -> str:
+    return f'"{get_content_hash(body)}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """If-None-Match uses the weak comparison of the ETags"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        match.strip().removeprefix("W/") == etag for match in if_none_match.split(",")
+    )
+
+
+def get_not_modified_response(
+    etag: str, cache_control: Optional[str] = None
+) -> Response:
+    headers = {"ETag": etag}
+    if cache_control is not None:
+        headers["Cache-Control"] = cache_control
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+async def build_cached_value(
+    backend: TwoTierBackend,
+    cache_key: str,
+    expire: Optional[int],
+    build: Callable[[], Awaitable[Any]],
+) -> bytes:
+    """
+    Build and cache the value of cache_key.
+    If another worker is building it, wait up to CACHE_LOCK_TIMEOUT seconds for it
+    to be cached before building it.
+    The response is cached with the ETag of the key or, for the routes with an
+    expire time whose response can change with the same data version, of the body.
+    """
+    lock = backend.redis.lock(
+        f"{cache_key}:lock",
+        timeout=CACHE_LOCK_TIMEOUT,
+        sleep=CACHE_LOCK_SLEEP,
+        blocking_timeout=CACHE_LOCK_TIMEOUT,
+        thread_local=False,
+    )
+    acquired = await lock.acquire(blocking=False)
+    try:
+        if not acquired:
+            acquired = await lock.acquire()
+            _, cached_value = await backend.get_with_ttl(cache_key)
+            if cached_value is not None:
+                return cached_value
+        response = await build()
+        response.headers["ETag"] = (
+            get_key_etag(cache_key) if expire is None else get_body_etag(response.body)
+        )
+        value: bytes = FastAPICache.get_coder().encode(response)
+        await backend.set(cache_key, value, expire or FastAPICache.get_expire())
+        return value
+    finally:
+        if acquired:
+            # The lock expired if building took longer than CACHE_LOCK_TIMEOUT
+            with suppress(LockError):
+                await lock.release()
+
+
+REQUEST_PARAMETER = "request"
+REGION_PARAMETER = "region"
+
+
+@dataclass
+class DbParameter:
+    """Parameter of a route that depends on a pooled connection, see DB_DEPENDENCIES"""
+
+    name: str
+    transaction: bool
+
+
+def get_db_parameter(signature: inspect.Signature) -> Optional[DbParameter]:
+    for parameter in signature.parameters.values():
+        if isinstance(parameter.default, params.Depends) and (
+            parameter.default.dependency in DB_DEPENDENCIES
+        ):
+            return DbParameter(
+                parameter.name, DB_DEPENDENCIES[parameter.default.dependency]
+            )
+    return None
+
+
+def get_route_signature(
+    func: Callable[..., Any], db_parameter: Optional[DbParameter]
+) -> inspect.Signature:
+    """
+    Return the signature of func with the parameters FastAPI fills for the cache:
+    the request and, instead of the pooled connection, the region. The connection
+    is only checked out when the response is built, not for cache hits and 304s.
+    """
+    signature = inspect.signature(func)
+    parameters = [
+        parameter
+        for parameter in signature.parameters.values()
+        if db_parameter is None or parameter.name != db_parameter.name
+    ]
+    parameter_names = {parameter.name for parameter in parameters}
+    if db_parameter is not None and REGION_PARAMETER not in parameter_names:
+        parameters.append(
+            inspect.Parameter(
+                REGION_PARAMETER, inspect.Parameter.KEYWORD_ONLY, annotation=Region
+            )
+        )
+    if REQUEST_PARAMETER not in parameter_names:
+        parameters.append(
+            inspect.Parameter(
+                REQUEST_PARAMETER, inspect.Parameter.KEYWORD_ONLY, annotation=Request
+            )
+        )
+    return signature.replace(parameters=parameters)
+
+
+RouteFunc = TypeVar("RouteFunc", bound=Callable[..., Awaitable[Response]])
+
+
+def cache(
+    expire: Optional[int] = None, namespace: str = ""
+) -> Callable[[RouteFunc], RouteFunc]:
+    """
+    Cache the response of the route like fastapi_cache.decorator.cache.
+    The concurrent requests missing the same key wait for the response built by
+    one of them, see SingleFlight and build_cached_value.
+
+    A pooled connection parameter (Depends(get_db)) is replaced by the region and
+    the connection is checked out by the build only, so the cache hits, the 304s
+    and the requests waiting for another one's build don't hold a connection.
+
+    The responses have a strong ETag and If-None-Match is answered with 304.
+    Without expire, the response only changes with the data version and the ETag
+    is checked before the cache lookup. With expire, e.g. the quest and war routes,
+    the ETag is the hash of the body and Cache-Control is the time left until the
+    cached response expires.
+    """
+
+    def wrapper(func: RouteFunc) -> RouteFunc:
+        func_signature = inspect.signature(func)
+        db_parameter = get_db_parameter(func_signature)
+
+        @wraps(func)
+        async def inner(*args: Any, **kwargs: Any) -> Response:
+            request: Request = kwargs[REQUEST_PARAMETER]
+            key_kwargs = {
+                key: value for key, value in kwargs.items() if key != REQUEST_PARAMETER
+            }
+            func_kwargs = {
+                key: value
+                for key, value in kwargs.items()
+                if key in func_signature.parameters
+            }
+
+            async def build() -> Response:
+                if db_parameter is None:
+                    return await func(*args, **func_kwargs)
+                async with open_db(
+                    request.app, kwargs[REGION_PARAMETER], db_parameter.transaction
+                ) as conn:
+                    return await func(*args, **func_kwargs, **{db_parameter.name: conn})
+
+            if request.headers.get("Cache-Control") == "no-store":
+                return await build()
+
+            backend: TwoTierBackend = FastAPICache.get_backend()
+            key_builder = FastAPICache.get_key_builder()
+            cache_key: str = key_builder(func, namespace, args=args, kwargs=key_kwargs)
+            if_none_match = request.headers.get("If-None-Match")
+            if expire is None:
+                key_etag = get_key_etag(cache_key)
+                if etag_matches(if_none_match, key_etag):
+                    return get_not_modified_response(key_etag)
+
+            ttl, value = await backend.get_with_ttl(cache_key)
+            if value is None:
+                ttl = expire or FastAPICache.get_expire()
+                value = await backend.single_flight.do(
+                    cache_key,
+                    lambda: build_cached_value(backend, cache_key, expire, build),
+                )
+            response: Response = FastAPICache.get_coder().decode(value)
+
+            cache_control = f"public, max-age={max(ttl, 0)}" if expire else None
+            if cache_control is not None:
+                response.headers["Cache-Control"] = cache_control
+            etag = response.headers.get("ETag")
+            if etag is not None and etag_matches(if_none_match, etag):
+                return get_not_modified_response(etag, cache_control)
+            return response
+
+        inner.__signature__ = get_route_signature(func, db_parameter)  # type: ignore
+        return cast(RouteFunc, inner)
+
+    return wrapper
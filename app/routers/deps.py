@@ -1,7 +1,8 @@
-from typing import AsyncGenerator, Optional
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Optional
 
 from aioredis import Redis
-from fastapi import Request
+from fastapi import FastAPI, Request
 from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
 
 from ..schemas.common import Language, Region
@@ -15,22 +16,38 @@ async def language_parameter(lang: Optional[Language] = None) -> Language:
         return Language.jp
 
 
+@asynccontextmanager
+async def open_db(
+    app: FastAPI, region: Region, transaction: bool = False
+) -> AsyncIterator[AsyncConnection]:
+    """Check out a pooled connection of the region, in a transaction if transaction"""
+    engine: AsyncEngine = app.state.async_engines[region]
+    async with (engine.begin() if transaction else engine.connect()) as connection:
+        connection.info["region"] = region
+        yield connection
+
+
 async def get_db(
     request: Request, region: Region
 ) -> AsyncGenerator[AsyncConnection, None]:
-    async with request.app.state.async_engines[region].connect() as connection:
-        connection.info["region"] = region
+    async with open_db(request.app, region) as connection:
         yield connection
 
 
 async def get_db_transaction(
     request: Request, region: Region
 ) -> AsyncGenerator[AsyncConnection, None]:
-    async with request.app.state.async_engines[region].begin() as connection:
-        connection.info["region"] = region
+    async with open_db(request.app, region, transaction=True) as connection:
         yield connection
 
 
+# The connection dependencies and whether their connection is in a transaction
+DB_DEPENDENCIES: dict[Callable[..., Any], bool] = {
+    get_db: False,
+    get_db_transaction: True,
+}
+
+
 async def get_redis(request: Request) -> Redis:
     redis: Redis = request.app.state.redis
     return redis
@@ -1,6 +1,5 @@
 from aioredis import Redis
 from fastapi import APIRouter, Depends, Response
-from fastapi_cache.decorator import cache
 from fastapi_limiter.depends import RateLimiter  # type: ignore
 from sqlalchemy.ext.asyncio import AsyncConnection
 
@@ -43,6 +42,7 @@ from ..schemas.search import (
     SvtSearchQueryParams,
     TdSearchParams,
 )
+from .cache import cache
 from .deps import get_db, get_db_transaction, get_redis, language_parameter
 from .utils import get_error_code, item_response, list_response
 
@@ -72,7 +72,7 @@ svt_lang_lore_description = """
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_servant(
     search_param: ServantSearchQueryParams = Depends(ServantSearchQueryParams),
     lang: Language = Depends(language_parameter),
@@ -118,7 +118,7 @@ if settings.documentation_all_nice:
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_servant(
     region: Region,
     servant_id: int,
@@ -146,7 +146,7 @@ equip_lore_description = """
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_equip(
     search_param: EquipSearchQueryParams = Depends(EquipSearchQueryParams),
     lang: Language = Depends(language_parameter),
@@ -192,7 +192,7 @@ if settings.documentation_all_nice:
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_equip(
     region: Region,
     equip_id: int,
@@ -215,7 +215,7 @@ async def get_equip(
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_svt(
     search_param: SvtSearchQueryParams = Depends(SvtSearchQueryParams),
     lang: Language = Depends(language_parameter),
@@ -241,7 +241,7 @@ async def find_svt(
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_svt(
     region: Region,
     svt_id: int,
@@ -281,7 +281,7 @@ if settings.documentation_all_nice:
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_mystic_code(
     region: Region,
     mc_id: int,
@@ -313,7 +313,7 @@ if settings.documentation_all_nice:
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_command_code(
     region: Region,
     cc_id: int,
@@ -341,7 +341,7 @@ and return the reverse skill objects.
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_skill(
     search_param: SkillSearchParams = Depends(SkillSearchParams),
     lang: Language = Depends(language_parameter),
@@ -376,7 +376,7 @@ async def find_skill(
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_skill(
     region: Region,
     skill_id: int,
@@ -410,7 +410,7 @@ and return the reversed servant objects.
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_td(
     search_param: TdSearchParams = Depends(TdSearchParams),
     lang: Language = Depends(language_parameter),
@@ -445,7 +445,7 @@ async def find_td(
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_td(
     region: Region,
     np_id: int,
@@ -480,7 +480,7 @@ and return the reversed skill objects.
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_function(
     search_param: FuncSearchQueryParams = Depends(FuncSearchQueryParams),
     lang: Language = Depends(language_parameter),
@@ -519,7 +519,7 @@ async def find_function(
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_function(
     region: Region,
     func_id: int,
@@ -555,7 +555,7 @@ and return the reversed function objects.
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_buff(
     search_param: BuffSearchQueryParams = Depends(BuffSearchQueryParams),
     lang: Language = Depends(language_parameter),
@@ -593,7 +593,7 @@ async def find_buff(
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_buff(
     region: Region,
     buff_id: int,
@@ -620,7 +620,7 @@ async def get_buff(
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_item(
     search_param: ItemSearchQueryParams = Depends(ItemSearchQueryParams),
     lang: Language = Depends(language_parameter),
@@ -654,7 +654,7 @@ if settings.documentation_all_nice:
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_item(
     region: Region,
     item_id: int,
@@ -675,7 +675,7 @@ async def get_item(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_mm(
     master_mission_id: int,
     conn: AsyncConnection = Depends(get_db),
@@ -697,7 +697,7 @@ async def get_mm(
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_event(
     region: Region,
     event_id: int,
@@ -718,7 +718,7 @@ async def get_event(
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache(expire=settings.quest_cache_length)  # type: ignore
+@cache(expire=settings.quest_cache_length)
 async def get_war(
     region: Region,
     war_id: int,
@@ -746,7 +746,7 @@ get_quest_phase_description = (
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache(expire=settings.quest_cache_length)  # type: ignore
+@cache(expire=settings.quest_cache_length)
 async def get_quest_phase(
     region: Region,
     quest_id: int,
@@ -769,7 +769,7 @@ async def get_quest_phase(
     response_model_exclude_unset=True,
     responses=get_error_code([404, 500]),
 )
-@cache(expire=settings.quest_cache_length)  # type: ignore
+@cache(expire=settings.quest_cache_length)
 async def get_quest(
     region: Region,
     quest_id: int,
@@ -793,7 +793,7 @@ async def get_quest(
     response_model=list[NiceScriptSearchResult],
     response_model_exclude_unset=True,
 )
-@cache()  # type: ignore
+@cache()
 async def find_script(
     search_param: ScriptSearchQueryParams = Depends(ScriptSearchQueryParams),
     conn: AsyncConnection = Depends(get_db),
@@ -812,7 +812,7 @@ async def find_script(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_script(
     region: Region,
     script_id: str,
@@ -836,7 +836,7 @@ async def get_script(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_ai_field(
     region: Region,
     ai_type: AiType,
@@ -862,7 +862,7 @@ async def get_ai_field(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_bgm(
     region: Region,
     bgm_id: int,
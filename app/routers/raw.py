@@ -1,6 +1,5 @@
 from aioredis import Redis
 from fastapi import APIRouter, Depends, Query, Response
-from fastapi_cache.decorator import cache
 from fastapi_limiter.depends import RateLimiter  # type: ignore
 from sqlalchemy.ext.asyncio import AsyncConnection
 
@@ -41,6 +40,7 @@ from ..schemas.search import (
     SvtSearchQueryParams,
     TdSearchParams,
 )
+from .cache import cache
 from .deps import get_db, get_redis
 from .utils import get_error_code, item_response, list_response
 
@@ -72,7 +72,7 @@ Expand all other skills and functions as well.
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_servant(
     search_param: ServantSearchQueryParams = Depends(ServantSearchQueryParams),
     expand: bool = False,
@@ -105,7 +105,7 @@ Otherwise, it will look up the actual ID field. As a result, it can return not s
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_servant(
     servant_id: int,
     expand: bool = False,
@@ -126,7 +126,7 @@ async def get_servant(
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_equip(
     search_param: EquipSearchQueryParams = Depends(EquipSearchQueryParams),
     expand: bool = False,
@@ -159,7 +159,7 @@ Otherwise, it will look up the actual ID field. As a result, it can return not C
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_equip(
     equip_id: int,
     expand: bool = False,
@@ -180,7 +180,7 @@ async def get_equip(
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_svt(
     search_param: SvtSearchQueryParams = Depends(SvtSearchQueryParams),
     expand: bool = False,
@@ -212,7 +212,7 @@ Only uses actual ID for the lookup.
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_svt(
     svt_id: int,
     expand: bool = False,
@@ -230,7 +230,7 @@ async def get_svt(
     response_model=list[MstSvtScript],
     response_model_exclude_unset=True,
 )
-@cache()  # type: ignore
+@cache()
 async def get_svt_scripts(
     charaId: list[int] = Query([]), conn: AsyncConnection = Depends(get_db)
 ) -> Response:
@@ -246,7 +246,7 @@ async def get_svt_scripts(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_mystic_code(
     mc_id: int,
     expand: bool = False,
@@ -269,7 +269,7 @@ async def get_mystic_code(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_command_code(
     cc_id: int, expand: bool = False, conn: AsyncConnection = Depends(get_db)
 ) -> Response:
@@ -300,7 +300,7 @@ from the function IDs in mstSkillLv.funcId.
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_skill(
     search_param: SkillSearchParams = Depends(SkillSearchParams),
     reverse: bool = False,
@@ -328,7 +328,7 @@ async def find_skill(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_skill(
     region: Region,
     skill_id: int,
@@ -360,7 +360,7 @@ from the function IDs in mstTreasureDeviceLv.funcId.
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_td(
     search_param: TdSearchParams = Depends(TdSearchParams),
     reverse: bool = False,
@@ -382,7 +382,7 @@ async def find_td(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_td(
     np_id: int,
     reverse: bool = False,
@@ -410,7 +410,7 @@ and return the reversed skill objects.
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_function(
     search_param: FuncSearchQueryParams = Depends(FuncSearchQueryParams),
     reverse: bool = False,
@@ -447,7 +447,7 @@ async def find_function(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_function(
     region: Region,
     func_id: int,
@@ -479,7 +479,7 @@ and return the reversed function objects.
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_buff(
     search_param: BuffSearchQueryParams = Depends(BuffSearchQueryParams),
     reverse: bool = False,
@@ -513,7 +513,7 @@ async def find_buff(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_buff(
     region: Region,
     buff_id: int,
@@ -537,7 +537,7 @@ async def get_buff(
     response_model_exclude_unset=True,
     responses=get_error_code([400, 403]),
 )
-@cache()  # type: ignore
+@cache()
 async def find_item(
     search_param: ItemSearchQueryParams = Depends(ItemSearchQueryParams),
     conn: AsyncConnection = Depends(get_db),
@@ -554,7 +554,7 @@ async def find_item(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_item(item_id: int, conn: AsyncConnection = Depends(get_db)) -> Response:
     """
     Get the item data from the given ID
@@ -570,7 +570,7 @@ async def get_item(item_id: int, conn: AsyncConnection = Depends(get_db)) -> Res
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_mm(
     master_mission_id: int, conn: AsyncConnection = Depends(get_db)
 ) -> Response:
@@ -588,7 +588,7 @@ async def get_mm(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_event(event_id: int, conn: AsyncConnection = Depends(get_db)) -> Response:
     """
     Get the event data from the given event ID
@@ -604,7 +604,7 @@ async def get_event(event_id: int, conn: AsyncConnection = Depends(get_db)) -> R
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache(expire=settings.quest_cache_length)  # type: ignore
+@cache(expire=settings.quest_cache_length)
 async def get_war(war_id: int, conn: AsyncConnection = Depends(get_db)) -> Response:
     """
     Get the war data from the given war ID
@@ -621,7 +621,7 @@ async def get_war(war_id: int, conn: AsyncConnection = Depends(get_db)) -> Respo
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache(expire=settings.quest_cache_length)  # type: ignore
+@cache(expire=settings.quest_cache_length)
 async def get_quest_phase(
     quest_id: int,
     phase: int,
@@ -644,7 +644,7 @@ async def get_quest_phase(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache(expire=settings.quest_cache_length)  # type: ignore
+@cache(expire=settings.quest_cache_length)
 async def get_quest(
     quest_id: int,
     conn: AsyncConnection = Depends(get_db),
@@ -664,7 +664,7 @@ async def get_quest(
     response_model=list[ScriptSearchResult],
     response_model_exclude_unset=True,
 )
-@cache()  # type: ignore
+@cache()
 async def find_script(
     search_param: ScriptSearchQueryParams = Depends(ScriptSearchQueryParams),
     conn: AsyncConnection = Depends(get_db),
@@ -681,7 +681,7 @@ async def find_script(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_script(
     script_id: str, conn: AsyncConnection = Depends(get_db)
 ) -> Response:
@@ -700,7 +700,7 @@ async def get_script(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_ai_field(
     ai_type: AiType, ai_id: int, conn: AsyncConnection = Depends(get_db)
 ) -> Response:
@@ -720,7 +720,7 @@ async def get_ai_field(
     response_model_exclude_unset=True,
     responses=get_error_code([404]),
 )
-@cache()  # type: ignore
+@cache()
 async def get_bgm(bgm_id: int, conn: AsyncConnection = Depends(get_db)) -> Response:
     """
     Get the BGM data from the given BGM ID
@@ -0,0 +1,146 @@
+import asyncio
+import inspect
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Optional, TypeVar
+
+from .config import logger
+from .data.utils import master_data
+
+
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
+
+@dataclass
+class ImportJob:
+    name: str
+    func: Callable[[], Any]
+    depends: list[str] = field(default_factory=list)
+    # Master files read by the job. They are parsed once for all jobs needing them.
+    master_files: list[Path] = field(default_factory=list)
+    # CPU-bound sync jobs are run in a pool of processes so they don't hold the GIL.
+    # func must be picklable and its master files aren't shared with other jobs.
+    process: bool = False
+
+
+def check_job_dependencies(jobs: list[ImportJob]) -> None:
+    """Raise ValueError if a dependency is unknown or there's a dependency cycle"""
+    job_depends = {job.name: job.depends for job in jobs}
+    if len(job_depends) != len(jobs):
+        raise ValueError("Duplicate job names")
+
+    for name, depends in job_depends.items():
+        for dependency in depends:
+            if dependency not in job_depends:
+                raise ValueError(f"Unknown dependency {dependency} of job {name}")
+
+    visited: set[str] = set()
+    visiting: set[str] = set()
+
+    def visit(name: str) -> None:
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle found at job {name}")
+        visiting.add(name)
+        for dependency in job_depends[name]:
+            visit(dependency)
+        visiting.remove(name)
+        visited.add(name)
+
+    for name in job_depends:
+        visit(name)
+
+
+async def run_jobs(jobs: list[ImportJob], max_workers: int) -> dict[str, float]:
+    """
+    Run the jobs concurrently. A job starts after all of its dependencies finished.
+    Sync functions are run in a pool of max_workers threads, or processes for the
+    process jobs, and coroutine functions are awaited in the event loop.
+    At most max_workers jobs run at the same time.
+    Returns the run time of each job.
+    """
+    check_job_dependencies(jobs)
+    for job in jobs:
+        if not job.process:
+            master_data.add_users(job.master_files)
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_workers)
+    tasks: dict[str, "asyncio.Task[None]"] = {}
+    run_times: dict[str, float] = {}
+
+    with ExitStack() as stack:
+        executor = stack.enter_context(
+            ThreadPoolExecutor(max_workers, thread_name_prefix="import")
+        )
+        process_executor: Optional[ProcessPoolExecutor] = None
+        if any(job.process for job in jobs):
+            # Spawned, not forked, so the workers don't inherit the threads' locks
+            process_executor = stack.enter_context(
+                ProcessPoolExecutor(
+                    max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            )
+
+        async def run_job(job: ImportJob) -> None:
+            if job.depends:
+                await asyncio.gather(*(tasks[dependency] for dependency in job.depends))
+
+            async with semaphore:
+                start_time = time.perf_counter()
+                if inspect.iscoroutinefunction(job.func):
+                    await job.func()
+                elif job.process and process_executor is not None:
+                    await loop.run_in_executor(process_executor, job.func)
+                else:
+                    await loop.run_in_executor(executor, job.func)
+                run_times[job.name] = time.perf_counter() - start_time
+                if not job.process:
+                    master_data.release(job.master_files)
+                logger.debug(f"Finished {job.name} in {run_times[job.name]:.2f}s.")
+
+        for job in jobs:
+            tasks[job.name] = asyncio.create_task(run_job(job))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        finally:
+            for job in jobs:
+                if job.name not in run_times and not job.process:
+                    master_data.release(job.master_files)
+
+    return run_times
+
+
+async def map_ordered(
+    func: Callable[[_T], Awaitable[_R]], items: Iterable[_T], window: int
+) -> AsyncIterator[_R]:
+    """
+    Yield func(item) for each item in order.
+    At most window items are processed or waiting to be yielded at the same time,
+    so the memory used doesn't grow with the number of items.
+    """
+    pending: deque["asyncio.Task[_R]"] = deque()
+    try:
+        for item in items:
+            pending.append(asyncio.create_task(func(item)))
+            if len(pending) >= window:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -13,6 +13,20 @@ class RepoInfo(BaseModelORJson):
     timestamp: int
 
 
+class DataChangeSet(BaseModelORJson):
+    previousVersion: RepoInfo
+    version: RepoInfo
+    # Entity type: IDs of the entities that were added, changed or removed
+    # None marks a version change whose entity changes couldn't be determined
+    changes: Optional[dict[str, list[int]]]
+
+
+class DataChanges(BaseModelORJson):
+    since: str
+    version: Optional[RepoInfo] = None
+    changes: dict[str, list[int]]
+
+
 class Region(str, Enum):
     """Region Enum"""
 
@@ -20,6 +34,35 @@ class Region(str, Enum):
     JP = "JP"
 
 
+class ExportState(str, Enum):
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+
+
+class ExportStatus(BaseModelORJson):
+    state: ExportState
+    # Imported data version of all regions, see get_data_version
+    dataVersion: Optional[str] = None
+    regions: list[Region]
+    startedAt: int
+    finishedAt: Optional[int] = None
+    error: Optional[str] = None
+
+
+class CacheNamespaceStats(BaseModelORJson):
+    localHits: int
+    redisHits: int
+    misses: int
+
+
+class CacheStats(BaseModelORJson):
+    localSize: int
+    localMaxSize: int
+    localEntries: int
+    namespaces: dict[str, CacheNamespaceStats]
+
+
 class Language(str, Enum):
     """Language Enum"""
 
@@ -1,17 +1,29 @@
 import asyncio
+import inspect
+import multiprocessing
 import time
-from pathlib import Path
-from typing import Any, Iterable, Union
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Iterable,
+    Optional,
+    Union,
+)
 
-import aiofiles
 import orjson
 from aioredis import Redis
+from aioredis.lock import Lock
 from fastapi.concurrency import run_in_threadpool
 from git import Repo  # type: ignore
 from pydantic import DirectoryPath
 from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
 
-from .config import SecretSettings, Settings, logger, project_root
+from .config import SecretSettings, Settings, app_version, logger, project_root
 from .core.basic import (
     get_all_basic_ccs,
     get_all_basic_equips,
@@ -22,27 +34,57 @@ from .core.basic import (
 )
 from .core.nice.bgm import get_all_nice_bgms
 from .core.nice.cc import get_all_nice_ccs
+from .core.nice.func import get_depend_funcs
 from .core.nice.item import get_all_nice_items
 from .core.nice.mc import get_all_nice_mcs
 from .core.nice.mm import get_all_nice_mms
 from .core.nice.nice import get_nice_equip_model, get_nice_servant_model
 from .core.raw import get_all_bgm_entities, get_servant_entity
-from .core.utils import sort_by_collection_no
-from .data.extra import get_extra_svt_data
-from .db.engine import engines
+from .core.utils import apply_overlay, overlay_language, sort_by_collection_no
+from .data.changes import get_change_set
+from .data.diff import RegionChangedFiles, get_changed_files
+from .db.engine import get_async_engines
 from .db.helpers import fetch
 from .db.helpers.svt import get_all_equips, get_all_servants
-from .db.load import load_pydantic_to_db, update_db
-from .models.raw import mstSvtExtra
-from .redis.helpers.repo_version import set_repo_version
-from .redis.load import load_redis_data, load_svt_extra_redis
-from .routers.utils import list_string
+from .db.load import get_db_jobs
+from .exports.delta import DELTA_KEEP_COUNT, prune_delta_folders
+from .exports.index import (
+    RegionExport,
+    get_content_hash,
+    get_entity_hash,
+    get_export_salt,
+)
+from .exports.manifest import write_manifest
+from .exports.render import dumps_with_section, get_model_data
+from .exports.writer import HAS_MSGPACK
+from .redis.helpers.repo_version import (
+    add_change_set,
+    get_export_status,
+    get_imported_version,
+    get_repo_hashes,
+    get_repo_version,
+    set_export_status,
+    set_imported_version,
+    set_repo_version,
+)
+from .redis.load import get_redis_jobs
+from .routers.cache import CACHE_PREFIX, get_cache_version
+from .scheduler import ImportJob, map_ordered, run_jobs
 from .schemas.base import BaseModelORJson
-from .schemas.common import Language, Region, RepoInfo
+from .schemas.basic import BasicEquip, BasicServant
+from .schemas.common import (
+    DataChangeSet,
+    ExportState,
+    ExportStatus,
+    Language,
+    Region,
+    RepoInfo,
+)
 from .schemas.enums import ALL_ENUMS, TRAIT_NAME
 from .schemas.gameenums import SvtType
 from .schemas.nice import NiceEquip, NiceServant
 from .schemas.raw import (
+    BgmEntity,
     MstCommandCode,
     MstCv,
     MstEquip,
@@ -62,22 +104,32 @@ REGION_PATHS = {Region.JP: settings.jp_gamedata, Region.NA: settings.na_gamedata
 
 
 export_path = project_root / "export"
+export_version_file = export_path / "data_version.txt"
+
+
+IMPORT_LOCK_KEY = f"{settings.redis_prefix}:import_lock"
+IMPORT_LOCK_TIMEOUT = 300
 
 
 async def dump_normal(
-    base_export_path: Path, file_name: str, data: Any
+    region_export: RegionExport, file_name: str, data: Any
 ) -> None:  # pragma: no cover
-    async with aiofiles.open(base_export_path / f"{file_name}.json", "wb") as fp:
-        await fp.write(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS))
+    await region_export.write_object(
+        file_name, orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    )
 
 
 async def dump_orjson(
-    base_export_path: Path, file_name: str, data: Iterable[BaseModelORJson]
+    region_export: RegionExport, file_name: str, data: Iterable[BaseModelORJson]
 ) -> None:  # pragma: no cover
-    async with aiofiles.open(
-        base_export_path / f"{file_name}.json", "w", encoding="utf-8"
-    ) as fp:
-        await fp.write(list_string(data))
+    async with region_export.open_array(file_name) as writer:
+        for item in data:
+            item_json = item.json(exclude_unset=True, exclude_none=True).encode("utf-8")
+            item_id = getattr(item, "id", None)
+            await writer.write(
+                item_json,
+                None if item_id is None else (item_id, get_content_hash(item_json)),
+            )
 
 
 async def get_nice_svt(
@@ -107,172 +159,357 @@ async def get_nice_svt(
         )
 
 
-async def dump_svt(
-    conn: AsyncConnection,
-    region: Region,
-    base_export_path: Path,
-    file_name: str,
-    svts: list[MstSvt],
-) -> None:  # pragma: no cover
-    with_lore: list[str] = []
-    without_lore: list[str] = []
-    with_lore_en: list[str] = []
-    without_lore_en: list[str] = []
-
-    for svt in svts:
-        raw_svt = await get_servant_entity(
-            conn, svt.id, expand=True, lore=True, mstSvt=svt
-        )
+def get_export_file_formats() -> list[str]:
+    file_formats = ["json"]
+    if settings.export_ndjson:
+        file_formats.append("ndjson")
+    if settings.export_msgpack:
+        if HAS_MSGPACK:
+            file_formats.append("msgpack")
+        else:
+            logger.warning("Install msgpack to export the MessagePack files.")
+    return file_formats
 
-        nice_svt = await get_nice_svt(conn, region, Language.jp, True, raw_svt)
-        with_lore.append(nice_svt.json(exclude_unset=True, exclude_none=True))
-        without_lore.append(
-            nice_svt.json(exclude={"profile"}, exclude_unset=True, exclude_none=True)
-        )
 
-        if region == Region.JP:
-            nice_svt_en = await get_nice_svt(conn, region, Language.en, True, raw_svt)
-            with_lore_en.append(nice_svt_en.json(exclude_unset=True, exclude_none=True))
-            without_lore_en.append(
-                nice_svt_en.json(
-                    exclude={"profile"}, exclude_unset=True, exclude_none=True
-                )
-            )
+def get_export_languages(region: Region) -> list[Language]:
+    return [Language.jp, Language.en] if region == Region.JP else [Language.jp]
 
-    out_name = base_export_path / f"{file_name}.json"
-    out_lore_name = base_export_path / f"{file_name}_lore.json"
 
-    async with aiofiles.open(out_lore_name, "w", encoding="utf-8") as fp:
-        await fp.write("[" + ",".join(with_lore) + "]")
-    async with aiofiles.open(out_name, "w", encoding="utf-8") as fp:
-        await fp.write("[" + ",".join(without_lore) + "]")
+def get_export_file_name(file_name: str, lang: Language) -> str:
+    return file_name if lang == Language.jp else f"{file_name}_lang_{lang.value}"
 
-    if region == Region.JP:
-        out_name_en = base_export_path / f"{file_name}_lang_en.json"
-        out_lore_name_en = base_export_path / f"{file_name}_lore_lang_en.json"
 
-        async with aiofiles.open(out_lore_name_en, "w", encoding="utf-8") as fp:
-            await fp.write("[" + ",".join(with_lore_en) + "]")
-        async with aiofiles.open(out_name_en, "w", encoding="utf-8") as fp:
-            await fp.write("[" + ",".join(without_lore_en) + "]")
+def log_export_file(
+    region_export: RegionExport, file_name: str, start_time: float
+) -> float:  # pragma: no cover
+    run_time = time.perf_counter() - start_time
+    json_file_name = f"{file_name}.json"
+    file_size = region_export.index.files[json_file_name].size
+    unchanged = " unchanged" if json_file_name in region_export.unchanged_files else ""
+    logger.info(
+        f"Exported {region_export.base_export_path.name}/{json_file_name} "
+        f"({file_size / 1024 / 1024:.1f} MB{unchanged}) in {run_time:.2f}s."
+    )
+    return run_time
 
 
-async def generate_exports(
-    redis: Redis,
-    region_path: dict[Region, DirectoryPath],
-    async_engines: dict[Region, AsyncEngine],
-) -> None:  # pragma: no cover
-    if settings.export_all_nice:
-        for region in region_path:
-            start_time = time.perf_counter()
-            conn = await async_engines[region].connect()
-            logger.info(f"Exporting {region} data …")
-
-            all_servants = await get_all_servants(conn)
-            all_equips = await get_all_equips(conn)
-            bgms = await get_all_bgm_entities(conn)
-
-            mstItems = await fetch.get_everything(conn, MstItem)
-            mstIllustrators = await fetch.get_everything(conn, MstIllustrator)
-            mstCvs = await fetch.get_everything(conn, MstCv)
-            mstEvents = await fetch.get_everything(conn, MstEvent)
-            mstWars = await fetch.get_everything(conn, MstWar)
-            mstEquips = await fetch.get_everything(conn, MstEquip)
-            mstCcs = await fetch.get_everything(conn, MstCommandCode)
-            mstMasterMissions = await fetch.get_everything(conn, MstMasterMission)
-
-            all_item_data = get_all_nice_items(region, Language.jp, mstItems)
-            all_mc_data = await get_all_nice_mcs(conn, region, Language.jp, mstEquips)
-            all_cc_data = await get_all_nice_ccs(conn, region, Language.jp, mstCcs)
-            all_bgm_data = get_all_nice_bgms(region, Language.jp, bgms)
-            all_mm_data = await get_all_nice_mms(conn, mstMasterMissions, Language.jp)
-
-            all_basic_servant_data = sort_by_collection_no(
-                await get_all_basic_servants(redis, region, Language.jp, all_servants)
-            )
-            all_basic_equip_data = sort_by_collection_no(
-                await get_all_basic_equips(redis, region, Language.jp, all_equips)
+async def dump_svt(
+    engine: AsyncEngine,
+    region: Region,
+    region_export: RegionExport,
+    file_name: str,
+    svts: list[MstSvt],
+    semaphore: asyncio.Semaphore,
+) -> dict[str, float]:  # pragma: no cover
+    """
+    Export the nice data of the svts sorted by collectionNo.
+    The svts are built concurrently, each one using a pooled connection
+    while holding the semaphore, and streamed to the files in order
+    so only a few svts are kept in memory.
+    Each svt is built and serialized once: the English files reuse the Japanese
+    build with the translations overlaid and the files without lore splice out
+    the profile. Svts whose raw entity and the functions its datavals depend on
+    didn't change since the previous export aren't built again and reuse their JSON from the previous files.
+    Return the run time of each exported file.
+    """
+    start_time = time.perf_counter()
+    languages = get_export_languages(region)
+    out_file_names = [
+        get_export_file_name(out_file_name, lang)
+        for lang in languages
+        for out_file_name in (f"{file_name}_lore", file_name)
+    ]
+    reused_svts = 0
+
+    async def get_svt_json(svt: MstSvt) -> tuple[int, str, dict[str, bytes]]:
+        """Return the svt's ID, raw entity hash and JSON in each export file"""
+        nonlocal reused_svts
+        async with semaphore, engine.connect() as conn:
+            raw_svt = await get_servant_entity(
+                conn, svt.id, expand=True, lore=True, mstSvt=svt
             )
-            all_basic_mc_data = get_all_basic_mcs(region, Language.jp, mstEquips)
-            all_basic_cc_data = sort_by_collection_no(
-                get_all_basic_ccs(region, Language.jp, mstCcs)
+            depend_funcs = await get_depend_funcs(conn, raw_svt)
+            svt_hash = get_entity_hash(raw_svt, *depend_funcs)
+            previous_json = region_export.get_previous_entities(
+                out_file_names, svt.id, svt_hash
             )
-            all_basic_event_data = get_all_basic_events(Language.jp, mstEvents)
-            all_basic_war_data = get_all_basic_wars(Language.jp, mstWars)
-
-            output_files = [
-                ("basic_servant", all_basic_servant_data, dump_orjson),
-                ("basic_equip", all_basic_equip_data, dump_orjson),
-                ("basic_mystic_code", all_basic_mc_data, dump_orjson),
-                ("basic_command_code", all_basic_cc_data, dump_orjson),
-                ("basic_event", all_basic_event_data, dump_orjson),
-                ("basic_war", all_basic_war_data, dump_orjson),
-                ("nice_enums", ALL_ENUMS, dump_normal),
-                ("nice_trait", TRAIT_NAME, dump_normal),
-                ("nice_command_code", all_cc_data, dump_orjson),
-                ("nice_item", all_item_data, dump_orjson),
-                ("nice_mystic_code", all_mc_data, dump_orjson),
-                ("nice_master_mission", all_mm_data, dump_orjson),
-                ("nice_bgm", all_bgm_data, dump_orjson),
-                ("nice_illustrator", mstIllustrators, dump_orjson),
-                ("nice_cv", mstCvs, dump_orjson),
-            ]
-
-            if region == Region.JP:
-                all_item_data_en = get_all_nice_items(region, Language.en, mstItems)
-                all_bgm_data_en = get_all_nice_bgms(region, Language.en, bgms)
-                all_cc_data_en = await get_all_nice_ccs(
-                    conn, region, Language.en, mstCcs
-                )
-                all_mc_data_en = await get_all_nice_mcs(
-                    conn, region, Language.en, mstEquips
-                )
+            if previous_json is not None:
+                reused_svts += 1
+                return svt.id, svt_hash, previous_json
 
-                all_basic_servant_en = sort_by_collection_no(
-                    await get_all_basic_servants(
-                        redis, region, Language.en, all_servants
-                    )
-                )
-                all_basic_equip_en = sort_by_collection_no(
-                    await get_all_basic_equips(redis, region, Language.en, all_equips)
-                )
-                all_basic_cc_en = sort_by_collection_no(
-                    get_all_basic_ccs(region, Language.en, mstCcs)
-                )
-                all_basic_mc_en = get_all_basic_mcs(region, Language.en, mstEquips)
-                all_basic_event_en = get_all_basic_events(Language.en, mstEvents)
-                all_basic_war_en = get_all_basic_wars(Language.en, mstWars)
-
-                output_files = [
-                    ("basic_servant_lang_en", all_basic_servant_en, dump_orjson),
-                    ("basic_equip_lang_en", all_basic_equip_en, dump_orjson),
-                    ("basic_event_lang_en", all_basic_event_en, dump_orjson),
-                    ("basic_war_lang_en", all_basic_war_en, dump_orjson),
-                    ("basic_command_code_lang_en", all_basic_cc_en, dump_orjson),
-                    ("nice_command_code_lang_en", all_cc_data_en, dump_orjson),
-                    ("nice_item_lang_en", all_item_data_en, dump_orjson),
-                    ("basic_mystic_code_lang_en", all_basic_mc_en, dump_orjson),
-                    ("nice_mystic_code_lang_en", all_mc_data_en, dump_orjson),
-                    ("nice_bgm_lang_en", all_bgm_data_en, dump_orjson),
-                ] + output_files
-
-            base_export_path = export_path / region.value
-
-            for file_name, data, dump in output_files:
-                await dump(base_export_path, file_name, data)
-
-            await dump_svt(conn, region, base_export_path, "nice_servant", all_servants)
-            await dump_svt(conn, region, base_export_path, "nice_equip", all_equips)
+            overlay_token = overlay_language.set(
+                Language.en if region == Region.JP else None
+            )
+            try:
+                nice_svt = await get_nice_svt(conn, region, Language.jp, True, raw_svt)
+            finally:
+                overlay_language.reset(overlay_token)
+
+        svt_json: dict[str, bytes] = {}
+        svt_data = get_model_data(nice_svt)
+        for lang in languages:
+            lang_data = svt_data if lang == Language.jp else apply_overlay(svt_data)
+            (
+                svt_json[get_export_file_name(f"{file_name}_lore", lang)],
+                svt_json[get_export_file_name(file_name, lang)],
+            ) = dumps_with_section(nice_svt, lang_data, "profile")
+        return svt.id, svt_hash, svt_json
+
+    async with AsyncExitStack() as stack:
+        writers = {
+            out_file_name: await stack.enter_async_context(
+                region_export.open_array(out_file_name)
+            )
+            for out_file_name in out_file_names
+        }
+        async for svt_id, svt_hash, svt_json in map_ordered(
+            get_svt_json, sort_by_collection_no(svts), settings.export_workers * 2
+        ):
+            for out_file_name, writer in writers.items():
+                await writer.write(svt_json[out_file_name], (svt_id, svt_hash))
+
+    logger.info(
+        f"Reused {reused_svts} of {len(svts)} unchanged "
+        f"{region_export.base_export_path.name}/{file_name} svts."
+    )
+    return {
+        out_file_name: log_export_file(region_export, out_file_name, start_time)
+        for out_file_name in out_file_names
+    }
+
+
+@dataclass
+class ExportFile:
+    name: str
+    # Build the data of the file with a pooled connection. Can be a coroutine function.
+    get_data: Callable[[AsyncConnection], Any]
+    dump: Callable[[RegionExport, str, Any], Awaitable[None]] = dump_orjson
+
+
+@dataclass
+class RegionMasterData:
+    all_servants: list[MstSvt]
+    all_equips: list[MstSvt]
+    bgms: list[BgmEntity]
+    mstItems: list[MstItem]
+    mstIllustrators: list[MstIllustrator]
+    mstCvs: list[MstCv]
+    mstEvents: list[MstEvent]
+    mstWars: list[MstWar]
+    mstEquips: list[MstEquip]
+    mstCcs: list[MstCommandCode]
+    mstMasterMissions: list[MstMasterMission]
+
+
+async def get_region_master_data(
+    conn: AsyncConnection,
+) -> RegionMasterData:  # pragma: no cover
+    return RegionMasterData(
+        all_servants=await get_all_servants(conn),
+        all_equips=await get_all_equips(conn),
+        bgms=await get_all_bgm_entities(conn),
+        mstItems=await fetch.get_everything(conn, MstItem),
+        mstIllustrators=await fetch.get_everything(conn, MstIllustrator),
+        mstCvs=await fetch.get_everything(conn, MstCv),
+        mstEvents=await fetch.get_everything(conn, MstEvent),
+        mstWars=await fetch.get_everything(conn, MstWar),
+        mstEquips=await fetch.get_everything(conn, MstEquip),
+        mstCcs=await fetch.get_everything(conn, MstCommandCode),
+        mstMasterMissions=await fetch.get_everything(conn, MstMasterMission),
+    )
+
+
+async def get_sorted_basic_servants(
+    redis: Redis, region: Region, lang: Language, svts: list[MstSvt]
+) -> list[BasicServant]:  # pragma: no cover
+    return sort_by_collection_no(
+        await get_all_basic_servants(redis, region, lang, svts)
+    )
+
+
+async def get_sorted_basic_equips(
+    redis: Redis, region: Region, lang: Language, svts: list[MstSvt]
+) -> list[BasicEquip]:  # pragma: no cover
+    return sort_by_collection_no(await get_all_basic_equips(redis, region, lang, svts))
+
+
+def get_lang_export_files(
+    redis: Redis, region: Region, lang: Language, data: RegionMasterData
+) -> list[ExportFile]:  # pragma: no cover
+    export_files = [
+        ExportFile(
+            "basic_servant",
+            lambda _: get_sorted_basic_servants(redis, region, lang, data.all_servants),
+        ),
+        ExportFile(
+            "basic_equip",
+            lambda _: get_sorted_basic_equips(redis, region, lang, data.all_equips),
+        ),
+        ExportFile(
+            "basic_mystic_code",
+            lambda _: get_all_basic_mcs(region, lang, data.mstEquips),
+        ),
+        ExportFile(
+            "basic_command_code",
+            lambda _: sort_by_collection_no(
+                get_all_basic_ccs(region, lang, data.mstCcs)
+            ),
+        ),
+        ExportFile("basic_event", lambda _: get_all_basic_events(lang, data.mstEvents)),
+        ExportFile("basic_war", lambda _: get_all_basic_wars(lang, data.mstWars)),
+        ExportFile(
+            "nice_command_code",
+            lambda conn: get_all_nice_ccs(conn, region, lang, data.mstCcs),
+        ),
+        ExportFile(
+            "nice_item", lambda _: get_all_nice_items(region, lang, data.mstItems)
+        ),
+        ExportFile(
+            "nice_mystic_code",
+            lambda conn: get_all_nice_mcs(conn, region, lang, data.mstEquips),
+        ),
+        ExportFile("nice_bgm", lambda _: get_all_nice_bgms(region, lang, data.bgms)),
+    ]
+    for export_file in export_files:
+        export_file.name = get_export_file_name(export_file.name, lang)
+    return export_files
+
+
+def get_export_files(
+    redis: Redis, region: Region, data: RegionMasterData
+) -> list[ExportFile]:  # pragma: no cover
+    export_files = [
+        ExportFile("nice_enums", lambda _: ALL_ENUMS, dump_normal),
+        ExportFile("nice_trait", lambda _: TRAIT_NAME, dump_normal),
+        ExportFile(
+            "nice_master_mission",
+            lambda conn: get_all_nice_mms(conn, data.mstMasterMissions, Language.jp),
+        ),
+        ExportFile("nice_illustrator", lambda _: data.mstIllustrators),
+        ExportFile("nice_cv", lambda _: data.mstCvs),
+    ]
+    for lang in get_export_languages(region):
+        export_files += get_lang_export_files(redis, region, lang, data)
+    return export_files
+
+
+async def dump_export_file(
+    engine: AsyncEngine,
+    region_export: RegionExport,
+    export_file: ExportFile,
+    semaphore: asyncio.Semaphore,
+) -> dict[str, float]:  # pragma: no cover
+    async with semaphore, engine.connect() as conn:
+        start_time = time.perf_counter()
+        data = export_file.get_data(conn)
+        if inspect.isawaitable(data):
+            data = await data
+        await export_file.dump(region_export, export_file.name, data)
+    return {
+        export_file.name: log_export_file(region_export, export_file.name, start_time)
+    }
+
+
+async def export_region(
+    redis: Redis, region: Region, engine: AsyncEngine
+) -> dict[str, float]:  # pragma: no cover
+    """
+    Generate the export files of the region concurrently.
+    At most settings.export_workers connections are used at the same time.
+    The new files replace the previous ones once all of them are generated.
+    Return the run time of each file.
+    """
+    start_time = time.perf_counter()
+    logger.info(f"Exporting {region} data …")
+    data_version = await get_repo_version(redis, region)
+    region_export = RegionExport(
+        export_path / region.value,
+        get_export_salt(app_version, settings.asset_url),
+        settings.export_precompress,
+        data_version,
+        get_export_file_formats(),
+    )
+    semaphore = asyncio.Semaphore(settings.export_workers)
+
+    async with engine.connect() as conn:
+        data = await get_region_master_data(conn)
+
+    export_tasks = [
+        asyncio.create_task(export_coroutine)
+        for export_coroutine in (
+            *(
+                dump_export_file(engine, region_export, export_file, semaphore)
+                for export_file in get_export_files(redis, region, data)
+            ),
+            dump_svt(
+                engine,
+                region,
+                region_export,
+                "nice_servant",
+                data.all_servants,
+                semaphore,
+            ),
+            dump_svt(
+                engine, region, region_export, "nice_equip", data.all_equips, semaphore
+            ),
+        )
+    ]
+    try:
+        file_run_times: list[dict[str, float]] = await asyncio.gather(*export_tasks)
+    except BaseException:
+        for task in export_tasks:
+            task.cancel()
+        await asyncio.gather(*export_tasks, return_exceptions=True)
+        region_export.discard()
+        raise
+    # The previous files are served until all the new files are written
+    replace_count = region_export.swap()
+    logger.info(f"Swapped in {replace_count} new {region} export files.")
+    await write_manifest(region_export, region, data_version)
+    await region_export.save_index()
+    if region_export.delta_files:
+        logger.info(
+            f"Wrote {len(region_export.delta_files)} {region} delta files "
+            f"to {region_export.delta_path}."
+        )
+    prune_delta_folders(region_export.base_export_path, DELTA_KEEP_COUNT)
+    run_times = {
+        file_name: run_time
+        for file_run_time in file_run_times
+        for file_name, run_time in file_run_time.items()
+    }
+
+    run_time = time.perf_counter() - start_time
+    slowest_files = sorted(run_times.items(), key=lambda file: file[1], reverse=True)
+    slowest_files_str = ", ".join(
+        f"{file_name} {file_run_time:.2f}s"
+        for file_name, file_run_time in slowest_files[:5]
+    )
+    logger.info(
+        f"Exported {len(run_times)} {region} files in {run_time:.2f}s. "
+        f"Slowest: {slowest_files_str}"
+    )
+    return run_times
 
-            await conn.close()
 
-            run_time = time.perf_counter() - start_time
-            logger.info(f"Exported {region} data in {run_time:.2f}s.")
+async def generate_exports(
+    redis: Redis,
+    region_path: dict[Region, DirectoryPath],
+    async_engines: dict[Region, AsyncEngine],
+) -> None:  # pragma: no cover
+    """Generate the export files of all regions concurrently."""
+    await asyncio.gather(
+        *(export_region(redis, region, async_engines[region]) for region in region_path)
+    )
 
 
 async def update_master_repo_info(
     redis: Redis, region_path: dict[Region, DirectoryPath]
 ) -> None:
+    """
+    Record the imported gamedata commit of each region
+    and the entities that changed since the previously imported commit.
+    """
     for region, gamedata in region_path.items():
         if (gamedata / ".git").exists():
             repo = Repo(gamedata)
@@ -281,49 +518,398 @@ async def update_master_repo_info(
                 hash=latest_commit.hexsha[:6],
                 timestamp=latest_commit.committed_date,  # pyright: reportGeneralTypeIssues=false
             )
+            previous_repo_info = await get_repo_version(redis, region)
+            if previous_repo_info is not None:
+                change_set = await run_in_threadpool(
+                    get_change_set, gamedata, previous_repo_info, repo_info
+                )
+                if change_set is not None and change_set.changes is not None:
+                    await add_change_set(redis, region, change_set)
+                    change_count = sum(map(len, change_set.changes.values()))
+                    logger.info(f"Recorded {change_count} {region} entity changes.")
+                elif previous_repo_info.hash != repo_info.hash:
+                    # Mark the gap so /changes doesn't merge the sets across it
+                    await add_change_set(
+                        redis,
+                        region,
+                        DataChangeSet(
+                            previousVersion=previous_repo_info,
+                            version=repo_info,
+                            changes=None,
+                        ),
+                    )
+                    logger.info(f"Recorded unknown {region} entity changes.")
             await set_repo_version(redis, region, repo_info)
 
 
-async def clear_bloom_redis_cache(redis: Redis) -> None:  # pragma: no cover
+async def get_master_changed_files(
+    redis: Redis, region_path: dict[Region, DirectoryPath]
+) -> RegionChangedFiles:
+    changed_files: RegionChangedFiles = {}
+    for region, gamedata in region_path.items():
+        repo_info = await get_repo_version(redis, region)
+        region_changes = (
+            get_changed_files(gamedata, repo_info.hash) if repo_info else None
+        )
+        if region_changes is None:
+            logger.info(f"Can't find {region} changed files. Reloading everything.")
+        else:
+            logger.info(f"Found {len(region_changes)} {region} changed files.")
+        changed_files[region] = region_changes
+    return changed_files
+
+
+# Number of keys scanned and unlinked per Redis call
+CACHE_CLEANUP_BATCH_SIZE = 1000
+
+
+async def unlink_outdated_cache(redis: Redis, delay: float = 0) -> None:
+    """
+    Unlink the cached responses of the previous app and data versions after delay
+    seconds. The responses of the current versions use other keys, see
+    get_cache_version, so they aren't affected.
+    """
+    await asyncio.sleep(delay)
+    data_versions = await get_repo_hashes(redis)
+    current_prefixes = tuple(
+        f"{CACHE_PREFIX}:{get_cache_version(data_versions, region)}:".encode("utf-8")
+        for region in [*Region, None]
+    )
+
     key_count = 0
-    async for key in redis.scan_iter(match=f"{settings.redis_prefix}:cache*"):
-        await redis.delete(key)
-        key_count += 1
-    logger.info(f"Cleared {key_count} cache redis keys.")
+    outdated_keys: list[bytes] = []
+    async for key in redis.scan_iter(
+        match=f"{CACHE_PREFIX}:*", count=CACHE_CLEANUP_BATCH_SIZE
+    ):
+        if not key.startswith(current_prefixes):
+            outdated_keys.append(key)
+        if len(outdated_keys) >= CACHE_CLEANUP_BATCH_SIZE:
+            key_count += await redis.unlink(*outdated_keys)
+            outdated_keys.clear()
+    if outdated_keys:
+        key_count += await redis.unlink(*outdated_keys)
+    logger.info(f"Unlinked {key_count} outdated cache redis keys.")
+
+
+async def run_import_jobs(
+    jobs: list[ImportJob], max_workers: int
+) -> None:  # pragma: no cover
+    """
+    Run the import jobs with at most max_workers loaders running at the same time
+    and log the slowest jobs.
+    """
+    if not jobs:
+        return
+
+    logger.info(f"Loading data with {max_workers} workers …")
+    start_loading_time = time.perf_counter()
 
+    run_times = await run_jobs(jobs, max_workers)
 
-async def load_svt_extra(
-    redis: Redis, region_path: dict[Region, DirectoryPath]
+    loading_time = time.perf_counter() - start_loading_time
+    slowest_jobs = sorted(run_times.items(), key=lambda job: job[1], reverse=True)
+    slowest_jobs_str = ", ".join(
+        f"{name} {run_time:.2f}s" for name, run_time in slowest_jobs[:5]
+    )
+    logger.info(
+        f"Loaded {len(jobs)} jobs in {loading_time:.2f}s. Slowest: {slowest_jobs_str}"
+    )
+
+
+async def load_data(
+    redis: Redis,
+    region_path: dict[Region, DirectoryPath],
+    changed_files: Optional[RegionChangedFiles] = None,
 ) -> None:  # pragma: no cover
-    logger.info("Loading extra svt data …")
-    start_loading_time = time.perf_counter()
+    """
+    Load the DB tables and redis hashes of all regions concurrently
+    with at most settings.import_workers loaders running at the same time.
+    """
+    jobs: list[ImportJob] = []
+    if settings.write_postgres_data:
+        jobs += get_db_jobs(region_path, changed_files)
+    if settings.write_redis_data:
+        jobs += get_redis_jobs(redis, region_path, changed_files)
+    await run_import_jobs(jobs, settings.import_workers)
+
+
+def get_data_version(region_path: dict[Region, DirectoryPath]) -> Optional[str]:
+    """
+    Version of the imported data: the app version and the gamedata commit of
+    each region. None if a gamedata folder isn't a git repo.
+    """
+    versions = [f"app:{app_version}"]
+    for region, gamedata in region_path.items():
+        if not (gamedata / ".git").exists():
+            return None
+        versions.append(f"{region.name}:{Repo(gamedata).commit().hexsha}")
+    return ",".join(versions)
+
+
+def get_export_version() -> Optional[str]:
+    if export_version_file.exists():
+        return export_version_file.read_text(encoding="utf-8")
+    return None
+
 
-    for region, gamedata_path in region_path.items():
-        svtExtras = get_extra_svt_data(region, gamedata_path)
-        if settings.write_postgres_data:
-            load_pydantic_to_db(engines[region], svtExtras, mstSvtExtra)
-        if settings.write_redis_data:
-            await load_svt_extra_redis(redis, region, svtExtras)
+async def is_data_current(redis: Redis, data_version: Optional[str]) -> bool:
+    return data_version is not None and (
+        await get_imported_version(redis) == data_version
+        and get_export_version() == data_version
+    )
 
-    extra_loading_time = time.perf_counter() - start_loading_time
-    logger.info(f"Loaded extra svt data in {extra_loading_time:.2f}s.")
+
+async def extend_import_lock(lock: Lock) -> None:  # pragma: no cover
+    while True:
+        await asyncio.sleep(IMPORT_LOCK_TIMEOUT / 5)
+        await lock.reacquire()
+
+
+@asynccontextmanager
+async def import_lock(redis: Redis) -> AsyncIterator[None]:  # pragma: no cover
+    """Hold the import lock shared by all processes until the context exits."""
+    logger.info("Waiting for the import lock …")
+    lock = redis.lock(IMPORT_LOCK_KEY, timeout=IMPORT_LOCK_TIMEOUT, thread_local=False)
+    async with lock:
+        lock_extender = asyncio.create_task(extend_import_lock(lock))
+        try:
+            yield
+        finally:
+            lock_extender.cancel()
 
 
 async def load_and_export(
     redis: Redis,
     region_path: dict[Region, DirectoryPath],
     async_engines: dict[Region, AsyncEngine],
+    incremental: bool = False,
+    background_exports: bool = False,
 ) -> None:  # pragma: no cover
-    if settings.write_postgres_data:
-        update_db(region_path)
-    if settings.write_redis_data:
-        await load_redis_data(redis, region_path)
-    if settings.write_postgres_data or settings.write_redis_data:
-        await load_svt_extra(redis, region_path)
+    """
+    Load the gamedata into Postgres and Redis and generate the export files.
+    If incremental is True, only data whose source files changed since
+    the last imported commit is reloaded.
+    If background_exports is True, the export files are generated in a background
+    process and this returns as soon as Postgres and Redis are current.
+
+    Only one process imports at a time. The steps that were already done for the
+    current data version by another process are skipped.
+    """
+    if not (
+        settings.write_postgres_data
+        or settings.write_redis_data
+        or settings.export_all_nice
+    ):
+        # The data is imported separately, e.g. with the app.cli import command
+        await update_master_repo_info(redis, region_path)
+        return
+
+    data_version = get_data_version(region_path)
+    if await is_data_current(redis, data_version):
+        logger.info(f"Data version {data_version} is already imported.")
+        return
+
+    if data_version is None or await get_imported_version(redis) != data_version:
+        async with import_lock(redis):
+            await import_data_version(redis, region_path, data_version, incremental)
+
+    if background_exports:
+        start_background_exports(redis, region_path, data_version)
+    else:
+        async with import_lock(redis):
+            await update_exports(redis, region_path, async_engines, data_version)
+
+
+async def import_data_version(
+    redis: Redis,
+    region_path: dict[Region, DirectoryPath],
+    data_version: Optional[str],
+    incremental: bool,
+) -> None:  # pragma: no cover
+    if data_version is not None and await get_imported_version(redis) == data_version:
+        logger.info(f"Data version {data_version} is already loaded.")
+        return
+
+    changed_files = (
+        await get_master_changed_files(redis, region_path) if incremental else None
+    )
+    await load_data(redis, region_path, changed_files)
+    all_data_loaded = settings.write_postgres_data and settings.write_redis_data
+    await finish_data_import(
+        redis, region_path, data_version if all_data_loaded else None
+    )
+
+
+async def update_exports(
+    redis: Redis,
+    region_path: dict[Region, DirectoryPath],
+    async_engines: dict[Region, AsyncEngine],
+    data_version: Optional[str],
+) -> None:  # pragma: no cover
+    """Generate the export files if they aren't generated for data_version yet"""
+    if data_version is not None and get_export_version() == data_version:
+        logger.info(f"Exports of data version {data_version} are already generated.")
+    elif settings.export_all_nice:
+        await export_data_version(redis, region_path, async_engines, data_version)
+    elif data_version is not None:
+        export_version_file.write_text(data_version, encoding="utf-8")
+
+
+# Keep a reference to the running tasks so they aren't garbage collected
+background_tasks: set["asyncio.Task[None]"] = set()
+
+
+def log_task_exception(task: "asyncio.Task[None]") -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task failed.", exc_info=task.exception())
+
+
+def start_background_task(coroutine: Coroutine[Any, Any, None]) -> None:
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    task.add_done_callback(log_task_exception)
+
+
+async def cancel_background_tasks() -> None:  # pragma: no cover
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+
+async def wait_background_tasks() -> None:  # pragma: no cover
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+
+async def update_exports_standalone(
+    region_path: dict[Region, DirectoryPath], data_version: Optional[str]
+) -> None:  # pragma: no cover
+    redis = await Redis.from_url(secrets.redisdsn)
+    async_engines = get_async_engines()
+    try:
+        await update_exports(redis, region_path, async_engines, data_version)
+    finally:
+        for engine in async_engines.values():
+            await engine.dispose()
+        await redis.close()
+
+
+def run_export_process(
+    region_path: dict[Region, DirectoryPath], data_version: Optional[str]
+) -> None:  # pragma: no cover
+    """Entry point of the export process, see update_exports_in_background"""
+    asyncio.run(update_exports_standalone(region_path, data_version))
+
+
+async def fail_running_export(redis: Redis, error: str) -> None:
+    """Mark a running export as failed, e.g. if its process was killed"""
+    export_status = await get_export_status(redis)
+    if export_status is not None and export_status.state == ExportState.RUNNING:
+        export_status.state = ExportState.FAILED
+        export_status.error = error
+        export_status.finishedAt = int(time.time())
+        await set_export_status(redis, export_status)
+
+
+async def update_exports_in_background(
+    redis: Redis, region_path: dict[Region, DirectoryPath], data_version: Optional[str]
+) -> None:  # pragma: no cover
+    """
+    Generate the export files in a separate process so the CPU-bound rendering
+    doesn't block the event loop of the API worker.
+    The import lock is held until the process exits.
+    """
+    try:
+        async with import_lock(redis):
+            # Spawned, not forked, so it doesn't inherit the API worker's connections
+            process = multiprocessing.get_context("spawn").Process(
+                target=run_export_process,
+                args=(region_path, data_version),
+                name="exports",
+            )
+            process.start()
+            try:
+                await run_in_threadpool(process.join)
+            except asyncio.CancelledError:
+                process.terminate()
+                await run_in_threadpool(process.join)
+                await fail_running_export(redis, "Cancelled")
+                raise
+            if process.exitcode != 0:
+                error = f"The export process exited with code {process.exitcode}."
+                await fail_running_export(redis, error)
+                raise RuntimeError(error)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Failed to generate the export files.")
+
+
+def start_background_exports(
+    redis: Redis,
+    region_path: dict[Region, DirectoryPath],
+    data_version: Optional[str],
+) -> None:  # pragma: no cover
+    """
+    Generate the export files in a background task and process.
+    The previous export files are served until the new ones are swapped in.
+    See get_export_status for the progress.
+    """
+    start_background_task(
+        update_exports_in_background(redis, region_path, data_version)
+    )
+
+
+async def finish_data_import(
+    redis: Redis,
+    region_path: dict[Region, DirectoryPath],
+    data_version: Optional[str],
+) -> None:  # pragma: no cover
+    """
+    Record the imported gamedata commits, which switches the response cache to
+    new keys, and unlink the outdated cache in the background.
+    data_version is marked as imported if it's not None.
+    """
     await update_master_repo_info(redis, region_path)
     if settings.clear_redis_cache:
-        await clear_bloom_redis_cache(redis)
-    await generate_exports(redis, region_path, async_engines)
+        # Wait for the workers to pick up the new data version so the responses
+        # they cache with the previous one in the meantime are unlinked too
+        start_background_task(
+            unlink_outdated_cache(redis, settings.local_cache_check_interval * 2)
+        )
+    if data_version is not None:
+        await set_imported_version(redis, data_version)
+
+
+async def export_data_version(
+    redis: Redis,
+    region_path: dict[Region, DirectoryPath],
+    async_engines: dict[Region, AsyncEngine],
+    data_version: Optional[str],
+) -> None:  # pragma: no cover
+    """
+    Generate the export files and record the progress in the export status.
+    data_version is marked as exported if it's not None.
+    """
+    export_status = ExportStatus(
+        state=ExportState.RUNNING,
+        dataVersion=data_version,
+        regions=list(region_path),
+        startedAt=int(time.time()),
+    )
+    await set_export_status(redis, export_status)
+    try:
+        await generate_exports(redis, region_path, async_engines)
+    except BaseException as e:
+        export_status.state = ExportState.FAILED
+        export_status.error = repr(e)
+        export_status.finishedAt = int(time.time())
+        await set_export_status(redis, export_status)
+        raise
+
+    if data_version is not None:
+        export_version_file.write_text(data_version, encoding="utf-8")
+    export_status.state = ExportState.FINISHED
+    export_status.finishedAt = int(time.time())
+    await set_export_status(redis, export_status)
 
 
 def update_data_repo(
@@ -346,4 +932,10 @@ async def pull_and_update(
     logger.info(f"Sleeping {settings.github_webhook_sleep} seconds …")
     await asyncio.sleep(settings.github_webhook_sleep)
     await run_in_threadpool(lambda: update_data_repo(region_path))
-    await load_and_export(redis, region_path, async_engines)
+    await load_and_export(
+        redis,
+        region_path,
+        async_engines,
+        settings.incremental_update,
+        background_exports=True,
+    )
@@ -1,10 +1,18 @@
-import json
+import asyncio
+import os
 from collections import defaultdict
+from functools import partial
 from pathlib import Path
 from typing import Any, Callable, NamedTuple, Union
 
-from app.config import Settings
+import orjson
+
+from app.config import Settings, app_version, logger
 from app.core.utils import get_traits_list
+from app.data.utils import get_master_file_paths, load_master_json
+from app.exports.index import get_export_salt
+from app.exports.writer import get_temp_path
+from app.scheduler import ImportJob, run_jobs
 from app.schemas.common import Region
 from app.schemas.enums import ATTRIBUTE_NAME, CLASS_NAME
 from app.schemas.gameenums import (
@@ -148,7 +156,9 @@ def get_nice_attackrate(raw_data: Any) -> Any:
 
 def get_nice_card_data(raw_data: Any) -> Any:
     out_data: dict[str, dict[int, Any]] = {}
-    for card in raw_data:
+    for raw_card in raw_data:
+        # The parsed master data is shared so the dicts are copied before changing them
+        card = dict(raw_card)
         card_id = card["id"]
         card_index = card["num"]
         card["individuality"] = [
@@ -226,10 +236,7 @@ def get_nice_buff_action(raw_data: Any) -> Any:
             {buff["maxRate"] for buff in raw_data if buff["type"] in buff_types}
         )
 
-    with open(
-        Path(__file__).parent / "BuffList.ActionList.json", "r", encoding="utf-8"
-    ) as fp:
-        data = json.load(fp)
+    data = orjson.loads(BUFF_ACTION_LIST_PATH.read_bytes())
 
     out_data = {}
 
@@ -249,6 +256,9 @@ def get_nice_buff_action(raw_data: Any) -> Any:
     return out_data
 
 
+BUFF_ACTION_LIST_PATH = Path(__file__).parent / "BuffList.ActionList.json"
+
+
 # pylint: disable=inherit-non-class
 class ExportParam(NamedTuple):
     input: str
@@ -285,31 +295,64 @@ TO_EXPORT = [
         output="NiceSvtGrailCost",
     ),
 ]
+USER_LEVEL_INPUTS = ["mstUserExp", "mstGift"]
+USER_LEVEL_OUTPUT = "NiceUserLevel"
+
+
+def write_export_file(export_file: Path, data: Any) -> None:
+    temp_path = get_temp_path(export_file)
+    try:
+        temp_path.write_bytes(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS))
+        os.replace(temp_path, export_file)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+def is_export_current(export_file: Path, input_files: list[Path]) -> bool:
+    """Whether export_file was written after all of its input files were last changed"""
+    try:
+        export_mtime = export_file.stat().st_mtime_ns
+    except OSError:
+        return False
+    return all(
+        input_file.stat().st_mtime_ns <= export_mtime for input_file in input_files
+    )
 
 
-def export_constant(region: Region, master_path: Path, export_path: Path) -> None:
-    for export in TO_EXPORT:
-        print(f"Exporting {export.input} ...")
-        with open(
-            master_path / "master" / f"{export.input}.json", "r", encoding="utf-8"
-        ) as fp:
-            raw_data = json.load(fp)
-        export_file = export_path / region.value / f"{export.output}.json"
-        with open(export_file, "w", encoding="utf-8") as fp:
-            json.dump(export.converter(raw_data), fp, ensure_ascii=False)
+# Salt of the code that converted the constant files of a region folder
+CONSTANT_SALT_FILE = ".constant_salt"
+
+
+def get_constant_export_salt() -> str:
+    """Hash of the app version and code, including this module's converters"""
+    return get_export_salt(app_version, Path(__file__).read_text(encoding="utf-8"))
+
+
+def is_constant_salt_current(region_export_path: Path, salt: str) -> bool:
+    salt_file = region_export_path / CONSTANT_SALT_FILE
+    return salt_file.exists() and salt_file.read_text(encoding="utf-8") == salt
+
+
+def write_constant_salt(region_export_path: Path, salt: str) -> None:
+    (region_export_path / CONSTANT_SALT_FILE).write_text(salt, encoding="utf-8")
+
+
+def export_constant(
+    region: Region, master_path: Path, export_path: Path, export: ExportParam
+) -> None:
+    raw_data = load_master_json(master_path, export.input)
+    export_file = export_path / region.value / f"{export.output}.json"
+    write_export_file(export_file, export.converter(raw_data))
 
 
 def export_nice_master_lvl(region: Region, master_path: Path, export_path: Path) -> Any:
-    print("Exporting nice master level ...")
     constant_path = export_path / region.value / f"{TO_EXPORT[0].output}.json"
-    with open(constant_path, "r", encoding="utf-8") as fp:
-        constant = json.load(fp)
-    with open(master_path / "master" / "mstUserExp.json", "r", encoding="utf-8") as fp:
-        mstUserExp: list[dict[str, int]] = json.load(fp)
-    with open(master_path / "master" / "mstGift.json", "r", encoding="utf-8") as fp:
-        mstGiftId: dict[int, dict[str, int]] = {
-            gift["id"]: gift for gift in json.load(fp)
-        }
+    constant = orjson.loads(constant_path.read_bytes())
+    mstUserExp: list[dict[str, int]] = load_master_json(master_path, "mstUserExp")
+    mstGiftId: dict[int, dict[str, int]] = {
+        gift["id"]: gift for gift in load_master_json(master_path, "mstGift")
+    }
 
     def get_current_value(base: int, key: str, current: int) -> int:
         return base + sum(user_exp[key] for user_exp in mstUserExp[: current + 1])
@@ -335,19 +378,99 @@ def export_nice_master_lvl(region: Region, master_path: Path, export_path: Path)
         for lvli, lvl in enumerate(mstUserExp)
     }
 
-    export_file = export_path / region.value / "NiceUserLevel.json"
-    with open(export_file, "w", encoding="utf-8") as fp:
-        json.dump(nice_data, fp, ensure_ascii=False)
+    export_file = export_path / region.value / f"{USER_LEVEL_OUTPUT}.json"
+    write_export_file(export_file, nice_data)
+
+
+def get_constant_export_jobs(
+    region: Region, master_path: Path, export_path: Path, force: bool = False
+) -> list[ImportJob]:
+    """
+    Return the jobs that convert the constant master files of the region.
+    Exports that are newer than their input files are skipped unless force is True
+    or the app version or code changed since the region's files were converted,
+    see get_constant_export_salt. The converters are run in a pool of processes.
+    """
+    region_export_path = export_path / region.value
+    job_prefix = f"{region.name}:constant"
+    jobs: list[ImportJob] = []
+    salt = get_constant_export_salt()
+    salt_current = is_constant_salt_current(region_export_path, salt)
+    force = force or not salt_current
+    for export in TO_EXPORT:
+        input_files = get_master_file_paths(master_path, [export.input])
+        if export.converter is get_nice_buff_action:
+            input_files.append(BUFF_ACTION_LIST_PATH)
+        if force or not is_export_current(
+            region_export_path / f"{export.output}.json", input_files
+        ):
+            jobs.append(
+                ImportJob(
+                    f"{job_prefix}:{export.output}",
+                    partial(export_constant, region, master_path, export_path, export),
+                    process=True,
+                )
+            )
+
+    constant_job_name = f"{job_prefix}:{TO_EXPORT[0].output}"
+    constant_exported = any(job.name == constant_job_name for job in jobs)
+    user_level_inputs = get_master_file_paths(master_path, USER_LEVEL_INPUTS)
+    if (
+        force
+        or constant_exported
+        or not is_export_current(
+            region_export_path / f"{USER_LEVEL_OUTPUT}.json",
+            [*user_level_inputs, region_export_path / f"{TO_EXPORT[0].output}.json"],
+        )
+    ):
+        jobs.append(
+            ImportJob(
+                f"{job_prefix}:{USER_LEVEL_OUTPUT}",
+                partial(export_nice_master_lvl, region, master_path, export_path),
+                depends=[constant_job_name] if constant_exported else [],
+                process=True,
+            )
+        )
+
+    if not salt_current:
+        jobs.append(
+            ImportJob(
+                f"{job_prefix}:salt",
+                partial(write_constant_salt, region_export_path, salt),
+                depends=[job.name for job in jobs],
+            )
+        )
+    return jobs
+
+
+async def export_constants(
+    region_path: dict[Region, Path],
+    export_path: Path,
+    max_workers: int,
+    force: bool = False,
+) -> dict[str, float]:
+    """
+    Convert the constant master files of all regions in a pool of max_workers
+    processes, see get_constant_export_jobs. Return the run time of each job.
+    """
+    jobs = [
+        job
+        for region, master_path in region_path.items()
+        for job in get_constant_export_jobs(region, master_path, export_path, force)
+    ]
+    return await run_jobs(jobs, max_workers)
 
 
 def main() -> None:
     settings = Settings()
-    region_path = [(Region.NA, settings.na_gamedata), (Region.JP, settings.jp_gamedata)]
+    region_path = {Region.NA: settings.na_gamedata, Region.JP: settings.jp_gamedata}
     export_path = Path(__file__).resolve().parents[1] / "export"
-    for region, gamedata in region_path:
-        print(region)
-        export_constant(region, gamedata, export_path)
-        export_nice_master_lvl(region, gamedata, export_path)
+    run_times = asyncio.run(
+        export_constants(region_path, export_path, settings.import_workers)
+    )
+    for job_name, run_time in run_times.items():
+        logger.info(f"Exported {job_name} in {run_time:.2f}s.")
+    logger.info(f"Exported {len(run_times)} constant files.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+import argparse
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+import orjson
+from sqlalchemy import Table, select
+from sqlalchemy.engine import Connection
+
+from app.db.bulk import copy_to_db
+from app.db.engine import engines
+from app.db.load import recreate_table, remove_unknown_columns
+from app.models.base import metadata
+from app.schemas.common import Region
+
+
+def executemany_to_db(conn: Connection, table: Table, data: Any) -> None:
+    conn.execute(table.insert(), data)
+
+
+def time_load(
+    region: Region,
+    table: Table,
+    data: list[dict[str, Any]],
+    load_func: Callable[[Connection, Table, Any], None],
+    repeat: int,
+) -> tuple[float, list[Any]]:
+    best_time = float("inf")
+    rows: list[Any] = []
+    for _ in range(repeat):
+        with engines[region].begin() as conn:
+            recreate_table(conn, table)
+            start_time = time.perf_counter()
+            load_func(conn, table, data)
+            best_time = min(best_time, time.perf_counter() - start_time)
+            rows = [tuple(row) for row in conn.execute(select(table)).fetchall()]
+    return best_time, rows
+
+
+def main(gamedata: Path, region: Region, repeat: int) -> None:
+    print(f"{'table':<40} {'rows':>8} {'executemany':>12} {'copy':>10} {'speedup':>8}")
+    for table_json in sorted((gamedata / "master").glob("*.json")):
+        table = metadata.tables.get(table_json.stem)
+        if table is None:
+            continue
+
+        with open(table_json, "rb") as fp:
+            data = list(remove_unknown_columns(orjson.loads(fp.read()), table))
+        if not data:
+            continue
+
+        insert_time, insert_rows = time_load(
+            region, table, data, executemany_to_db, repeat
+        )
+        copy_time, copy_rows = time_load(region, table, data, copy_to_db, repeat)
+        if sorted(insert_rows, key=repr) != sorted(copy_rows, key=repr):
+            print(f"{table.name}: loaded rows are different!")
+
+        print(
+            f"{table.name:<40} {len(data):>8} {insert_time:>11.3f}s "
+            f"{copy_time:>9.3f}s {insert_time / copy_time:>7.1f}x"
+        )
+
+        with engines[region].begin() as conn:
+            table.drop(conn, checkfirst=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare executemany INSERT and COPY loading of master data."
+    )
+    parser.add_argument(
+        "--gamedata",
+        type=Path,
+        default=Path(__file__).resolve().parents[1] / "tests" / "test_data_gamedata",
+        help="Gamedata folder that contains the master folder.",
+    )
+    parser.add_argument("--region", type=Region, default=Region.NA)
+    parser.add_argument("--repeat", type=int, default=3)
+
+    args = parser.parse_args()
+    main(args.gamedata, args.region, args.repeat)
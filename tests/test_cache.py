@@ -0,0 +1,288 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import Any, AsyncIterator
+
+import pytest
+from aioredis import Redis
+from fastapi import Depends, FastAPI, Response
+from fastapi_cache import FastAPICache
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.config import app_version
+from app.main import custom_key_builder
+from app.redis.helpers.repo_version import get_repo_hashes
+from app.routers import cache as cache_module
+from app.routers.cache import (
+    CACHE_PREFIX,
+    LocalCache,
+    RedisCodec,
+    ResponseCoder,
+    SingleFlight,
+    TwoTierBackend,
+    cache,
+    etag_matches,
+    get_cache_version,
+    get_key_etag,
+    get_key_namespace,
+    pack_redis_value,
+    unpack_redis_value,
+)
+from app.routers.deps import get_db
+from app.routers.utils import JSON_MIME, pretty_print_response
+from app.schemas.common import Region
+from app.tasks import unlink_outdated_cache
+
+
+def test_local_cache_size_bound() -> None:
+    local_cache = LocalCache(max_size=10, max_item_size=6)
+    local_cache.set("a", b"1234")
+    local_cache.set("b", b"1234")
+    assert local_cache.size == 8
+
+    # "a" is now more recently used than "b" so "b" is evicted first
+    assert local_cache.get("a") is not None
+    local_cache.set("c", b"1234")
+    assert local_cache.get("b") is None
+    assert local_cache.get("a") is not None
+    assert local_cache.size == 8
+
+    local_cache.set("a", b"12")
+    assert local_cache.size == 6
+
+    local_cache.set("big", b"1234567")
+    assert local_cache.get("big") is None
+    assert len(local_cache) == 2
+
+    local_cache.clear()
+    assert local_cache.size == 0
+    assert local_cache.get("c") is None
+
+
+def test_local_cache_expire() -> None:
+    local_cache = LocalCache(max_size=10, max_item_size=10)
+    local_cache.set("a", b"1", expire=1)
+    local_cache.entries["a"].expire_at = time.monotonic() - 1
+    assert local_cache.get("a") is None
+    assert local_cache.size == 0
+
+
+def test_cache_version() -> None:
+    data_versions = {Region.JP: "4b2f1a", Region.NA: "0c9e7d"}
+    assert get_cache_version(data_versions, Region.NA, "5.71.0") == (
+        "app-5.71.0.NA-0c9e7d"
+    )
+    assert get_cache_version(data_versions, version="5.71.0") == (
+        "app-5.71.0.JP-4b2f1a.NA-0c9e7d"
+    )
+    assert get_cache_version(data_versions, Region.NA) == (
+        f"app-{app_version}.NA-0c9e7d"
+    )
+    key = "fgoapi:cache:app-5.71.0.NA-0c9e7d:nice:2ef7bde608ce"
+    assert get_key_namespace(key) == "nice"
+
+
+def test_cache_version_app_upgrade() -> None:
+    # The same data version and request with the response built by another version
+    data_versions = {Region.NA: "0c9e7d"}
+    old_key, new_key = (
+        f"{CACHE_PREFIX}:{get_cache_version(data_versions, Region.NA, version)}"
+        ":nice:2ef7bde608ce"
+        for version in ("5.71.0", "5.72.0")
+    )
+    assert old_key != new_key
+    assert get_key_etag(old_key) != get_key_etag(new_key)
+
+
+def test_etag() -> None:
+    etag = get_key_etag("fgoapi:cache:app-5.71.0.NA-0c9e7d:nice:2ef7bde608ce")
+    assert etag == '"app-5.71.0.NA-0c9e7d-2ef7bde608ce"'
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_response_coder() -> None:
+    response = pretty_print_response({"id": 100100, "name": "Altria Pendragon"})
+    response.headers["x-test"] = "test"
+    encoded = ResponseCoder.encode(response)
+    assert encoded.endswith(response.body)
+
+    decoded = ResponseCoder.decode(encoded)
+    assert decoded.body == response.body
+    assert decoded.status_code == 200
+    assert decoded.headers["content-type"] == JSON_MIME
+    assert decoded.headers["content-length"] == str(len(response.body))
+    assert decoded.headers["x-test"] == "test"
+
+    with pytest.raises(TypeError):
+        ResponseCoder.encode({"id": 100100})
+
+
+def test_redis_value_compression() -> None:
+    assert unpack_redis_value(pack_redis_value(b"small")) == b"small"
+    big_value = b'{"id":100100}' * 1000
+    packed = pack_redis_value(big_value)
+    assert packed[0] == RedisCodec.ZSTD
+    assert len(packed) < len(big_value)
+    assert unpack_redis_value(packed) == big_value
+    # Values pickled by an older version
+    assert unpack_redis_value(b"\x80\x04") is None
+
+
+def test_redis_value_compression_zlib(monkeypatch: pytest.MonkeyPatch) -> None:
+    big_value = b'{"id":100100}' * 1000
+    zstd_packed = pack_redis_value(big_value)
+    monkeypatch.setattr(cache_module, "HAS_ZSTANDARD", False)
+    packed = pack_redis_value(big_value)
+    assert packed[0] == RedisCodec.ZLIB
+    assert unpack_redis_value(packed) == big_value
+    # Values compressed by a worker with zstandard can't be read without it
+    assert unpack_redis_value(zstd_packed) is None
+
+
+@pytest.mark.asyncio
+async def test_single_flight() -> None:
+    single_flight = SingleFlight()
+    call_count = 0
+
+    async def build() -> bytes:
+        nonlocal call_count
+        call_count += 1
+        await asyncio.sleep(0.01)
+        return b"value"
+
+    results = await asyncio.gather(*(single_flight.do("key", build) for _ in range(10)))
+    assert results == [b"value"] * 10
+    assert call_count == 1
+    assert single_flight.calls == {}
+
+    async def fail() -> bytes:
+        raise ValueError("failed")
+
+    errors = await asyncio.gather(
+        *(single_flight.do("key", fail) for _ in range(2)), return_exceptions=True
+    )
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert single_flight.calls == {}
+
+
+@pytest.mark.asyncio
+async def test_two_tier_backend(redis: Redis) -> None:
+    backend = TwoTierBackend(redis, 1024, 60)
+    key = "fgoapi:cache:test:two_tier_backend"
+    await redis.delete(key)
+
+    assert await backend.get(key) is None
+    await backend.set(key, b"value", 60)
+    assert await redis.get(key) == pack_redis_value(b"value")
+    backend.local.clear()
+    assert await backend.get(key) == b"value"
+    ttl, value = await backend.get_with_ttl(key)
+    assert 0 < ttl <= 60
+    assert value == b"value"
+
+    stats = backend.get_stats().namespaces["test"]
+    assert (stats.localHits, stats.redisHits, stats.misses) == (1, 1, 1)
+
+    backend.data_versions = {Region.NA: "outdated"}
+    await backend.update_data_versions()
+    assert len(backend.local) == 0
+    await redis.delete(key)
+
+
+@pytest.mark.asyncio
+async def test_unlink_outdated_cache(redis: Redis) -> None:
+    cache_version = get_cache_version(await get_repo_hashes(redis), Region.NA)
+    current_key = f"{CACHE_PREFIX}:{cache_version}:nice:current"
+    outdated_key = f"{CACHE_PREFIX}:app-{app_version}.NA-outdated:nice:outdated"
+    old_app_version = get_cache_version(await get_repo_hashes(redis), Region.NA, "0")
+    old_app_key = f"{CACHE_PREFIX}:{old_app_version}:nice:old_app"
+    await redis.set(current_key, b"current")
+    await redis.set(outdated_key, b"outdated")
+    await redis.set(old_app_key, b"old_app")
+
+    await unlink_outdated_cache(redis)
+    assert await redis.get(current_key) == b"current"
+    assert await redis.get(outdated_key) is None
+    assert await redis.get(old_app_key) is None
+    await redis.delete(current_key)
+
+
+class CountingEngine:
+    """Engine whose connections only count how many were checked out"""
+
+    def __init__(self) -> None:
+        self.connect_count = 0
+
+    @asynccontextmanager
+    async def connect(self) -> AsyncIterator[Any]:
+        self.connect_count += 1
+        yield SimpleNamespace(info={})
+
+
+@pytest.mark.asyncio
+async def test_cache_lazy_db(redis: Redis, monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = TwoTierBackend(redis, 1024 * 1024, 60)
+    backend.data_versions = {Region.NA: f"lazy-db-{time.time()}"}
+    backend.next_check = time.monotonic() + 60
+    for name, value in (
+        ("_backend", backend),
+        ("_prefix", CACHE_PREFIX),
+        ("_expire", 60),
+        ("_coder", ResponseCoder),
+        ("_key_builder", custom_key_builder),
+    ):
+        monkeypatch.setattr(FastAPICache, name, value)
+
+    test_app = FastAPI()
+    engine = CountingEngine()
+    test_app.state.async_engines = {Region.NA: engine}
+    build_count = 0
+
+    @test_app.get("/{region}/servant/{item_id}")
+    @cache()
+    async def get_servant(
+        item_id: int, conn: AsyncConnection = Depends(get_db)
+    ) -> Response:
+        nonlocal build_count
+        build_count += 1
+        await asyncio.sleep(0.01)
+        return pretty_print_response({"id": item_id, "region": conn.info["region"]})
+
+    openapi_parameters = test_app.openapi()["paths"]["/{region}/servant/{item_id}"][
+        "get"
+    ]["parameters"]
+    assert {parameter["name"] for parameter in openapi_parameters} == {
+        "item_id",
+        "region",
+    }
+
+    async with AsyncClient(app=test_app, base_url="http://test") as client:
+        responses = await asyncio.gather(
+            *(client.get("/NA/servant/100100") for _ in range(5))
+        )
+        assert {response.json()["region"] for response in responses} == {"NA"}
+        assert (build_count, engine.connect_count) == (1, 1)
+
+        etag = responses[0].headers["ETag"]
+        not_modified = await client.get(
+            "/NA/servant/100100", headers={"If-None-Match": etag}
+        )
+        assert not_modified.status_code == 304
+        assert (await client.get("/NA/servant/100100")).status_code == 200
+        assert (build_count, engine.connect_count) == (1, 1)
+
+        no_store = await client.get(
+            "/NA/servant/100100", headers={"Cache-Control": "no-store"}
+        )
+        assert no_store.status_code == 200
+        assert (build_count, engine.connect_count) == (2, 2)
+
+    cache_version = backend.get_cache_version(Region.NA)
+    async for key in redis.scan_iter(match=f"{CACHE_PREFIX}:{cache_version}:*"):
+        await redis.delete(key)
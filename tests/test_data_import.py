@@ -1,5 +1,43 @@
+import io
+from pathlib import Path
+from typing import Any
+
+import orjson
+import pytest
+from git import Repo  # type: ignore
+from sqlalchemy import Boolean, Column, Integer, MetaData, String, Table, select
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+
+from app.cli import DEFAULT_STAGES, get_parser, get_stages
+from app.data.changes import (
+    get_change_set,
+    get_changed_rows,
+    get_entity_changes,
+    merge_change_sets,
+)
+from app.data.diff import get_changed_files, is_master_changed, is_script_changed
 from app.data.event import get_event_with_warIds
 from app.data.item import get_item_with_use
+from app.data.utils import (
+    MasterDataRegistry,
+    get_master_file_paths,
+    iter_json_array,
+    iter_master_json,
+    read_master_json,
+)
+from app.db.bulk import CopyDataFile, get_copy_rows
+from app.db.engine import engines
+from app.db.generation import (
+    PublishRun,
+    get_staging_engine,
+    prepare_staging_schema,
+    rollback_db_generation,
+)
+from app.redis.load import RedisLoadStats
+from app.scheduler import ImportJob, check_job_dependencies, run_jobs
+from app.schemas.common import DataChangeSet, Region, RepoInfo
+from app.schemas.raw import MstEvent
+from app.tasks import get_data_version
 
 from .utils import test_gamedata
 
@@ -22,3 +60,378 @@ def test_append_use_to_item() -> None:
     assert feather.useSkill is False
     assert feather.useAscension is False
     assert feather.useCostume is True
+
+
+def test_changed_master_files(tmp_path: Path) -> None:
+    repo = Repo.init(tmp_path)
+    (tmp_path / "master").mkdir()
+    (tmp_path / "master" / "mstSvt.json").write_text("[]")
+    (tmp_path / "master" / "mstSkill.json").write_text("[]")
+    repo.index.add(["master/mstSvt.json", "master/mstSkill.json"])
+    first_commit = repo.index.commit("first")
+
+    (tmp_path / "master" / "mstSkill.json").write_text('[{"id": 1}]')
+    repo.index.add(["master/mstSkill.json"])
+    repo.index.commit("second")
+
+    changed_files = get_changed_files(tmp_path, first_commit.hexsha[:6])
+    assert changed_files == {"master/mstSkill.json"}
+    assert is_master_changed(changed_files, ["mstSkill", "mstFunc"])
+    assert not is_master_changed(changed_files, ["mstSvt"])
+    assert not is_script_changed(changed_files)
+
+    assert get_changed_files(tmp_path, "abcdef") is None
+    assert get_changed_files(test_gamedata, first_commit.hexsha[:6]) is None
+    assert is_master_changed(None, ["mstSvt"])
+
+
+def test_entity_changes(tmp_path: Path) -> None:
+    def write_master(master: dict[str, list[dict[str, Any]]]) -> str:
+        for name, rows in master.items():
+            (tmp_path / "master" / f"{name}.json").write_bytes(orjson.dumps(rows))
+        repo.index.add([f"master/{name}.json" for name in master])
+        commit_hash: str = repo.index.commit("update").hexsha[:6]
+        return commit_hash
+
+    repo = Repo.init(tmp_path)
+    (tmp_path / "master").mkdir()
+    first_hash = write_master(
+        {
+            "mstSvt": [{"id": 100100, "type": 1}, {"id": 9400010, "type": 6}],
+            "mstSvtSkill": [{"svtId": 100100, "skillId": 1}],
+            "mstSkillLv": [{"skillId": 1, "funcId": [10]}],
+            "mstFunc": [{"id": 10, "vals": [20]}, {"id": 11, "vals": []}],
+            "mstBuff": [{"id": 20, "name": "a"}],
+            "mstQuest": [{"id": 1000, "name": "a"}, {"id": 1001, "name": "b"}],
+        }
+    )
+    second_hash = write_master(
+        {
+            "mstSvt": [{"id": 100100, "type": 1}, {"id": 9400010, "type": 6, "a": 1}],
+            "mstBuff": [{"id": 20, "name": "b"}],
+            "mstQuest": [{"id": 1000, "name": "a"}, {"id": 1002, "name": "c"}],
+        }
+    )
+
+    assert get_entity_changes(tmp_path, first_hash) == {
+        "buff": [20],
+        "function": [10],
+        "skill": [1],
+        "quest": [1001, 1002],
+        "servant": [100100],
+        "equip": [9400010],
+    }
+    assert get_entity_changes(tmp_path, second_hash) == {}
+    assert get_entity_changes(tmp_path, "abcdef") is None
+
+    # The skill is removed from the servant in the same commit it changes
+    third_hash = write_master(
+        {
+            "mstSvtSkill": [],
+            "mstSkillLv": [{"skillId": 1, "funcId": [11]}],
+        }
+    )
+    assert get_entity_changes(tmp_path, second_hash) == {
+        "skill": [1],
+        "servant": [100100],
+    }
+    assert get_entity_changes(tmp_path, third_hash) == {}
+
+    first_version = RepoInfo(hash=first_hash, timestamp=1)
+    second_version = RepoInfo(hash=second_hash, timestamp=2)
+    assert get_change_set(tmp_path, second_version, second_version) is None
+    change_set = get_change_set(tmp_path, first_version, second_version)
+    assert change_set is not None and change_set.changes is not None
+    assert change_set.changes["quest"] == [1001, 1002]
+
+
+def test_changed_rows() -> None:
+    rows: list[dict[str, Any]] = [{"id": i, "vals": [i]} for i in range(10)]
+    assert get_changed_rows(rows, [*rows]) == []
+    changed_rows = [*rows[:3], {"id": 3, "vals": []}, *rows[4:], {"id": 10}]
+    assert get_changed_rows(rows, changed_rows) == [
+        {"id": 3, "vals": [3]},
+        {"id": 3, "vals": []},
+        {"id": 10},
+    ]
+    # Moved rows aren't changes
+    assert get_changed_rows(rows, rows[::-1]) == []
+    assert get_changed_rows([], rows[:1]) == rows[:1]
+    assert get_changed_rows(rows[:1], []) == rows[:1]
+
+
+def test_merge_change_sets() -> None:
+    versions = [RepoInfo(hash=str(i) * 6, timestamp=i) for i in range(4)]
+    change_sets = [
+        DataChangeSet(
+            previousVersion=versions[2],
+            version=versions[3],
+            changes={"servant": [100100], "skill": [1]},
+        ),
+        DataChangeSet(
+            previousVersion=versions[1],
+            version=versions[2],
+            changes={"servant": [100200, 100100]},
+        ),
+        DataChangeSet(
+            previousVersion=versions[0],
+            version=versions[1],
+            changes={"buff": [20]},
+        ),
+    ]
+    assert merge_change_sets(change_sets, "222222") == {
+        "servant": [100100],
+        "skill": [1],
+    }
+    assert merge_change_sets(change_sets, "111111") == {
+        "servant": [100100, 100200],
+        "skill": [1],
+    }
+    assert merge_change_sets(change_sets, "000000") == {
+        "servant": [100100, 100200],
+        "skill": [1],
+        "buff": [20],
+    }
+    assert merge_change_sets(change_sets, "999999") is None
+    assert merge_change_sets(change_sets, "111111", "333333") == {
+        "servant": [100100, 100200],
+        "skill": [1],
+    }
+    # The newest change set doesn't end at the current version
+    assert merge_change_sets(change_sets, "111111", "444444") is None
+    # The change set from 111111 to 222222 is missing
+    assert merge_change_sets(change_sets[::2], "222222") == {
+        "servant": [100100],
+        "skill": [1],
+    }
+    assert merge_change_sets(change_sets[::2], "000000") is None
+    # The changes from 111111 to 222222 are unknown
+    unknown_change_set = DataChangeSet(
+        previousVersion=versions[1], version=versions[2], changes=None
+    )
+    change_sets[1] = unknown_change_set
+    assert merge_change_sets(change_sets, "222222") == {
+        "servant": [100100],
+        "skill": [1],
+    }
+    assert merge_change_sets(change_sets, "111111") is None
+    assert merge_change_sets(change_sets, "000000") is None
+
+
+def test_data_version(tmp_path: Path) -> None:
+    repo = Repo.init(tmp_path)
+    (tmp_path / "master").mkdir()
+    (tmp_path / "master" / "mstSvt.json").write_text("[]")
+    repo.index.add(["master/mstSvt.json"])
+    commit = repo.index.commit("first")
+
+    data_version = get_data_version({Region.NA: tmp_path})
+    assert data_version is not None
+    assert data_version.endswith(f"NA:{commit.hexsha}")
+    assert get_data_version({Region.NA: tmp_path, Region.JP: test_gamedata}) is None
+
+
+def test_copy_rows_encoding() -> None:
+    table = Table(
+        "copyTest",
+        MetaData(),
+        Column("id", Integer),
+        Column("name", String),
+        Column("flag", Boolean),
+        Column("ids", ARRAY(Integer)),
+        Column("names", ARRAY(String)),
+        Column("script", JSONB),
+    )
+    data: list[dict[str, Any]] = [
+        {
+            "id": 1,
+            "name": "tab\tnew\nline \\ ♡",
+            "flag": True,
+            "ids": [1, 2, 3],
+            "names": ['quote"', "comma,brace}", ""],
+            "script": {"text": "a\nb"},
+        },
+        {"id": 2, "name": None, "flag": False, "ids": [], "names": [], "script": {}},
+    ]
+
+    rows = list(get_copy_rows(list(table.columns), data))
+    assert rows == [
+        "1\ttab\\tnew\\nline \\\\ ♡\tt\t{1,2,3}"
+        '\t{"quote\\\\"","comma,brace}",""}\t{"text":"a\\\\nb"}\n',
+        "2\t\\N\tf\t{}\t{}\t{}\n",
+    ]
+
+    copy_file = CopyDataFile(rows, batch_size=1)
+    chunks = []
+    while chunk := copy_file.read(7):
+        chunks.append(chunk)
+    assert b"".join(chunks) == "".join(rows).encode("utf-8")
+
+
+@pytest.mark.asyncio
+async def test_run_import_jobs() -> None:
+    finished: list[str] = []
+
+    def load_table(name: str) -> None:
+        finished.append(name)
+
+    async def publish() -> None:
+        assert {"table_a", "table_b"}.issubset(finished)
+        finished.append("publish")
+
+    jobs = [
+        ImportJob("publish", publish, ["table_a", "table_b"]),
+        ImportJob("table_a", lambda: load_table("table_a"), ["staging"]),
+        ImportJob("table_b", lambda: load_table("table_b"), ["staging"]),
+        ImportJob("staging", lambda: load_table("staging")),
+    ]
+    run_times = await run_jobs(jobs, 2)
+
+    assert finished[0] == "staging"
+    assert finished[-1] == "publish"
+    assert set(run_times) == {"staging", "table_a", "table_b", "publish"}
+
+
+def test_cli_stages() -> None:
+    args = get_parser().parse_args(["exports", "db", "db", "--region", "NA"])
+    assert get_stages(args.stages) == ["db", "exports"]
+    assert args.region == [Region.NA]
+    assert get_stages(get_parser().parse_args([]).stages) == DEFAULT_STAGES
+
+
+def test_check_job_dependencies() -> None:
+    with pytest.raises(ValueError):
+        check_job_dependencies([ImportJob("a", print, ["b"])])
+    with pytest.raises(ValueError):
+        check_job_dependencies(
+            [ImportJob("a", print, ["b"]), ImportJob("b", print, ["a"])]
+        )
+    with pytest.raises(ValueError):
+        check_job_dependencies([ImportJob("a", print), ImportJob("a", print)])
+
+
+def test_master_data_registry() -> None:
+    registry = MasterDataRegistry()
+    mstEvent_json = get_master_file_paths(test_gamedata, ["mstEvent"])[0]
+
+    registry.add_users([mstEvent_json])
+    assert registry.get_raw(mstEvent_json) is not registry.get_raw(mstEvent_json)
+
+    registry.add_users([mstEvent_json])
+    mstEvents = registry.get_models(mstEvent_json, MstEvent)
+    assert registry.get_models(mstEvent_json, MstEvent) is mstEvents
+    assert mstEvents[0].id == registry.get_raw(mstEvent_json)[0]["id"]
+
+    registry.release([mstEvent_json])
+    registry.release([mstEvent_json])
+    assert not registry.raw
+    assert not registry.models
+
+
+def test_master_data_registry_stream() -> None:
+    mstEvent_json = get_master_file_paths(test_gamedata, ["mstEvent"])[0]
+    mstEvents = read_master_json(mstEvent_json)
+
+    # Shared files bigger than stream_file_size are streamed by each loader
+    registry = MasterDataRegistry(stream_file_size=1)
+    registry.add_users([mstEvent_json, mstEvent_json])
+    batches = list(registry.iter_raw(mstEvent_json, 2))
+    assert [item for batch in batches for item in batch] == mstEvents
+    assert not registry.raw
+
+    # Or parsed once for all of them
+    registry = MasterDataRegistry(stream_file_size=0)
+    registry.add_users([mstEvent_json, mstEvent_json])
+    batches = list(registry.iter_raw(mstEvent_json, 2))
+    assert [item for batch in batches for item in batch] == mstEvents
+    assert batches[0][0] is registry.get_raw(mstEvent_json)[0]
+
+
+def test_iter_json_array() -> None:
+    data = [{"id": 1, "text": "a, ]}", "vals": [1, 2.5]}, 12345, "[", None, []]
+    json_text = " [ " + ", ".join(orjson.dumps(item).decode() for item in data) + " ]"
+    for read_size in (1, 3, 7, 1024):
+        assert list(iter_json_array(io.StringIO(json_text), read_size)) == data
+
+    # Numbers cut off at the end of a chunk
+    for read_size in (1, 2, 3, 4, 5, 1024):
+        assert list(iter_json_array(io.StringIO("[-2.5, 1]"), read_size)) == [-2.5, 1]
+        assert list(iter_json_array(io.StringIO("[1e10,2]"), read_size)) == [1e10, 2]
+
+    big_item = {"text": "a" * 10000}
+    big_json = io.StringIO(orjson.dumps([big_item, big_item]).decode())
+    assert list(iter_json_array(big_json, 16)) == [big_item, big_item]
+
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('[{"id": 1}'), 4))
+
+
+def test_iter_master_json() -> None:
+    mstEvent_json = get_master_file_paths(test_gamedata, ["mstEvent"])[0]
+    batches = list(iter_master_json(mstEvent_json, 1))
+    assert [item for batch in batches for item in batch] == read_master_json(
+        mstEvent_json
+    )
+    assert all(len(batch) == 1 for batch in batches)
+
+
+def test_redis_load_stats() -> None:
+    stats = RedisLoadStats()
+    stats.add_hset({1: b"abc", "2:1": "de"})
+    stats.add_hset({3: b"f"})
+    assert stats.fields == 3
+    assert stats.bytes == 11
+    assert stats.max_hset_fields == 2
+    assert stats.max_hset_bytes == 9
+
+
+def test_publish_run_rollback() -> None:
+    """The db and svt-extra stages of an import are rolled back together"""
+    engine = engines[Region.NA]
+    metadata = MetaData()
+    tables = [
+        Table(f"test_generation_{stage}", metadata, Column("value", Integer))
+        for stage in ("db", "svt_extra")
+    ]
+
+    def get_values() -> list[int]:
+        with engine.connect() as conn:
+            return [
+                conn.execute(select(table.c.value)).scalar_one() for table in tables
+            ]
+
+    def load_stage(
+        stage_tables: list[Table], value: int, publish_run: PublishRun
+    ) -> None:
+        prepare_staging_schema(engine)
+        with get_staging_engine(engine).begin() as conn:
+            for table in stage_tables:
+                table.create(conn)
+                conn.execute(table.insert().values(value=value))
+        publish_run.publish(engine)
+
+    with engine.begin() as conn:
+        for table in tables:
+            table.drop(conn, checkfirst=True)
+            table.create(conn)
+            conn.execute(table.insert().values(value=1))
+
+    try:
+        publish_run = PublishRun()
+        load_stage(tables[:1], 2, publish_run)
+        load_stage(tables[1:], 2, publish_run)
+        assert get_values() == [2, 2]
+
+        rollback_db_generation(engine)
+        assert get_values() == [1, 1]
+        rollback_db_generation(engine)
+        assert get_values() == [2, 2]
+
+        # The next import starts a new generation
+        load_stage(tables[1:], 3, PublishRun())
+        rollback_db_generation(engine)
+        assert get_values() == [2, 2]
+    finally:
+        with engine.begin() as conn:
+            for table in tables:
+                table.drop(conn, checkfirst=True)
@@ -0,0 +1,639 @@
+import asyncio
+import gzip
+import io
+import os
+from pathlib import Path
+
+import brotli
+import msgpack
+import orjson
+import pytest
+import zstandard
+from aioredis import Redis
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.config import SecretSettings, Settings
+from app.core.nice.func import get_depend_func_ids
+from app.core.utils import apply_overlay, overlay_language
+from app.data.custom_mappings import TRANSLATIONS
+from app.exports.compress import (
+    get_compressed_path,
+    get_compressors,
+    write_compressed_files,
+)
+from app.exports.delta import DELTA_FOLDER, prune_delta_folders
+from app.exports.index import RegionExport, get_entity_hash
+from app.exports.manifest import HASHED_FOLDER, MANIFEST_FILE, link_file, write_manifest
+from app.exports.render import dumps_with_section, get_model_data
+from app.exports.static import PrecompressedStaticFiles, parse_range, select_encoding
+from app.exports.writer import atomic_write, open_json_array
+from app.main import app
+from app.redis.helpers.repo_version import get_export_status, set_export_status
+from app.routers.deps import get_redis
+from app.scheduler import map_ordered
+from app.schemas.common import ExportState, ExportStatus, Language, Region, RepoInfo
+from app.schemas.raw import MstFunc, ServantEntity
+from app.tasks import fail_running_export, get_nice_svt
+from export.niceexport import (
+    CONSTANT_SALT_FILE,
+    export_constants,
+    get_constant_export_salt,
+)
+
+from .utils import get_response_data
+
+
+settings = Settings()
+secrets = SecretSettings()
+
+
+def get_jp_servant_entity() -> ServantEntity:
+    """Moriarty with JP names that have translations"""
+    raw_svt = ServantEntity.parse_obj(
+        get_response_data("test_data_raw", "NA_Moriarty_lore")
+    )
+    jp_names = (jp for jp, en in TRANSLATIONS.items() if jp != en)
+    raw_svt.mstSvt.name = next(jp_names)
+    for skill in raw_svt.mstSkill:
+        skill.mstSkill.name = next(jp_names)
+    for td in raw_svt.mstTreasureDevice:
+        td.mstTreasureDevice.name = td.mstTreasureDevice.ruby = next(jp_names)
+    for item in raw_svt.mstItem:
+        item.name = next(jp_names)
+    for voice in raw_svt.mstVoice:
+        voice.name = next(jp_names) + "1"
+    raw_svt.mstSvtLimitAdd[0].script["overWriteServantName"] = next(jp_names)
+    return raw_svt
+
+
+@pytest.mark.asyncio
+async def test_json_array_writer(tmp_path: Path) -> None:
+    items = [{"id": i, "name": f"svt {i}"} for i in range(100)]
+    out_path = tmp_path / "nice_servant.json"
+    async with open_json_array(out_path, buffer_size=64) as writer:
+        for item in items:
+            await writer.write(orjson.dumps(item))
+    assert orjson.loads(out_path.read_bytes()) == items
+
+    async with open_json_array(out_path):
+        pass
+    assert out_path.read_bytes() == b"[]"
+
+
+@pytest.mark.asyncio
+async def test_atomic_write_keeps_previous_file(tmp_path: Path) -> None:
+    out_path = tmp_path / "basic_servant.json"
+    out_path.write_bytes(b"[1]")
+
+    with pytest.raises(ValueError):
+        async with atomic_write(out_path) as fp:
+            await fp.write(b"[2,")
+            raise ValueError
+
+    assert out_path.read_bytes() == b"[1]"
+    assert list(tmp_path.iterdir()) == [out_path]
+
+
+async def write_region_export(
+    region_export: RegionExport, svts: list[tuple[int, str, bytes]], enums: bytes
+) -> None:
+    async with region_export.open_array("nice_servant") as writer:
+        for svt_id, svt_hash, svt_json in svts:
+            await writer.write(svt_json, (svt_id, svt_hash))
+    await region_export.write_object("nice_enums", enums)
+    region_export.swap()
+    await region_export.save_index()
+
+
+@pytest.mark.asyncio
+async def test_region_export_reuses_unchanged(tmp_path: Path) -> None:
+    svts = [(100100, "a", b'{"id":100100}'), (100200, "b", b'{"id":100200}')]
+    await write_region_export(RegionExport(tmp_path, "salt"), svts, b'{"a":1}')
+    servant_path = tmp_path / "nice_servant.json"
+    enums_path = tmp_path / "nice_enums.json"
+    assert orjson.loads(servant_path.read_bytes()) == [{"id": 100100}, {"id": 100200}]
+    servant_inode = servant_path.stat().st_ino
+    enums_inode = enums_path.stat().st_ino
+
+    region_export = RegionExport(tmp_path, "salt")
+    assert region_export.get_previous_entity("nice_servant", 100200, "b") == (
+        b'{"id":100200}'
+    )
+    assert region_export.get_previous_entity("nice_servant", 100200, "c") is None
+    assert region_export.get_previous_entities(["nice_servant"], 100100, "a") == {
+        "nice_servant": b'{"id":100100}'
+    }
+    await write_region_export(region_export, svts, b'{"a":2}')
+    assert region_export.unchanged_files == {"nice_servant.json"}
+    assert servant_path.stat().st_ino == servant_inode
+    assert enums_path.stat().st_ino != enums_inode
+    assert enums_path.read_bytes() == b'{"a":2}'
+
+    region_export = RegionExport(tmp_path, "new salt")
+    assert region_export.get_previous_entity("nice_servant", 100200, "b") is None
+    assert region_export.get_previous_sha256("nice_servant.json") is not None
+
+    servant_path.write_bytes(b"[]")
+    region_export = RegionExport(tmp_path, "salt")
+    assert region_export.get_previous_entity("nice_servant", 100200, "b") is None
+    assert region_export.get_previous_sha256("nice_enums.json") is not None
+
+    # The previous files are kept until the swap and when the export is discarded
+    for swap in (False, True):
+        region_export = RegionExport(tmp_path, "salt", precompress=True)
+        await region_export.write_object("nice_enums", b'{"a":3}')
+        assert enums_path.read_bytes() == b'{"a":2}'
+        assert not get_compressed_path(enums_path, "gzip").exists()
+        if swap:
+            assert region_export.swap() == 1 + len(get_compressors())
+            assert enums_path.read_bytes() == b'{"a":3}'
+            assert gzip.decompress(
+                get_compressed_path(enums_path, "gzip").read_bytes()
+            ) == (b'{"a":3}')
+        else:
+            region_export.discard()
+            assert enums_path.read_bytes() == b'{"a":2}'
+            assert not list(tmp_path.glob(".*.tmp"))
+
+
+EXPORT_SVTS = [
+    {"id": 100100, "name": "アルトリア", "atk": [1, 2.5], "extra": None},
+    {"id": 100200, "name": "Saber", "traits": {"1": True}},
+]
+EXPORT_TRAIT = {1: "genderMale", 2: "genderFemale"}
+
+
+async def write_export_files(tmp_path: Path, file_formats: list[str]) -> RegionExport:
+    region_export = RegionExport(tmp_path, "salt", file_formats=file_formats)
+    async with region_export.open_array("nice_servant") as writer:
+        for svt in EXPORT_SVTS:
+            await writer.write(orjson.dumps(svt))
+    await region_export.write_object(
+        "nice_trait", orjson.dumps(EXPORT_TRAIT, option=orjson.OPT_NON_STR_KEYS)
+    )
+    region_export.swap()
+    return region_export
+
+
+@pytest.mark.asyncio
+async def test_export_ndjson(tmp_path: Path) -> None:
+    region_export = await write_export_files(tmp_path, ["json", "ndjson"])
+
+    json_svts = orjson.loads((tmp_path / "nice_servant.json").read_bytes())
+    ndjson_svts = [
+        orjson.loads(line)
+        for line in (tmp_path / "nice_servant.ndjson").read_bytes().splitlines()
+    ]
+    assert json_svts == ndjson_svts == EXPORT_SVTS
+
+    json_trait = orjson.loads((tmp_path / "nice_trait.json").read_bytes())
+    assert orjson.loads((tmp_path / "nice_trait.ndjson").read_bytes()) == json_trait
+    assert set(region_export.index.files) == {
+        f"{export_name}.{extension}"
+        for export_name in ("nice_servant", "nice_trait")
+        for extension in ("json", "ndjson")
+    }
+
+
+@pytest.mark.asyncio
+async def test_export_msgpack(tmp_path: Path) -> None:
+    region_export = await write_export_files(tmp_path, ["json", "msgpack"])
+
+    msgpack_svts = list(
+        msgpack.Unpacker(io.BytesIO((tmp_path / "nice_servant.msgpack").read_bytes()))
+    )
+    assert msgpack_svts == EXPORT_SVTS
+
+    json_trait = orjson.loads((tmp_path / "nice_trait.json").read_bytes())
+    assert msgpack.unpackb((tmp_path / "nice_trait.msgpack").read_bytes()) == (
+        json_trait
+    )
+    assert set(region_export.index.files) == {
+        f"{export_name}.{extension}"
+        for export_name in ("nice_servant", "nice_trait")
+        for extension in ("json", "msgpack")
+    }
+
+
+def test_entity_hash() -> None:
+    raw_svt = get_jp_servant_entity()
+    svt_hash = get_entity_hash(raw_svt)
+    assert get_entity_hash(get_jp_servant_entity()) == svt_hash
+    raw_svt.mstSvtLimit[0].lvMax += 1
+    assert get_entity_hash(raw_svt) != svt_hash
+
+
+def test_entity_hash_depend_funcs() -> None:
+    raw_svt = get_jp_servant_entity()
+    assert get_depend_func_ids(raw_svt) == set()
+
+    svals = raw_svt.mstSkill[0].mstSkillLv[0].svals
+    svals[0] = svals[0][:-1] + ",DependFuncId1:[9999],DependFuncVals1:[0,5000]]"
+    assert get_depend_func_ids(raw_svt) == {9999}
+
+    depend_func = MstFunc.parse_obj(
+        get_response_data("test_data_raw", "NA_function_400")["mstFunc"]
+    )
+    svt_hash = get_entity_hash(raw_svt, depend_func)
+    assert get_entity_hash(raw_svt) != svt_hash
+    depend_func.funcType += 1
+    assert get_entity_hash(raw_svt, depend_func) != svt_hash
+
+
+@pytest.mark.asyncio
+async def test_map_ordered() -> None:
+    running = 0
+    max_running = 0
+
+    async def build(item: int) -> int:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep((10 - item % 10) / 1000)
+        running -= 1
+        return item * 2
+
+    results = [result async for result in map_ordered(build, range(50), 4)]
+
+    assert results == [item * 2 for item in range(50)]
+    assert max_running <= 4
+
+
+@pytest.mark.asyncio
+async def test_write_compressed_files(tmp_path: Path) -> None:
+    out_path = tmp_path / "nice_servant.json"
+    content = orjson.dumps([{"id": i, "name": f"svt {i}"} for i in range(1000)])
+    out_path.write_bytes(content)
+
+    encodings = await write_compressed_files(out_path)
+    assert encodings == list(get_compressors()) == ["br", "zstd", "gzip"]
+    gzip_path = get_compressed_path(out_path, "gzip")
+    assert gzip.decompress(gzip_path.read_bytes()) == content
+    brotli_path = get_compressed_path(out_path, "br")
+    assert brotli_path.name == "nice_servant.json.br"
+    assert brotli.decompress(brotli_path.read_bytes()) == content
+    zstd_path = get_compressed_path(out_path, "zstd")
+    assert zstd_path.name == "nice_servant.json.zst"
+    # Streamed frames don't have the content size in the header
+    zstd_decompressor = zstandard.ZstdDecompressor().decompressobj()
+    assert zstd_decompressor.decompress(zstd_path.read_bytes()) == content
+    for compressed_path in (gzip_path, brotli_path, zstd_path):
+        assert len(compressed_path.read_bytes()) < len(content)
+
+    gzip_mtime = gzip_path.stat().st_mtime_ns
+    assert await write_compressed_files(out_path) == []
+    assert gzip_path.stat().st_mtime_ns == gzip_mtime
+
+    os.utime(out_path, ns=(gzip_mtime + 10 ** 9, gzip_mtime + 10 ** 9))
+    assert await write_compressed_files(out_path) == encodings
+
+
+def test_link_file_copy(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    def link(src: Path, dst: Path) -> None:
+        raise OSError("hard links aren't supported")
+
+    monkeypatch.setattr(os, "link", link)
+    path = tmp_path / "nice_trait.json"
+    path.write_bytes(b"{}")
+    link_path = tmp_path / "nice_trait.0123.json"
+    link_file(path, link_path)
+    assert link_path.read_bytes() == b"{}"
+    assert sorted(tmp_path.iterdir()) == [link_path, path]
+
+
+@pytest.mark.asyncio
+async def test_write_manifest(tmp_path: Path) -> None:
+    versions = [RepoInfo(hash=f"abcde{i}", timestamp=1600000000 + i) for i in range(3)]
+    manifests = []
+    for i, data_version in enumerate(versions):
+        region_export = RegionExport(tmp_path, "salt", data_version=data_version)
+        await region_export.write_object("nice_enums", b'{"a":1}')
+        await region_export.write_object("nice_trait", b'{"b":%d}' % i)
+        region_export.swap()
+        manifests.append(await write_manifest(region_export, Region.NA, data_version))
+        await region_export.save_index()
+
+    manifest = orjson.loads((tmp_path / MANIFEST_FILE).read_bytes())
+    assert manifest["region"] == "NA"
+    assert manifest["dataVersion"] == versions[2].dict()
+    enums, trait = manifest["files"]
+    assert enums["name"] == "nice_enums.json"
+    assert enums["size"] == len(b'{"a":1}')
+    assert enums["dataVersion"] == versions[0].dict()
+    assert trait["dataVersion"] == versions[2].dict()
+    assert trait["url"].startswith(f"/export/NA/{HASHED_FOLDER}/nice_trait.")
+
+    hashed_folder = tmp_path / HASHED_FOLDER
+    assert (hashed_folder / Path(trait["url"]).name).read_bytes() == b'{"b":2}'
+    # The files of the previous manifest are kept, the older ones are deleted
+    assert sorted(path.name for path in hashed_folder.iterdir()) == sorted(
+        Path(file.url).name for file in [*manifests[1].files, manifests[2].files[1]]
+    )
+
+
+@pytest.mark.asyncio
+async def test_delta_files(tmp_path: Path) -> None:
+    old_version = RepoInfo(hash="aaaaaa", timestamp=1)
+    new_version = RepoInfo(hash="bbbbbb", timestamp=2)
+    svts = [
+        (100100, "a", b'{"id":100100}'),
+        (100200, "b", b'{"id":100200,"a":1}'),
+        (100300, "c", b'{"id":100300}'),
+    ]
+    await write_region_export(
+        RegionExport(tmp_path, "salt", data_version=old_version), svts, b"{}"
+    )
+    assert not (tmp_path / DELTA_FOLDER).exists()
+
+    svts = [
+        (100100, "a", b'{"id":100100}'),
+        (100200, "d", b'{"id":100200,"a":2}'),
+        (100400, "e", b'{"id":100400}'),
+    ]
+    region_export = RegionExport(tmp_path, "salt", data_version=new_version)
+    await write_region_export(region_export, svts, b"{}")
+    assert region_export.delta_files == {
+        "nice_servant.json": "delta/aaaaaa-bbbbbb/nice_servant.json"
+    }
+    delta = orjson.loads(
+        (tmp_path / "delta/aaaaaa-bbbbbb/nice_servant.json").read_bytes()
+    )
+    assert delta == {
+        "from": {"hash": "aaaaaa", "timestamp": 1},
+        "to": {"hash": "bbbbbb", "timestamp": 2},
+        "items": [{"id": 100200, "a": 2}, {"id": 100400}],
+        "added": [100400],
+        "changed": [100200],
+        "removed": [100300],
+    }
+
+    # No delta file if nothing changed
+    region_export = RegionExport(
+        tmp_path, "salt", data_version=RepoInfo(hash="cccccc", timestamp=3)
+    )
+    await write_region_export(region_export, svts, b"{}")
+    assert region_export.delta_files == {}
+    assert not list((tmp_path / DELTA_FOLDER / "bbbbbb-cccccc").iterdir())
+    assert prune_delta_folders(tmp_path, 1) == 1
+    assert [path.name for path in (tmp_path / DELTA_FOLDER).iterdir()] == [
+        "aaaaaa-bbbbbb"
+    ]
+
+
+def test_select_encoding() -> None:
+    encodings = ["br", "zstd", "gzip"]
+    assert select_encoding("gzip, deflate, br", encodings) == "br"
+    assert select_encoding("gzip, br;q=0.5", encodings) == "gzip"
+    assert select_encoding("br;q=0, gzip;q=0.1", encodings) == "gzip"
+    assert select_encoding("*", ["gzip"]) == "gzip"
+    assert select_encoding("gzip;q=0.5, identity", encodings) is None
+    assert select_encoding("", encodings) is None
+    assert select_encoding("deflate", encodings) is None
+
+
+def test_parse_range() -> None:
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=500-2000", 1000) == (500, 999)
+    assert parse_range("bytes=0-1,5-6", 1000) is None
+    assert parse_range("items=0-1", 1000) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=1000-", 1000)
+
+
+@pytest.mark.asyncio
+async def test_precompressed_static_files(tmp_path: Path) -> None:
+    out_path = tmp_path / "nice_servant.json"
+    content = orjson.dumps([{"id": i} for i in range(1000)])
+    out_path.write_bytes(content)
+    gzip_path = get_compressed_path(out_path, "gzip")
+    gzip_path.write_bytes(gzip.compress(content))
+    static_files = PrecompressedStaticFiles(directory=tmp_path)
+
+    async with AsyncClient(app=static_files, base_url="http://test") as client:
+        identity = await client.get(
+            "/nice_servant.json", headers={"Accept-Encoding": "identity"}
+        )
+        assert identity.status_code == 200
+        assert "content-encoding" not in identity.headers
+        assert identity.headers["vary"] == "Accept-Encoding"
+        assert identity.content == content
+
+        async with client.stream(
+            "GET", "/nice_servant.json", headers={"Accept-Encoding": "gzip, br"}
+        ) as response:
+            assert response.headers["content-encoding"] == "gzip"
+            assert b"".join([chunk async for chunk in response.aiter_raw()]) == (
+                gzip_path.read_bytes()
+            )
+        gzip_etag = response.headers["etag"]
+        assert gzip_etag != identity.headers["etag"]
+
+        not_modified = await client.get(
+            "/nice_servant.json",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": f'"x", {gzip_etag}'},
+        )
+        assert not_modified.status_code == 304
+        assert not_modified.headers["etag"] == gzip_etag
+
+        partial = await client.get(
+            "/nice_servant.json",
+            headers={"Accept-Encoding": "identity", "Range": "bytes=10-19"},
+        )
+        assert partial.status_code == 206
+        assert partial.headers["content-range"] == f"bytes 10-19/{len(content)}"
+        assert partial.content == content[10:20]
+
+        if_range = await client.get(
+            "/nice_servant.json",
+            headers={
+                "Accept-Encoding": "identity",
+                "Range": "bytes=10-19",
+                "If-Range": '"outdated"',
+            },
+        )
+        assert if_range.status_code == 200
+        assert if_range.content == content
+
+        unsatisfiable = await client.get(
+            "/nice_servant.json",
+            headers={"Accept-Encoding": "identity", "Range": "bytes=100000-"},
+        )
+        assert unsatisfiable.status_code == 416
+
+        os.utime(gzip_path, ns=(0, 0))
+        stale = await client.get(
+            "/nice_servant.json", headers={"Accept-Encoding": "gzip"}
+        )
+        assert "content-encoding" not in stale.headers
+        assert stale.content == content
+        assert "cache-control" not in stale.headers
+
+    hashed_folder = tmp_path / HASHED_FOLDER
+    hashed_folder.mkdir()
+    (hashed_folder / "nice_servant.0123456789abcdef.json").write_bytes(content)
+    (tmp_path / MANIFEST_FILE).write_bytes(b"{}")
+    async with AsyncClient(app=static_files, base_url="http://test") as client:
+        hashed = await client.get(
+            f"/{HASHED_FOLDER}/nice_servant.0123456789abcdef.json"
+        )
+        assert "immutable" in hashed.headers["cache-control"]
+        manifest = await client.get(f"/{MANIFEST_FILE}")
+        assert manifest.headers["cache-control"] == "no-cache"
+
+
+@pytest.mark.asyncio
+async def test_export_status() -> None:
+    redis = await Redis.from_url(secrets.redisdsn)
+    previous_status = await get_export_status(redis)
+    await redis.delete(f"{settings.redis_prefix}:export_status")
+    app.dependency_overrides[get_redis] = lambda: redis
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            response = await client.get("/info/export")
+            assert response.status_code == 404
+
+            export_status = ExportStatus(
+                state=ExportState.RUNNING,
+                dataVersion="abcdef",
+                regions=[Region.JP, Region.NA],
+                startedAt=1,
+            )
+            await set_export_status(redis, export_status)
+            response = await client.get("/info/export")
+            assert response.status_code == 200
+            assert response.json() == {
+                "state": "running",
+                "dataVersion": "abcdef",
+                "regions": ["JP", "NA"],
+                "startedAt": 1,
+                "finishedAt": None,
+                "error": None,
+            }
+
+            export_status.state = ExportState.FINISHED
+            export_status.finishedAt = 2
+            await set_export_status(redis, export_status)
+            response = await client.get("/info/export")
+            assert response.json()["state"] == "finished"
+            assert response.json()["finishedAt"] == 2
+
+            # Only a running export is marked as failed
+            await fail_running_export(redis, "Cancelled")
+            assert (await client.get("/info/export")).json()["state"] == "finished"
+            export_status.state = ExportState.RUNNING
+            await set_export_status(redis, export_status)
+            await fail_running_export(redis, "Cancelled")
+            response = await client.get("/info/export")
+            assert response.json()["state"] == "failed"
+            assert response.json()["error"] == "Cancelled"
+    finally:
+        del app.dependency_overrides[get_redis]
+        if previous_status is not None:
+            await set_export_status(redis, previous_status)
+        else:
+            await redis.delete(f"{settings.redis_prefix}:export_status")
+        await redis.close()
+
+
+@pytest.mark.asyncio
+async def test_export_constants(tmp_path: Path) -> None:
+    master_path = tmp_path / "gamedata"
+    (master_path / "master").mkdir(parents=True)
+    (tmp_path / "export" / "NA").mkdir(parents=True)
+    master = {
+        "mstConstant": [
+            {"name": "USER_ACT", "value": 20},
+            {"name": "USER_COST", "value": 10},
+            {"name": "FRIEND_NUM", "value": 5},
+        ],
+        "mstClass": [{"id": 1, "attackRate": 1000}],
+        "mstCard": [{"id": 1, "num": 1, "individuality": [4001]}],
+        "mstAttriRelation": [{"atkAttri": 1, "defAttri": 2, "attackRate": 1100}],
+        "mstClassRelation": [{"atkClass": 1, "defClass": 2, "attackRate": 2000}],
+        "mstBuff": [],
+        "mstSvtExceed": [],
+        "mstUserExp": [
+            {
+                "lv": 1,
+                "exp": 100,
+                "addActMax": 1,
+                "addCostMax": 2,
+                "addFriendMax": 0,
+                "giftId": 0,
+            }
+        ],
+        "mstGift": [],
+    }
+    for file_name, data in master.items():
+        (master_path / "master" / f"{file_name}.json").write_bytes(orjson.dumps(data))
+
+    def export_path(file_name: str) -> Path:
+        return tmp_path / "export" / "NA" / f"{file_name}.json"
+
+    region_path = {Region.NA: master_path}
+    run_times = await export_constants(region_path, tmp_path / "export", 2)
+    assert len(run_times) == 9
+    salt_file = tmp_path / "export" / "NA" / CONSTANT_SALT_FILE
+    assert salt_file.read_text(encoding="utf-8") == get_constant_export_salt()
+    assert orjson.loads(export_path("NiceClassRelation").read_bytes()) == {
+        "saber": {"archer": 2000}
+    }
+    assert orjson.loads(export_path("NiceUserLevel").read_bytes()) == {
+        "1": {
+            "requiredExp": 0,
+            "maxAp": 21,
+            "maxCost": 12,
+            "maxFriend": 5,
+            "gift": None,
+        }
+    }
+
+    assert await export_constants(region_path, tmp_path / "export", 2) == {}
+
+    future_ns = export_path("NiceUserLevel").stat().st_mtime_ns + 10 ** 9
+    os.utime(master_path / "master" / "mstClass.json", ns=(future_ns, future_ns))
+    os.utime(master_path / "master" / "mstConstant.json", ns=(future_ns, future_ns))
+    run_times = await export_constants(region_path, tmp_path / "export", 2)
+    assert set(run_times) == {
+        "NA:constant:NiceClassAttackRate",
+        "NA:constant:NiceConstant",
+        "NA:constant:NiceUserLevel",
+    }
+
+    # The files converted by another app version or code are converted again
+    salt_file.write_text("previous", encoding="utf-8")
+    run_times = await export_constants(region_path, tmp_path / "export", 2)
+    assert len(run_times) == 9
+    assert salt_file.read_text(encoding="utf-8") == get_constant_export_salt()
+
+
+@pytest.mark.asyncio
+async def test_svt_export_rendering(na_db_conn: AsyncConnection) -> None:
+    raw_svt = get_jp_servant_entity()
+
+    expected: list[bytes] = []
+    for lang in (Language.jp, Language.en):
+        nice_svt = await get_nice_svt(na_db_conn, Region.JP, lang, True, raw_svt)
+        expected += [
+            nice_svt.json(exclude_unset=True, exclude_none=True).encode(),
+            nice_svt.json(
+                exclude={"profile"}, exclude_unset=True, exclude_none=True
+            ).encode(),
+        ]
+    assert expected[0] != expected[2]
+
+    overlay_token = overlay_language.set(Language.en)
+    try:
+        nice_svt = await get_nice_svt(na_db_conn, Region.JP, Language.jp, True, raw_svt)
+    finally:
+        overlay_language.reset(overlay_token)
+    svt_data = get_model_data(nice_svt)
+    assert svt_data == nice_svt.dict(exclude_unset=True, exclude_none=True)
+
+    assert [
+        *dumps_with_section(nice_svt, svt_data, "profile"),
+        *dumps_with_section(nice_svt, apply_overlay(svt_data), "profile"),
+    ] == expected
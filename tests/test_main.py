@@ -50,6 +50,42 @@ class TestMain:
         assert len(response["NA"]["hash"]) == 6
         assert response["JP"]["timestamp"] > 1594450000
 
+    async def test_cache_stats(self, client: AsyncClient) -> None:
+        await client.get("/nice/NA/servant/100100")
+        await client.get("/nice/NA/servant/100100")
+        response = (await client.get("/info/cache")).json()
+        assert response["localSize"] > 0
+        assert response["namespaces"]["nice"]["localHits"] >= 1
+
+    async def test_etag(self, client: AsyncClient) -> None:
+        response = await client.get("/nice/NA/servant/100100")
+        assert "cache-control" not in response.headers
+        etag = response.headers["etag"]
+        not_modified = await client.get(
+            "/nice/NA/servant/100100", headers={"If-None-Match": etag}
+        )
+        assert not_modified.status_code == 304
+        assert not_modified.headers["etag"] == etag
+        assert not_modified.content == b""
+
+        quest = await client.get("/nice/NA/quest/94020187/1")
+        max_age = int(quest.headers["cache-control"].rsplit("=", 1)[1])
+        assert 0 < max_age <= settings.quest_cache_length
+        not_modified = await client.get(
+            "/nice/NA/quest/94020187/1",
+            headers={"If-None-Match": quest.headers["etag"]},
+        )
+        assert not_modified.status_code == 304
+
+    async def test_changes(self, client: AsyncClient) -> None:
+        na_hash = (await client.get("/info")).json()["NA"]["hash"]
+        response = await client.get("/changes/NA", params={"since": na_hash})
+        assert response.status_code == 200
+        assert response.json()["changes"] == {}
+
+        response = await client.get("/changes/NA", params={"since": "unknown"})
+        assert response.status_code == 404
+
     @pytest.mark.skipif(
         secrets.github_webhook_secret.get_secret_value() == "",
         reason="Secret path not set",